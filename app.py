@@ -1,13 +1,20 @@
-from flask import Flask, render_template, request, redirect, url_for,flash
+from flask import Flask, render_template, request, redirect, url_for,flash, stream_template, Response, abort
 from db import init_db, get_all_products, add_product, get_product, get_price_history, update_product, delete_product_db, get_product_comparison, get_all_comparison_groups, update_product_group
 from scraper import search_similar_products
-from tracker import run_price_check
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import io
+from tracker import run_leased_check, run_due_checks, run_maintenance, refresh_product_async, is_refreshing
+from tracker import default_worker_id
+from db import seconds_until_next_check, PriceWriter, count_products, get_dashboard_products, DASHBOARD_SORTS
+from stores import ADAPTERS
+from scheduler import SCHEDULER_POLL_SECONDS
+from charts import ChartRenderer, chart_version, history_version, version_of, lttb, to_epoch
+from db import on_prices_written, get_price_summary, history_resolution, HISTORY_MAX_POINTS
+from jobs import JobManager
+from pubsub import PriceBus
+from db import get_price_updates, get_product_by_url
+import hashlib
 import base64
-from datetime import datetime
+import json
+from datetime import datetime, timedelta, timezone
 import time
 import threading
 
@@ -16,18 +23,23 @@ price_check_running = False
 price_check_thread = None
 
 def background_price_checker():
-    """Background thread that periodically checks prices."""
+    """Background thread that checks products as their scheduled checks come due."""
     global price_check_running
     while price_check_running:
+        wait = SCHEDULER_POLL_SECONDS
         try:
-            print("Running automatic price check...")
-            run_price_check()
-            print("Automatic price check completed.")
+            summary = run_due_checks()
+            if summary["checked"]:
+                print(f"Automatic price check completed: {summary['checked']} products.")
+            run_maintenance()
+            # Sleep until the next product is due, polling at least every minute
+            due_in = seconds_until_next_check()
+            if due_in is not None:
+                wait = min(SCHEDULER_POLL_SECONDS, max(1, due_in))
         except Exception as e:
             print(f"Error in automatic price check: {e}")
-        
-        # Wait 10 minutes before next check
-        time.sleep(600)  # 10 minutes
+
+        time.sleep(wait)
 
 def start_background_price_checker():
     """Start the background price checking thread."""
@@ -53,97 +65,113 @@ init_db()  # ensure database exists
 # Start background price checker
 start_background_price_checker()
 
-# Simple cache for price history charts
-chart_cache = {}
-CACHE_TIMEOUT = 300  # 5 minutes
+# Products per dashboard page
+DASHBOARD_PAGE_SIZE = 50
+
+# Price check rounds and product additions run here, off the request path
+job_manager = JobManager()
 
 
-def create_price_history_chart(history, product_id):
-    if not history or len(history) < 2:
+def encode_cursor(after):
+    """Opaque ?after= value for a (sort value, product id) keyset position."""
+    if after is None:
         return None
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode()
 
-    # Check cache first
-    cache_key = f"chart_{product_id}"
-    current_time = time.time()
 
-    if cache_key in chart_cache:
-        cached_time, cached_chart = chart_cache[cache_key]
-        if current_time - cached_time < CACHE_TIMEOUT:
-            return cached_chart
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        value, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(product_id)
+    except (ValueError, TypeError):
+        return None
 
-    # Filter history to only include price changes
-    filtered_history = []
-    if history:
-        filtered_history.append(history[0])  # Always include first price
-        for row in history[1:]:
-            if row["price"] != filtered_history[-1]["price"]:
-                filtered_history.append(row)
+# Charts are rendered on a worker pool and served from their own URL; a new
+# price re-renders the product's chart in the background
+chart_renderer = ChartRenderer()
+on_prices_written(lambda rows: chart_renderer.prerender({row[0] for row in rows}))
 
-    if len(filtered_history) < 2:
-        # If no changes, show all history
-        filtered_history = history
+# Open pages get their products' new prices pushed over /api/prices/events
+price_bus = PriceBus()
+# Products one live-update stream can follow
+LIVE_MAX_PRODUCTS = 500
+# Seconds between keep-alive comments on idle event streams
+LIVE_KEEPALIVE_SECONDS = 15
 
-    dates = [datetime.fromisoformat(row["checked_at"]) for row in filtered_history]
-    prices = [row["price"] for row in filtered_history]
 
-    # Use a modern style
-    plt.style.use('seaborn-v0_8')
-    fig, ax = plt.subplots(figsize=(10, 5), facecolor='#f8f9fa')
-    
-    # Create gradient background
-    ax.set_facecolor('#ffffff')
-    
-    # Plot the line with better styling
-    line = ax.plot(dates, prices, 
-                   marker="o", 
-                   markersize=6, 
-                   linewidth=2.5,
-                   color='#2196F3',
-                   markerfacecolor='#1976D2',
-                   markeredgecolor='white',
-                   markeredgewidth=1.5,
-                   alpha=0.9)
-    
-    # Add grid
-    ax.grid(True, alpha=0.3, linestyle='--', linewidth=0.5)
-    
-    # Style the axes
-    ax.set_xlabel("Date & Time", fontsize=11, fontweight='medium', color='#424242')
-    ax.set_ylabel("Price (₹)", fontsize=11, fontweight='medium', color='#424242')
-    ax.set_title("Price History & Trends", fontsize=14, fontweight='bold', color='#1976D2', pad=20)
-    
-    # Format the x-axis dates
-    import matplotlib.dates as mdates
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %d\n%H:%M'))
-    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
-    
-    # Style tick labels
-    ax.tick_params(axis='both', which='major', labelsize=9, colors='#666666')
-    
-    # Add subtle border
-    for spine in ax.spines.values():
-        spine.set_edgecolor('#e0e0e0')
-        spine.set_linewidth(0.8)
-    
-    # Format price labels with currency
-    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'₹{x:,.0f}'))
-    
-    # Tight layout and save
-    plt.tight_layout()
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight", dpi=100, facecolor='#f8f9fa')
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.read()).decode("utf-8")
-    plt.close(fig)
+def live_prices_url(products):
+    """Live price stream of the products shown on a page, or None without products."""
+    if not products:
+        return None
+    return url_for("price_events", products=",".join(str(i) for i in sorted({p["id"] for p in products})))
 
-    # Cache the result
-    chart_cache[cache_key] = (current_time, img_base64)
 
-    return img_base64
+def publish_price_updates(rows):
+    """Publish the latest prices of the products in freshly written `rows`."""
+    if not price_bus.has_subscribers():
+        return
+    updates = []
+    for row in get_price_updates(sorted({row[0] for row in rows})):
+        update = dict(row)
+        update["formatted_checked_at"] = datetime.fromisoformat(row["checked_at"]).strftime('%b %d, %H:%M')
+        update["version"] = version_of(row["product_id"], row["checked_at"], row["price"])
+        updates.append(update)
+    price_bus.publish(updates)
+
+
+on_prices_written(publish_price_updates)
+
+# Seconds a chart request waits for a render before answering 503
+CHART_WAIT_SECONDS = 10
+
+# A product page older than this starts a background check of the product
+PAGE_REFRESH_SECONDS = 300
+
+# Points returned by the history API by default and at most
+HISTORY_API_POINTS = 500
+HISTORY_API_MAX_POINTS = 5000
+
+
+def utc_age_seconds(timestamp):
+    """Seconds since a UTC 'YYYY-MM-DD HH:MM:SS' timestamp."""
+    moment = datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - moment).total_seconds()
+
+
+def parse_time_arg(value):
+    """A ?start=/?end= value (Unix time or ISO date/time, UTC) as a DB timestamp, or None."""
+    if not value:
+        return None
+    try:
+        if value.replace(".", "", 1).isdigit():
+            moment = datetime.fromtimestamp(float(value), timezone.utc)
+        else:
+            moment = datetime.fromisoformat(value)
+    except (ValueError, OverflowError, OSError):
+        abort(400)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def set_version_cache_headers(response, etag, version):
+    """ETag, and a permanent cache for URLs pinned to the current `version` (?v=)."""
+    response.set_etag(etag)
+    if request.args.get("v") == version:
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
 
 
 def auto_compare_product(product_id, product_name, exclude_store):
-    """Automatically add similar products from other stores for comparison."""
+    """
+    Automatically add similar products from other stores for comparison.
+    Returns the number of products added.
+    """
+    added_count = 0
     try:
         # Check if current product already has a group_id
         from db import get_product
@@ -161,15 +189,11 @@ def auto_compare_product(product_id, product_name, exclude_store):
         from scraper import search_similar_products
         similar_products = search_similar_products(product_name, exclude_store=exclude_store)
         
-        added_count = 0
+        writer = PriceWriter()
         for sim_product in similar_products:
             try:
                 # Check if this product already exists (avoid duplicates)
-                from db import get_all_products
-                existing_products = get_all_products()
-                existing_urls = [p['url'] for p in existing_products]
-                
-                if sim_product['url'] in existing_urls:
+                if get_product_by_url(sim_product['url'], sim_product['store']):
                     print(f"Product from {sim_product['store']} already exists, skipping")
                     continue
                 
@@ -183,24 +207,115 @@ def auto_compare_product(product_id, product_name, exclude_store):
                 
                 # Try to add initial price if we have it
                 if sim_product.get('estimated_price'):
-                    add_price(new_product_id, sim_product['estimated_price'])
+                    writer.add_price(new_product_id, sim_product['estimated_price'])
                 
                 added_count += 1
                 print(f"Added similar product: {sim_product['name']} from {sim_product['store']}")
             except Exception as e:
                 print(f"Error adding similar product from {sim_product['store']}: {e}")
+        writer.flush()
         
         if added_count > 0:
             print(f"Auto-added {added_count} similar products for comparison")
             
     except Exception as e:
         print(f"Error in auto_compare_product: {e}")
+    return added_count
+
+
+def wants_json():
+    """Whether the client asked for JSON rather than an HTML page."""
+    return request.accept_mimetypes.best == "application/json"
+
+
+def job_response(job):
+    """202 with the job id for API clients, a redirect to the job page otherwise."""
+    if wants_json():
+        response = Response(json.dumps({
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": url_for("job_status_api", job_id=job.id),
+            "events_url": url_for("job_events", job_id=job.id),
+        }), status=202, mimetype="application/json")
+        response.headers["Location"] = url_for("job_status_api", job_id=job.id)
+        return response
+    return redirect(url_for("job_page", job_id=job.id))
+
+
+def price_check_job(job, products=None):
+    """
+    Check `products` (default: all), reporting each result to `job`.
+    Products a queue worker is checking right now are left to it.
+    """
+    if products is None:
+        products = get_all_products()
+    job.set_total(len(products))
+    summary = run_leased_check(products, f"{default_worker_id()}:job:{job.id}", job.advance)
+    if summary["skipped"]:
+        job.log(f"{summary['skipped']} products were already being checked by another worker.")
+        job.set_total(summary["checked"])
+    return {key: summary[key] for key in ("checked", "failed", "unchanged", "skipped")}
+
+
+def add_product_job(job, url, target_price):
+    """Scrape a new product, store it and add similar products from other stores."""
+    from scraper import get_product_details
+    from db import add_price
+    existing = get_product_by_url(url)
+    if existing:
+        raise ValueError(f"'{existing['name']}' is already tracked (product {existing['id']})")
+    job.set_total(3)
+    job.log(f"Fetching product details from {url}")
+    details = get_product_details(url)
+    job.advance()
+
+    product_id = add_product(details["name"], details["store"], url, target_price)
+    # Add the initial price to history
+    add_price(product_id, details["price"])
+    job.log(f"Added '{details['name']}' from {details['store']} at ₹{details['price']}")
+    job.advance()
+
+    job.log("Searching other stores for similar products")
+    # Automatically find and add similar products from other stores
+    similar_added = auto_compare_product(product_id, details["name"], details["store"])
+    job.log(f"Added {similar_added} similar products for comparison")
+    job.advance()
+    return {"product_id": product_id, "name": details["name"], "similar_added": similar_added}
 
 
 @app.route("/")
 def index():
-    products = get_all_products()
-    return render_template("index.html", products=products)
+    filters = {
+        "sort": request.args.get("sort", "recent"),
+        "store": request.args.get("store", ""),
+        "group": request.args.get("group", ""),
+        "q": request.args.get("q", "").strip(),
+        "below_target": request.args.get("below_target", ""),
+    }
+    if filters["sort"] not in DASHBOARD_SORTS:
+        filters["sort"] = "recent"
+
+    products, next_after = get_dashboard_products(
+        DASHBOARD_PAGE_SIZE,
+        after=decode_cursor(request.args.get("after")),
+        sort=filters["sort"],
+        store=filters["store"] or None,
+        group_id=filters["group"] or None,
+        query=filters["q"] or None,
+        below_target=bool(filters["below_target"]),
+    )
+    active_filters = {key: value for key, value in filters.items() if value}
+    # Streamed, so the first rows reach the browser while the rest render
+    return stream_template(
+        "index.html",
+        products=products,
+        total_products=count_products(),
+        filters=filters,
+        stores=list(ADAPTERS),
+        next_url=url_for("index", after=encode_cursor(next_after), **active_filters) if next_after else None,
+        first_url=url_for("index", **active_filters) if request.args.get("after") else None,
+        live_url=live_prices_url(products),
+    )
 
 
 @app.route("/add", methods=["GET", "POST"])
@@ -212,25 +327,16 @@ def add():
             return redirect(url_for("add"))
         
         try:
-            from scraper import get_product_details
-            details = get_product_details(url)
             target_price_str = request.form.get("target_price", "").strip()
             target_price = float(target_price_str) if target_price_str else None
-            
-            product_id = add_product(details["name"], details["store"], url, target_price)
-            # Add the initial price to history
-            from db import add_price
-            add_price(product_id, details["price"])
-            
-            # Automatically find and add similar products from other stores
-            auto_compare_product(product_id, details["name"], details["store"])
-            
-            flash(f"Product '{details['name']}' added successfully with automatic price comparison!", "success")
-            return redirect(url_for("index"))
-        except Exception as e:
-            flash(f"Error adding product: {str(e)}", "error")
+        except ValueError:
+            flash("Target price must be a number", "error")
             return redirect(url_for("add"))
 
+        job = job_manager.submit("add", f"Adding {url}", add_product_job, url, target_price,
+                                 key=f"add:{url}", return_url=url_for("add"))
+        return job_response(job)
+
     return render_template("add_product.html")
 
 
@@ -243,29 +349,23 @@ def product_detail(product_id):
     
     history = get_price_history(product_id)
     
-    # Check if we need to refresh the price (if last check was more than 5 minutes ago)
-    should_refresh = False
-    if history:
-        last_checked = datetime.fromisoformat(history[-1]["checked_at"])
-        time_since_last_check = datetime.now() - last_checked
-        if time_since_last_check.total_seconds() > 300:  # 5 minutes
-            should_refresh = True
-    else:
-        should_refresh = True
-    
-    if should_refresh:
-        try:
-            from scraper import get_price
-            latest_price = get_price(product['url'], product['store'])
-            # Store it in history
-            from db import add_price
-            add_price(product_id, latest_price)
-            # Refresh history
-            history = get_price_history(product_id)
-        except Exception as e:
-            print(f"Error fetching price for {product['name']}: {e}")
-    
-    chart_img = create_price_history_chart(history, product_id)
+    # Stale price (last check more than PAGE_REFRESH_SECONDS ago): render
+    # what is stored and check the product in the background; the page
+    # polls /api/products/<id>/status and reloads once the check is done.
+    # last_checked also covers checks that found the page unchanged.
+    last_checked_at = product["last_checked"] or (history[-1]["checked_at"] if history else None)
+    refreshing = is_refreshing(product_id)
+    if not refreshing and (last_checked_at is None or
+                           utc_age_seconds(last_checked_at) > PAGE_REFRESH_SECONDS):
+        refresh_product_async(product_id)
+        refreshing = True
+
+    # The chart is drawn in the browser from the history API; the PNG is
+    # the fallback without JavaScript
+    version = history_version(product_id)
+    has_chart = version is not None and len(history) >= 2
+    chart_url = url_for("product_chart", product_id=product_id, v=chart_version(product_id)) if has_chart else None
+    history_url = url_for("product_history_api", product_id=product_id, v=version) if has_chart else None
     
     # Get comparison products from the same group
     comparison_products = []
@@ -277,6 +377,7 @@ def product_detail(product_id):
     
     # Get latest price
     latest_price = None
+    best_price = None
     if history:
         latest_price = history[-1]["price"]  # Last price from history
         best_price = min((p['current_price'] for p in comparison_products if p['current_price']), default=None)
@@ -285,18 +386,195 @@ def product_detail(product_id):
         "product_detail.html",
       product=product,
         history=history,
-        chart_img=chart_img,
+        chart_url=chart_url,
+        history_url=history_url,
+        refreshing=refreshing,
+        version=version,
+        status_url=url_for("product_status_api", product_id=product_id),
         latest_price=latest_price,
         comparison_products=comparison_products,
-        best_price=best_price
+        best_price=best_price,
+        live_url=live_prices_url([product, *(comparison_products or [])]),
     )
 
 
+@app.route("/api/products/<int:product_id>/status")
+def product_status_api(product_id):
+    """Latest check of a product and whether a check is running, for polling pages."""
+    product = get_product(product_id)
+    if product is None:
+        abort(404)
+    summary = get_price_summary(product_id)
+    response = Response(json.dumps({
+        "product_id": product_id,
+        "refreshing": is_refreshing(product_id),
+        "last_checked": product["last_checked"],
+        "price": summary["price"] if summary else None,
+        "version": history_version(product_id),
+    }), mimetype="application/json")
+    response.cache_control.no_store = True
+    return response
+
+
+@app.route("/api/prices/events")
+def price_events():
+    """
+    Server-Sent Events stream of price updates for ?products=<id>,<id>,...
+    (default: all products): a 'price' event with the changed rows as they
+    are written, or 'reload' when the page fell too far behind.
+    """
+    try:
+        product_ids = [int(value) for value in request.args.get("products", "").split(",") if value]
+    except ValueError:
+        abort(400, "products must be a comma-separated list of ids")
+    if len(product_ids) > LIVE_MAX_PRODUCTS:
+        abort(400, f"at most {LIVE_MAX_PRODUCTS} products per stream")
+    subscription = price_bus.subscribe(product_ids)
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                message = subscription.get(timeout=LIVE_KEEPALIVE_SECONDS)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                event, data = message
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event == "reload":
+                    return
+        finally:
+            price_bus.unsubscribe(subscription)
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    # Don't let nginx buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/product/<int:product_id>/chart.png")
+def product_chart(product_id):
+    """
+    PNG chart of a product's price history. Versioned URLs (?v=, as linked
+    from the product page) never change and are cached for good.
+    """
+    version = chart_version(product_id)
+    if version is None:
+        abort(404)
+    if request.if_none_match.contains(version):
+        return Response(status=304, headers={"ETag": f'"{version}"'})
+    png = chart_renderer.get(product_id, version, timeout=CHART_WAIT_SECONDS)
+    if png is None:
+        abort(404 if len(get_price_history(product_id)) < 2 else 503)
+
+    return set_version_cache_headers(Response(png, mimetype="image/png"), version, version)
+
+
+@app.route("/api/products/<int:product_id>/history")
+def product_history_api(product_id):
+    """
+    Price history as compact columnar JSON for client-side charts:
+    {"t": [unix times], "p": [prices], "resolution": ...}.
+
+    ?start= / ?end= (Unix time or ISO, UTC) or ?days= (counted back from
+    the latest check) pick the range, ?points= the number of points; longer
+    series are downsampled with LTTB. Responses carry an ETag that changes
+    with every new price; ?v=<version> URLs are cached for good.
+    """
+    if get_product(product_id) is None:
+        abort(404)
+    try:
+        points = min(HISTORY_API_MAX_POINTS, max(3, int(request.args.get("points", HISTORY_API_POINTS))))
+        days = float(request.args["days"]) if request.args.get("days") else None
+    except ValueError:
+        abort(400)
+    start = parse_time_arg(request.args.get("start"))
+    end = parse_time_arg(request.args.get("end"))
+
+    summary = get_price_summary(product_id)
+    if days is not None and summary is not None:
+        start = (datetime.fromisoformat(summary["checked_at"]) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+    version = history_version(product_id) or "empty"
+    etag = hashlib.sha1(f"{version}:{start}:{end}:{points}".encode()).hexdigest()[:16]
+    if request.if_none_match.contains(etag):
+        return set_version_cache_headers(Response(status=304), etag, version)
+
+    max_points = max(points * 4, HISTORY_MAX_POINTS)
+    resolution = history_resolution(product_id, start, end, max_points)
+    history = get_price_history(product_id, start, end, max_points=max_points)
+    times, prices = lttb([to_epoch(row["checked_at"]) for row in history],
+                         [row["price"] for row in history], points)
+    payload = {"product_id": product_id, "version": version, "resolution": resolution,
+               "t": times, "p": prices}
+    response = Response(json.dumps(payload, separators=(",", ":")), mimetype="application/json")
+    return set_version_cache_headers(response, etag, version)
+
+
 @app.route("/run_check")
 def run_check():
-    run_price_check()
-    flash("Price check completed successfully!")
-    return redirect(url_for("index"))
+    """Start checking every product; while one round runs, returns that round's job."""
+    job = job_manager.submit("run_check", "Checking all products", price_check_job,
+                             key="run_check", return_url=url_for("index"))
+    return job_response(job)
+
+
+@app.route("/jobs/<job_id>")
+def job_page(job_id):
+    """Progress of a background job, streamed from /api/jobs/<id>/events."""
+    job = job_manager.get(job_id)
+    if job is None:
+        flash("That job has finished and is no longer available.", "error")
+        return redirect(url_for("index"))
+    product_url = None
+    if job.kind == "add" and job.result:
+        product_url = url_for("product_detail", product_id=job.result["product_id"])
+    return render_template("job.html", job=job, events=list(job.events), product_url=product_url)
+
+
+@app.route("/api/jobs/<job_id>")
+def job_status_api(job_id):
+    """State and progress of a background job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        abort(404)
+    response = Response(json.dumps(job.to_dict()), mimetype="application/json")
+    response.cache_control.no_store = True
+    return response
+
+
+@app.route("/api/jobs/<job_id>/events")
+def job_events(job_id):
+    """
+    Server-Sent Events stream of a job: 'progress', 'result' (one per
+    checked product), 'log' and a final 'done' with the job's state.
+    Resumes after Last-Event-ID (or ?after=) so reconnects miss nothing.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        abort(404)
+    after = request.headers.get("Last-Event-ID") or request.args.get("after") or 0
+    try:
+        after = max(0, int(after))
+    except ValueError:
+        after = 0
+
+    def stream():
+        # Tell EventSource to wait a bit longer before reconnecting
+        yield "retry: 3000\n\n"
+        for item in job.iter_events(after):
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            number, event, data = item
+            yield f"id: {number}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    # Don't let nginx buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 from flask import Flask, render_template, request, redirect, url_for, flash
 from db import (
@@ -317,7 +595,11 @@ def edit_product(product_id):
         else:
             target_price = None
 
-        update_product(product_id, name, store, url, target_price)
+        try:
+            update_product(product_id, name, store, url, target_price)
+        except ValueError as e:
+            flash(f"Error updating product: {e}", "error")
+            return redirect(url_for("edit_product", product_id=product_id))
         flash("Product updated successfully!")
         return redirect(url_for("index"))
 
@@ -357,7 +639,8 @@ def compare_group(group_id):
     return render_template("compare_detail.html", 
                          products=products, 
                          group_id=group_id,
-                         best_price=best_price)
+                         best_price=best_price,
+                         live_url=live_prices_url(products))
 
 
 @app.route("/add_to_group/<int:product_id>", methods=["POST"])
@@ -446,12 +729,17 @@ def auto_compare(product_id):
         for sim_product in similar_products:
             if sim_product['store'] == store:
                 try:
-                    # Add the similar product to database
-                    new_product_id = add_product(
-                        name=sim_product['name'],
-                        store=sim_product['store'], 
-                        url=sim_product['url']
-                    )
+                    # Reuse the product if it is already tracked
+                    existing = get_product_by_url(sim_product['url'], sim_product['store'])
+                    if existing:
+                        new_product_id = existing['id']
+                    else:
+                        # Add the similar product to database
+                        new_product_id = add_product(
+                            name=sim_product['name'],
+                            store=sim_product['store'], 
+                            url=sim_product['url']
+                        )
                     update_product_group(new_product_id, group_id)
                     added_count += 1
                 except Exception as e:
@@ -464,35 +752,16 @@ def auto_compare(product_id):
 
 @app.route("/run_check_group/<group_id>")
 def run_check_group(group_id):
-    """Run price check for all products in a comparison group."""
-    try:
-        products = get_product_comparison(group_id)
-        updated_count = 0
-        
-        for product in products:
-            try:
-                from scraper import get_price
-                from db import add_price
-                
-                print(f"Checking: {product['name']} [{product['store']}]")
-                current_price = get_price(product['url'], product['store'])
-                add_price(product['id'], current_price)
-                updated_count += 1
-                print(f"Updated price: ₹{current_price}")
-                
-                # Add delay
-                import time
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"Error updating {product['name']}: {e}")
-        
-        flash(f"Updated prices for {updated_count} products in comparison group.", "success")
-        
-    except Exception as e:
-        flash(f"Error running group price check: {e}", "error")
-    
-    return redirect(url_for("compare_group", group_id=group_id))
+    """Start a price check of all products in a comparison group."""
+    products = get_product_comparison(group_id)
+    if not products:
+        flash("No products found in this comparison group.", "error")
+        return redirect(url_for("compare"))
+    # Checked concurrently, prices written in one batch
+    job = job_manager.submit("run_check_group", f"Checking comparison group {group_id}",
+                             price_check_job, products, key=f"run_check_group:{group_id}",
+                             return_url=url_for("compare_group", group_id=group_id))
+    return job_response(job)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Database scale benchmark.
+
+Builds a synthetic database deterministically (same --seed, same data),
+then times the public functions of db.py against a copy of it and records
+the EXPLAIN QUERY PLAN of every statement they run. The JSON report can be
+diffed between versions; with --baseline, changed query plans and
+slowdowns beyond --threshold are listed and the exit status is 1.
+
+    python bench_db.py --products 5000 --history 500000
+    python bench_db.py --products 50000 --history 50000000 --db big.db --json after.json --baseline before.json
+
+The generated database is kept at --db and reused while its parameters
+(including PRICE_STORAGE) match. Functions that write (add_price, delete_product_db, ...) run
+last, on a throwaway copy.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import db
+
+STORES = ("amazon", "flipkart", "myntra")
+BASE_TIME = datetime(2024, 1, 1)
+HISTORY_STEP = timedelta(hours=1)
+INSERT_CHUNK = 50000
+
+
+def generator_params(args):
+    return {"products": args.products, "history": args.history, "seed": args.seed,
+            "storage": db.PRICE_STORAGE}
+
+
+def stored_params(path):
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT key, value FROM bench_meta").fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return {key: json.loads(value) for key, value in rows}
+
+
+def generate(path, products, history, seed):
+    """
+    Create a database with `products` products in comparison groups of 2-4
+    and `history` checks spread evenly over them (hourly, random-walk
+    prices), stored as db.PRICE_STORAGE says.
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    rng = random.Random(seed)
+
+    db.DB_NAME = path
+    db.init_db()
+    started = time.perf_counter()
+    with db.get_connection() as conn:
+        conn.execute("PRAGMA synchronous = OFF")
+        # latest_prices is rebuilt in one pass at the end instead
+        for trigger in ("price_history_latest_price", "price_intervals_latest_price_insert",
+                        "price_intervals_latest_price_update"):
+            conn.execute(f"DROP TRIGGER {trigger}")
+
+        rows = []
+        group = 0
+        remaining_in_group = 0
+        for i in range(products):
+            if remaining_in_group == 0:
+                group += 1
+                remaining_in_group = rng.randint(2, 4)
+            remaining_in_group -= 1
+            store = STORES[i % len(STORES)]
+            target = rng.choice([None, None, rng.randint(500, 50000)])
+            next_check = (BASE_TIME + timedelta(seconds=rng.randint(-3600, 86400))).strftime("%Y-%m-%d %H:%M:%S")
+            rows.append((f"Synthetic product {i}", store, f"https://www.{store}.example/p/{i}",
+                         target, f"g{group:06d}", next_check))
+        conn.executemany("""
+            INSERT INTO products (name, store, url, target_price, group_id, next_check_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+
+        per_product, extra = divmod(history, products)
+        batch = []
+        for product_id in range(1, products + 1):
+            count = per_product + (1 if product_id <= extra else 0)
+            price = float(rng.randint(500, 50000))
+            for n in range(count):
+                if rng.random() < 0.2:
+                    price = round(max(99.0, price * rng.uniform(0.9, 1.1)))
+                checked_at = BASE_TIME - HISTORY_STEP * (count - n)
+                batch.append((product_id, price, checked_at.strftime("%Y-%m-%d %H:%M:%S")))
+            if len(batch) >= INSERT_CHUNK:
+                conn.executemany("INSERT INTO price_history (product_id, price, checked_at) VALUES (?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO price_history (product_id, price, checked_at) VALUES (?, ?, ?)", batch)
+
+        conn.execute("CREATE TABLE bench_meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.executemany("INSERT INTO bench_meta VALUES (?, ?)", [
+            (key, json.dumps(value)) for key, value in
+            {"products": products, "history": history, "seed": seed, "storage": db.PRICE_STORAGE}.items()
+        ])
+        conn.commit()
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+    db.init_db()  # recreates the triggers
+    db.rebuild_latest_prices()
+    db.rebuild_price_rollups()
+    with db.get_connection() as conn:
+        # Rollups are built from every check first, so their counts are exact
+        if db.PRICE_STORAGE == "intervals":
+            db.compact_price_history()
+            conn.execute("VACUUM")
+        conn.execute("ANALYZE")
+        conn.commit()
+    db.close_connections()
+    return time.perf_counter() - started
+
+
+def normalize_sql(sql):
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    return " ".join(sql.split())
+
+
+class PlanRecorder:
+    """Collects the statements run on this thread's connection and their plans."""
+
+    def __init__(self):
+        self.statements = {}
+
+    def __enter__(self):
+        with db.get_connection() as conn:
+            conn.set_trace_callback(self.record)
+        return self
+
+    def __exit__(self, *exc):
+        with db.get_connection() as conn:
+            conn.set_trace_callback(None)
+
+    def record(self, sql):
+        keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            self.statements.setdefault(normalize_sql(sql), sql)
+
+    def plans(self):
+        plans = {}
+        with db.get_connection() as conn:
+            for key, sql in self.statements.items():
+                try:
+                    rows = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+                except sqlite3.Error as e:
+                    plans[key] = [f"error: {e}"]
+                    continue
+                depth = {0: -1}
+                lines = []
+                for node_id, parent, _, detail in rows:
+                    depth[node_id] = depth.get(parent, -1) + 1
+                    lines.append("  " * depth[node_id] + detail)
+                plans[key] = lines
+        return plans
+
+
+# A plan line reading a whole table (or its alias) without an index, and
+# the table references in a statement, to tell tables from aliases, CTEs,
+# subqueries and virtual tables
+SCAN_LINE = re.compile(r"^\s*SCAN (\w+)$")
+TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+
+
+def full_scans(sql, plan, tables):
+    """Tables of `tables` that `plan` (of `sql`) scans in full."""
+    names = {name: name for name in tables}
+    for table, alias in TABLE_REF.findall(sql):
+        if table in tables and alias:
+            names.setdefault(alias, table)
+    return [names[m.group(1)] for m in map(SCAN_LINE.match, plan) if m and m.group(1) in names]
+
+
+def time_calls(func, args_list):
+    """Call func once per argument tuple; the first call only records the query plans."""
+    timings = []
+    with PlanRecorder() as recorder:
+        func(*args_list[0])
+    for args in args_list[1:]:
+        started = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "calls": len(timings),
+        "best_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "plans": recorder.plans(),
+    }
+
+
+def write_batch(rows):
+    with db.PriceWriter(batch_size=len(rows) + 1) as writer:
+        for product_id, price in rows:
+            writer.add_price(product_id, price)
+
+
+def benchmarks(products, repeat, rng):
+    # One extra call per function for recording the plans; distinct ids so
+    # every delete_product_db call finds its product
+    calls = repeat + 1
+    ids = rng.sample(range(1, products + 1), calls)
+    groups = []
+    with db.get_connection() as conn:
+        for product_id in ids:
+            groups.append(conn.execute("SELECT group_id FROM products WHERE id = ?", (product_id,)).fetchone()[0])
+
+    last_day = (BASE_TIME - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    read = [
+        ("get_all_products", db.get_all_products, [()] * min(calls, 6)),
+        ("get_product", db.get_product, [(i,) for i in ids]),
+        ("get_price_history", db.get_price_history, [(i,) for i in ids]),
+        ("get_price_history[last day]", lambda i: db.get_price_history(i, start=last_day), [(i,) for i in ids]),
+        ("get_latest_price", db.get_latest_price, [(i,) for i in ids]),
+        ("get_price_summary", db.get_price_summary, [(i,) for i in ids]),
+        ("get_product_comparison", db.get_product_comparison, [(g,) for g in groups]),
+        ("get_all_comparison_groups", db.get_all_comparison_groups, [()] * min(calls, 6)),
+        ("count_products", db.count_products, [()] * calls),
+        ("get_dashboard_products", db.get_dashboard_products, [(50,)] * calls),
+        ("get_dashboard_products[drop]", lambda: db.get_dashboard_products(50, sort="drop"), [()] * calls),
+        ("get_due_products", db.get_due_products, [(50,)] * calls),
+        ("seconds_until_next_check", db.seconds_until_next_check, [()] * calls),
+        ("get_queue_stats", db.get_queue_stats, [()] * calls),
+    ]
+    write = [
+        ("add_price", db.add_price, [(i, 999.0) for i in ids]),
+        ("PriceWriter.flush[50]", write_batch,
+         [([(rng.randint(1, products), 999.0) for _ in range(50)],) for _ in range(min(calls, 6))]),
+        ("save_page_validators", db.save_page_validators, [(i, '"etag"', None, "hash", True) for i in ids]),
+        ("set_next_check", db.set_next_check, [(i, 3600, 3600) for i in ids]),
+        ("update_product_group", db.update_product_group, [(i, "bench") for i in ids]),
+        ("delete_product_db", db.delete_product_db, [(i,) for i in ids]),
+    ]
+    return read, write
+
+
+def compare(report, baseline, threshold):
+    problems = []
+    for name, result in report["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            continue
+        if old["median_ms"] > 0 and result["median_ms"] / old["median_ms"] > threshold:
+            problems.append(f"{name}: median {old['median_ms']} ms -> {result['median_ms']} ms")
+        for sql, plan in result["plans"].items():
+            if sql in old["plans"] and old["plans"][sql] != plan:
+                problems.append(f"{name}: query plan changed for {sql[:80]}...\n"
+                                f"    before: {old['plans'][sql]}\n    after:  {plan}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--history", type=int, default=500000, help="price checks")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_db.sqlite"),
+                        help="where the generated database is kept")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per function")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="median slowdown factor reported as a regression")
+    args = parser.parse_args()
+
+    params = generator_params(args)
+    if stored_params(args.db) != params:
+        print(f"Generating {args.products} products / {args.history} history rows in {args.db} ...")
+        print(f"  took {generate(args.db, args.products, args.history, args.seed):.1f}s")
+
+    # Every run works on a fresh copy, so writes don't leak into the next run
+    work_db = args.db + ".run"
+    shutil.copyfile(args.db, work_db)
+    db.DB_NAME = work_db
+    db.init_db()
+
+    rng = random.Random(args.seed)
+    read, write = benchmarks(args.products, args.repeat, rng)
+    report = {
+        "params": params,
+        "sqlite_version": sqlite3.sqlite_version,
+        "results": {},
+    }
+    with db.get_connection() as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    print(f"\n{'function':<28} {'calls':>6} {'best ms':>9} {'median ms':>10} {'max ms':>9}")
+    for name, func, calls in read + write:
+        result = time_calls(func, calls)
+        report["results"][name] = result
+        print(f"{name:<28} {result['calls']:>6} {result['best_ms']:>9} {result['median_ms']:>10} {result['max_ms']:>9}")
+        for sql, plan in result["plans"].items():
+            scanned = full_scans(sql, plan, tables)
+            if scanned:
+                print(f"    full scan of {', '.join(sorted(set(scanned)))}: {sql[:90]}")
+
+    db.close_connections()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(work_db + suffix):
+            os.remove(work_db + suffix)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\nWrote {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.threshold)
+        print(f"\nCompared with {args.baseline}: {len(problems)} regression(s)")
+        for problem in problems:
+            print(f"  {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Parser benchmark over the offline fixture corpus.
+
+For every installed parser engine, and for both full-page and targeted
+(streamed prefix) parsing, reports per page:
+  - parse + extract time (best and median of --repeat runs)
+  - peak Python heap during one parse (tracemalloc; memory allocated
+    inside C parsers such as lxml/lexbor is not visible to it)
+  - which price selector hit, or 'fallback' / 'error'
+
+    python bench_parsers.py
+    python bench_parsers.py --engines lxml selectolax --repeat 50 --json bench.json
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+from parsers import available_engines
+from scraper import STREAM_TAIL_CHARS, truncate_at_markers
+from stores import ScraperError, get_adapter
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_corpus(fixtures_dir):
+    with open(os.path.join(fixtures_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    for entry in manifest:
+        with open(os.path.join(fixtures_dir, entry["file"]), encoding="utf-8") as f:
+            entry["html"] = f.read()
+    return manifest
+
+
+def extract(adapter, entry, html, engine, targeted):
+    if entry["kind"] == "search":
+        return adapter.parse_search(html, engine)
+    return adapter.parse_product(html, engine, targeted=targeted)
+
+
+def selector_hit(adapter, entry, html, engine, targeted):
+    if entry["kind"] == "search":
+        return "search"
+    try:
+        extract(adapter, entry, html, engine, targeted)
+    except ScraperError:
+        return "error"
+    return adapter.price_selector_hit(adapter.parse(html, engine)) or "fallback"
+
+
+def bench_page(adapter, entry, html, engine, targeted, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            extract(adapter, entry, html, engine, targeted)
+        except ScraperError:
+            pass
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        extract(adapter, entry, html, engine, targeted)
+    except ScraperError:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "file": entry["file"],
+        "engine": engine,
+        "mode": "targeted" if targeted else "full",
+        "chars": len(html),
+        "best_ms": round(min(timings) * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "peak_kb": round(peak / 1024, 1),
+        "selector": selector_hit(adapter, entry, html, engine, targeted),
+    }
+
+
+def run(engines, repeat, fixtures_dir, tail):
+    results = []
+    for entry in load_corpus(fixtures_dir):
+        adapter = get_adapter(entry["store"])
+        configs = [(entry["html"], False)]
+        if entry["kind"] == "product":
+            prefix = truncate_at_markers(entry["html"], adapter.stream_markers, tail)
+            if prefix is not None:
+                configs.append((prefix, True))
+        for engine in engines:
+            for html, targeted in configs:
+                results.append(bench_page(adapter, entry, html, engine, targeted, repeat))
+    return results
+
+
+def print_table(results):
+    header = f"{'page':<38} {'engine':<12} {'mode':<9} {'chars':>8} {'best ms':>9} {'median ms':>10} {'peak KB':>9}  selector"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['file']:<38} {r['engine']:<12} {r['mode']:<9} {r['chars']:>8} {r['best_ms']:>9} "
+              f"{r['median_ms']:>10} {r['peak_kb']:>9}  {r['selector']}")
+
+    print("\nTotal median time per configuration:")
+    totals = {}
+    for r in results:
+        key = (r["engine"], r["mode"])
+        totals[key] = totals.get(key, 0) + r["median_ms"]
+    for (engine, mode), total in sorted(totals.items()):
+        print(f"  {engine:<12} {mode:<9} {total:>9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", help="engines to compare (default: all installed)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per page and configuration")
+    parser.add_argument("--tail", type=int, default=STREAM_TAIL_CHARS,
+                        help="characters kept after the stream markers in targeted mode")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="fixture directory")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    engines = args.engines or available_engines()
+    results = run(engines, args.repeat, args.fixtures, args.tail)
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"engines": engines, "repeat": args.repeat, "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark of the tracker against the stub storefront.
+
+Runs the full run_price_check -> fetch -> parse -> add_price pipeline for
+thousands of synthetic products served by stub_store.py, on a throwaway
+database, and reports per round:
+  - products per minute
+  - retries and HTTP error statuses seen by the scraper
+  - failed / unchanged products
+  - DB write rate (price checks stored per second)
+
+The stub is started in-process unless --stub-url points at a running one.
+Store rate limits are replaced by --rate (requests/sec per store, 0 = no
+limit) so the benchmark measures the pipeline rather than the politeness
+settings.
+
+    python bench_tracker.py --products 2000 --concurrency 16 --store-concurrency 6
+    python bench_tracker.py --latency 300 --error-429 0.02 --drift 0.3 --rounds 3
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+import db
+import scraper
+import tracker
+from ratelimit import HostRateLimiter
+from stub_store import start_stub_server, synthetic_products
+
+
+def setup_database(path, count):
+    db.DB_NAME = path
+    db.init_db()
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO products (name, store, url) VALUES (?, ?, ?)",
+            synthetic_products(count),
+        )
+        conn.commit()
+
+
+def count_history_rows():
+    with db.get_connection() as conn:
+        return conn.execute("""
+            SELECT (SELECT COUNT(*) FROM price_history)
+                 + (SELECT COALESCE(SUM(observations), 0) FROM price_intervals)
+        """).fetchone()[0]
+
+
+def run_round(args, store_limits):
+    fetch_before = scraper.get_fetch_stats()
+    rows_before = count_history_rows()
+
+    started = time.perf_counter()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        summary = tracker.run_price_check(max_workers=args.concurrency, store_limits=store_limits)
+    elapsed = time.perf_counter() - started
+
+    fetch_after = scraper.get_fetch_stats()
+    written = count_history_rows() - rows_before
+    http_errors = {
+        key: fetch_after[key] - fetch_before.get(key, 0)
+        for key in fetch_after if key.startswith("http_") and key != "http_304"
+    }
+    return {
+        "products": summary["checked"],
+        "seconds": round(elapsed, 2),
+        "products_per_min": round(summary["checked"] / elapsed * 60, 1),
+        "failed": summary["failed"],
+        "unchanged": summary["unchanged"],
+        "retries": fetch_after["retries"] - fetch_before["retries"],
+        "http_errors": {k: v for k, v in http_errors.items() if v},
+        "rows_written": written,
+        "db_writes_per_sec": round(written / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000, help="synthetic products to track")
+    parser.add_argument("--concurrency", type=int, default=tracker.MAX_CONCURRENT_CHECKS,
+                        help="total worker threads")
+    parser.add_argument("--store-concurrency", type=int, default=None,
+                        help="in-flight checks per store (default: tracker.STORE_CONCURRENCY)")
+    parser.add_argument("--rate", type=float, default=0, help="requests/sec per store, 0 = unlimited")
+    parser.add_argument("--rounds", type=int, default=1, help="price check rounds over the same products")
+    parser.add_argument("--latency", type=float, default=50, help="stub mean latency in ms")
+    parser.add_argument("--error-403", type=float, default=0.0)
+    parser.add_argument("--error-429", type=float, default=0.0)
+    parser.add_argument("--error-5xx", type=float, default=0.0)
+    parser.add_argument("--drift", type=float, default=0.0, help="chance per request that a price changes")
+    parser.add_argument("--stub-url", help="use an already running stub_store.py instead")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    if args.stub_url:
+        scraper.set_host_override(args.stub_url)
+    else:
+        server, _ = start_stub_server(latency=args.latency, error_403=args.error_403,
+                                      error_429=args.error_429, error_5xx=args.error_5xx,
+                                      drift=args.drift)
+        scraper.set_host_override(f"http://127.0.0.1:{server.server_port}")
+
+    stores = ("amazon", "flipkart", "myntra")
+    if args.rate:
+        limit = {"rate": args.rate, "burst": max(1, int(args.rate))}
+    else:
+        limit = {"rate": 1e9, "burst": 1000}
+    scraper.rate_limiter = HostRateLimiter(limits={s: limit for s in stores})
+    store_limits = {s: args.store_concurrency for s in stores} if args.store_concurrency else None
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_tracker_")
+    setup_database(os.path.join(tmpdir, "bench.db"), args.products)
+
+    print(f"{args.products} products, {args.concurrency} workers, "
+          f"store concurrency {args.store_concurrency or tracker.STORE_CONCURRENCY}, "
+          f"rate {args.rate or 'unlimited'}, stub {scraper.HOST_OVERRIDE}")
+    rounds = []
+    try:
+        for number in range(1, args.rounds + 1):
+            result = run_round(args, store_limits)
+            rounds.append(result)
+            print(f"\nRound {number}: {result['products']} products in {result['seconds']}s "
+                  f"({result['products_per_min']} products/min)")
+            print(f"  failed {result['failed']}, unchanged {result['unchanged']}, "
+                  f"retries {result['retries']}, http errors {result['http_errors'] or 'none'}")
+            print(f"  {result['rows_written']} price rows written ({result['db_writes_per_sec']} rows/s)")
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        if server:
+            server.shutdown()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "rounds": rounds}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Price history charts, rendered off the request path.
+
+Charts are drawn with matplotlib's object-oriented Figure API (no pyplot
+global state) on a small thread pool, and cached as PNG files keyed by
+the product id and its last price change, so a chart stays valid until
+the price changes and checks that find the same price don't re-render it:
+
+  - in memory: an LRU of the CHART_MEMORY_CACHE_SIZE most recent charts
+  - on disk:   CHART_CACHE_DIR/<product id>/<version>.png, replaced when
+               the product's price changes
+
+The web app serves them from /product/<id>/chart.png?v=<version> and
+calls ChartRenderer.prerender when prices are written. The product page
+itself draws its chart in the browser from /api/products/<id>/history,
+downsampled with lttb().
+"""
+import calendar
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+
+from db import get_price_change, get_price_history, get_price_summary
+
+CHART_CACHE_DIR = os.environ.get("CHART_CACHE_DIR", os.path.join("data", "charts"))
+CHART_MEMORY_CACHE_SIZE = 128
+CHART_WORKERS = 2
+# Pre-renders are skipped while this many renders are queued, e.g. during
+# a full price check round
+CHART_QUEUE_LIMIT = 100
+
+
+def render_price_chart(history):
+    """PNG bytes of a price history chart, or None for fewer than 2 rows."""
+    if not history or len(history) < 2:
+        return None
+
+    # Filter history to only include price changes
+    filtered_history = [history[0]]  # Always include first price
+    for row in history[1:]:
+        if row["price"] != filtered_history[-1]["price"]:
+            filtered_history.append(row)
+
+    if len(filtered_history) < 2:
+        # If no changes, show all history
+        filtered_history = history
+
+    dates = [datetime.fromisoformat(row["checked_at"]) for row in filtered_history]
+    prices = [row["price"] for row in filtered_history]
+
+    fig = Figure(figsize=(10, 5), facecolor='#f8f9fa', layout='tight')
+    ax = fig.add_subplot()
+    ax.set_facecolor('#ffffff')
+
+    ax.plot(dates, prices,
+            marker="o",
+            markersize=6,
+            linewidth=2.5,
+            color='#2196F3',
+            markerfacecolor='#1976D2',
+            markeredgecolor='white',
+            markeredgewidth=1.5,
+            alpha=0.9)
+
+    ax.grid(True, alpha=0.3, linestyle='--', linewidth=0.5)
+
+    ax.set_xlabel("Date & Time", fontsize=11, fontweight='medium', color='#424242')
+    ax.set_ylabel("Price (₹)", fontsize=11, fontweight='medium', color='#424242')
+    ax.set_title("Price History & Trends", fontsize=14, fontweight='bold', color='#1976D2', pad=20)
+
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %d\n%H:%M'))
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+    ax.tick_params(axis='both', which='major', labelsize=9, colors='#666666')
+
+    for spine in ax.spines.values():
+        spine.set_edgecolor('#e0e0e0')
+        spine.set_linewidth(0.8)
+
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'₹{x:,.0f}'))
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=100, facecolor='#f8f9fa')
+    return buf.getvalue()
+
+
+def lttb(times, values, threshold):
+    """
+    Downsample a series to `threshold` points with Largest-Triangle-Three-
+    Buckets, which keeps the points that shape the line (peaks, drops).
+    `times` must be ascending. Returns (times, values).
+    """
+    count = len(times)
+    if threshold >= count or threshold < 3:
+        return list(times), list(values)
+
+    sampled = [0]
+    bucket_size = (count - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        # Average of the next bucket (the last point for the last bucket)
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, count)
+        if next_start >= next_end:
+            next_start, next_end = count - 1, count
+        span = next_end - next_start
+        avg_time = sum(times[next_start:next_end]) / span
+        avg_value = sum(values[next_start:next_end]) / span
+
+        px, py = times[previous], values[previous]
+        best, best_area = start, -1
+        for i in range(start, end):
+            area = abs((px - avg_time) * (values[i] - py) - (px - times[i]) * (avg_value - py))
+            if area > best_area:
+                best, best_area = i, area
+        sampled.append(best)
+        previous = best
+    sampled.append(count - 1)
+    return [times[i] for i in sampled], [values[i] for i in sampled]
+
+
+def to_epoch(timestamp):
+    """Unix time of a UTC 'YYYY-MM-DD HH:MM:SS' timestamp."""
+    return calendar.timegm(datetime.fromisoformat(timestamp).timetuple())
+
+
+def chart_version(product_id):
+    """
+    Cache key of a product's current chart: changes when its price
+    changes. Versions start with the Unix time of the change, so a later
+    version sorts after an earlier one (see version_time). None if the
+    product has no price yet.
+    """
+    change = get_price_change(product_id)
+    if change is None:
+        return None
+    changed = f"{product_id}:{change['changed_at']}:{change['price']}"
+    return f"{to_epoch(change['changed_at'])}-{hashlib.sha1(changed.encode()).hexdigest()[:8]}"
+
+
+def version_time(version):
+    """
+    Unix time of the price change a chart_version() belongs to; 0 for
+    versions from before they carried it.
+    """
+    head, dash, _ = version.partition("-")
+    return int(head) if dash and head.isdigit() else 0
+
+
+def history_version(product_id):
+    """
+    Cache key of a product's price history: changes whenever a price is
+    recorded. None if the product has no price yet.
+    """
+    summary = get_price_summary(product_id)
+    if summary is None:
+        return None
+    return version_of(product_id, summary["checked_at"], summary["price"])
+
+
+def version_of(product_id, checked_at, price):
+    """history_version() of a product whose latest check is (checked_at, price)."""
+    latest = f"{product_id}:{checked_at}:{price}"
+    return hashlib.sha1(latest.encode()).hexdigest()[:16]
+
+
+class ChartRenderer:
+    """
+    Renders charts on a thread pool and caches them in memory and on disk.
+    Concurrent requests for the same chart share one render.
+    """
+
+    def __init__(self, cache_dir=CHART_CACHE_DIR, memory_size=CHART_MEMORY_CACHE_SIZE,
+                 workers=CHART_WORKERS, queue_limit=CHART_QUEUE_LIMIT):
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self.queue_limit = queue_limit
+        self.memory = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chart")
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "renders": 0, "skipped": 0}
+
+    def get(self, product_id, version=None, timeout=None):
+        """
+        PNG bytes of the product's chart at `version` (default: current),
+        rendering it if needed and waiting at most `timeout` seconds.
+        Returns None if there is nothing to draw or the render isn't done.
+        """
+        version = version or chart_version(product_id)
+        if version is None:
+            return None
+        png = self._cached(product_id, version)
+        if png is not None:
+            return png
+        future = self._submit(product_id, version)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            return None
+
+    def prerender(self, product_ids):
+        """Render the current charts of `product_ids` in the background."""
+        for product_id in product_ids:
+            with self.lock:
+                if len(self.pending) >= self.queue_limit:
+                    self.stats["skipped"] += 1
+                    continue
+            version = chart_version(product_id)
+            if version is not None and self._cached(product_id, version) is None:
+                self._submit(product_id, version)
+
+    def _cached(self, product_id, version):
+        key = (product_id, version)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self.memory[key]
+        try:
+            with open(self._path(product_id, version), "rb") as f:
+                png = f.read()
+        except FileNotFoundError:
+            return None
+        self.stats["disk_hits"] += 1
+        self._remember(key, png)
+        return png
+
+    def _submit(self, product_id, version):
+        key = (product_id, version)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pending[key] = self.executor.submit(self._render, product_id, version)
+            return future
+
+    def _render(self, product_id, version):
+        key = (product_id, version)
+        try:
+            # The history read must belong to `version`: a price change in
+            # between would cache the newer chart under the older version
+            current = chart_version(product_id) == version
+            png = render_price_chart(get_price_history(product_id))
+            current = current and chart_version(product_id) == version
+            self.stats["renders"] += 1
+            if png is not None and current:
+                self._remember(key, png)
+                self._store(product_id, version, png)
+            return png
+        except Exception as e:
+            print(f"Error rendering chart of product {product_id}: {e}")
+            return None
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def _remember(self, key, png):
+        with self.lock:
+            self.memory[key] = png
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def _path(self, product_id, version):
+        return os.path.join(self.cache_dir, str(product_id), f"{version}.png")
+
+    def _store(self, product_id, version, png):
+        path = self._path(product_id, version)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(png)
+        os.replace(tmp, path)
+        # Older versions of this product's chart are stale now; a newer one
+        # written by a render that finished first stays
+        for name in os.listdir(directory):
+            if name.endswith(".png") and version_time(name[:-4]) < version_time(version):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
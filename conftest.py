@@ -0,0 +1,15 @@
+"""Shared pytest fixtures and markers."""
+import pytest
+
+import db
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "network: needs access to the live stores")
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """A fresh database in a temporary directory."""
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "test.db"))
+    db.init_db()
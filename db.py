@@ -1,18 +1,129 @@
+import json
+import os
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from contextlib import contextmanager
 
+from stores import canonical_url_key
+
 DB_NAME = "price_tracker.db"
 
+# PriceWriter flushes once this many price rows are buffered, or once the
+# oldest buffered row is this many seconds old
+PRICE_BATCH_SIZE = 50
+PRICE_FLUSH_SECONDS = 5
+
+# How checked prices are stored:
+#   "intervals" - one price_intervals row per run of equal prices; a check
+#                 that finds the same price only extends its last_seen
+#   "raw"       - one price_history row per check
+# Reads (get_price_history, ...) cover both tables, so the mode can be
+# switched at any time; `python db.py compact-history` folds raw rows
+# into intervals.
+PRICE_STORAGE = os.environ.get("PRICE_STORAGE", "intervals")
+
+# Rows per transaction when compacting price_history
+COMPACT_BATCH_SIZE = 5000
+
+# Open/high/low/close rollup tables, the strftime format of their buckets
+# and the length of a bucket. They summarize the stored checks
+# (price_points) and are brought up to date whenever checks are stored.
+PRICE_ROLLUPS = {
+    "hour": ("price_rollups_hourly", "%Y-%m-%d %H:00:00", "+1 hour"),
+    "day": ("price_rollups_daily", "%Y-%m-%d 00:00:00", "+1 day"),
+}
+
+# get_price_history returns stored checks while the requested range has at
+# most this many; longer ranges are read from the hourly, then the daily
+# rollups.
+HISTORY_MAX_POINTS = 1000
+
+# Retention (see apply_retention): days to keep price_history rows before
+# they are folded into price_intervals, and days to keep the hourly and
+# daily rollups. None keeps them forever; intervals (the price changes)
+# are always kept. Hourly rollups grow with every hour a product is
+# checked, so they are trimmed; older ranges are read from the daily ones.
+RETENTION_POLICY = {
+    "raw_days": 30,
+    "hour_rollup_days": 90,
+    "day_rollup_days": None,
+}
+# Rows per transaction and transactions per table in one retention run, so
+# the write lock is only ever held briefly
+RETENTION_BATCH_SIZE = 1000
+RETENTION_MAX_BATCHES = 50
+# Free pages returned to the file system after each batch
+VACUUM_PAGES = 1000
+
+
+# Connection settings.
+# WAL lets the web app read while the checker writes; synchronous=NORMAL is
+# durable across application crashes in WAL mode and avoids an fsync per
+# commit. Negative cache_size is in KiB. auto_vacuum only takes effect on a
+# new database (or after VACUUM, see enable_incremental_vacuum), before any
+# table exists, so it comes first.
+BUSY_TIMEOUT = 5000  # ms
+STATEMENT_CACHE_SIZE = 256
+SQLITE_PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "mmap_size": 128 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": BUSY_TIMEOUT,
+}
+
+# Percentage drop of latest_prices.price since the previous check (0 for
+# a single check). Never NULL, so keyset pages over its index stay range seeks.
+DROP_PCT_EXPRESSION = (
+    "CASE WHEN previous_price > 0 "
+    "THEN ROUND((previous_price - price) * 100.0 / previous_price, 2) ELSE 0 END"
+)
+
+# One connection per thread and database file, reused across calls
+_local = threading.local()
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=BUSY_TIMEOUT / 1000,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    for pragma, value in SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    return conn
+
 
 @contextmanager
 def get_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    """
+    Yield this thread's pooled connection to DB_NAME, opening it on first
+    use. Callers commit their own writes; a transaction still open when
+    the outermost `with` block exits (e.g. after an error) is rolled back.
+    """
+    if not hasattr(_local, "connections"):
+        _local.connections = {}
+        _local.depth = 0
+    conn = _local.connections.get(DB_NAME)
+    if conn is None:
+        conn = _local.connections[DB_NAME] = _connect(DB_NAME)
+
+    _local.depth += 1
     try:
         yield conn
     finally:
+        _local.depth -= 1
+        if _local.depth == 0 and conn.in_transaction:
+            conn.rollback()
+
+
+def close_connections():
+    """Close this thread's pooled connections."""
+    for conn in getattr(_local, "connections", {}).values():
         conn.close()
+    _local.connections = {}
 
 
 def init_db():
@@ -32,7 +143,13 @@ def init_db():
                 created_at TEXT NOT NULL DEFAULT (datetime('now')),
                 updated_at TEXT NOT NULL DEFAULT (datetime('now')),
                 last_checked TEXT,
-                group_id TEXT
+                group_id TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                next_check_at TEXT,
+                check_interval INTEGER,
+                url_key TEXT
             );
         """)
 
@@ -48,16 +165,159 @@ def init_db():
             );
         """)
 
+        # Runs of an unchanged price: first and last check that saw it and
+        # the number of checks in between
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS price_intervals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id INTEGER NOT NULL,
+                price REAL NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                observations INTEGER NOT NULL DEFAULT 1,
+                FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+                UNIQUE(product_id, first_seen)
+            );
+        """)
+
+        # Every recorded check as (product_id, price, checked_at), whichever
+        # table it is stored in. An interval contributes its first and, if
+        # it was seen more than once, its last check.
+        cur.execute("""
+            CREATE VIEW IF NOT EXISTS price_points AS
+                SELECT product_id, price, checked_at FROM price_history
+                UNION ALL
+                SELECT product_id, price, first_seen FROM price_intervals
+                UNION ALL
+                SELECT product_id, price, last_seen FROM price_intervals WHERE last_seen > first_seen
+        """)
+
+        for table, _, _ in PRICE_ROLLUPS.values():
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    product_id INTEGER NOT NULL,
+                    bucket TEXT NOT NULL,
+                    open REAL NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    first_at TEXT NOT NULL,
+                    last_at TEXT NOT NULL,
+                    PRIMARY KEY (product_id, bucket),
+                    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+                ) WITHOUT ROWID;
+            """)
+
+        # Last run of periodic maintenance tasks (see claim_maintenance)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS maintenance_runs (
+                name TEXT PRIMARY KEY,
+                last_run_at REAL NOT NULL
+            );
+        """)
+
+        # Work queue shared by all tracker workers: one row per product
+        # waiting to be checked or leased by a worker
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS check_jobs (
+                product_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'leased')),
+                worker_id TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at TEXT NOT NULL DEFAULT (datetime('now')),
+                FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+            );
+        """)
+
+        # Latest, previous, lowest and highest price of every product, kept
+        # up to date by triggers on price_history/price_intervals so comparison and
+        # dashboard queries don't have to scan the history
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS latest_prices (
+                product_id INTEGER PRIMARY KEY,
+                price REAL NOT NULL,
+                checked_at TEXT NOT NULL,
+                previous_price REAL,
+                previous_checked_at TEXT,
+                min_price REAL NOT NULL,
+                max_price REAL NOT NULL,
+                drop_pct REAL GENERATED ALWAYS AS ({DROP_PCT_EXPRESSION}) VIRTUAL,
+                FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+            );
+        """)
+        cur.execute("""
+            CREATE TRIGGER IF NOT EXISTS price_history_latest_price
+            AFTER INSERT ON price_history
+            BEGIN
+                INSERT INTO latest_prices (product_id, price, checked_at, min_price, max_price)
+                VALUES (NEW.product_id, NEW.price, NEW.checked_at, NEW.price, NEW.price)
+                ON CONFLICT (product_id) DO UPDATE SET
+                    previous_price = CASE WHEN excluded.checked_at > latest_prices.checked_at
+                                          THEN latest_prices.price ELSE latest_prices.previous_price END,
+                    previous_checked_at = CASE WHEN excluded.checked_at > latest_prices.checked_at
+                                               THEN latest_prices.checked_at ELSE latest_prices.previous_checked_at END,
+                    price = CASE WHEN excluded.checked_at > latest_prices.checked_at
+                                 THEN excluded.price ELSE latest_prices.price END,
+                    checked_at = MAX(latest_prices.checked_at, excluded.checked_at),
+                    min_price = MIN(latest_prices.min_price, excluded.price),
+                    max_price = MAX(latest_prices.max_price, excluded.price);
+            END;
+        """)
+        # Same for price_intervals: a new interval and an extended one are
+        # both a check at last_seen
+        for event in ("INSERT", "UPDATE OF last_seen"):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS price_intervals_latest_price_{event.split()[0].lower()}
+                AFTER {event} ON price_intervals
+                BEGIN
+                    INSERT INTO latest_prices (product_id, price, checked_at, min_price, max_price)
+                    VALUES (NEW.product_id, NEW.price, NEW.last_seen, NEW.price, NEW.price)
+                    ON CONFLICT (product_id) DO UPDATE SET
+                        previous_price = CASE WHEN excluded.checked_at > latest_prices.checked_at
+                                              THEN latest_prices.price ELSE latest_prices.previous_price END,
+                        previous_checked_at = CASE WHEN excluded.checked_at > latest_prices.checked_at
+                                                   THEN latest_prices.checked_at ELSE latest_prices.previous_checked_at END,
+                        price = CASE WHEN excluded.checked_at > latest_prices.checked_at
+                                     THEN excluded.price ELSE latest_prices.price END,
+                        checked_at = MAX(latest_prices.checked_at, excluded.checked_at),
+                        min_price = MIN(latest_prices.min_price, excluded.price),
+                        max_price = MAX(latest_prices.max_price, excluded.price);
+                END;
+            """)
+
         # Migrate existing database if needed
         migrate_db(cur)
 
         # Create indexes for better performance
         cur.execute("CREATE INDEX IF NOT EXISTS idx_products_status ON products(status);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_products_next_check ON products(status, next_check_at);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_products_group_id ON products(group_id);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_products_status_store ON products(status, store);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_products_status_group ON products(status, group_id);")
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_url_key ON products(url_key);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_latest_prices_drop ON latest_prices(drop_pct);")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_price_history_product_id ON price_history(product_id);")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_price_history_checked_at ON price_history(checked_at);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_price_intervals_last_seen ON price_intervals(product_id, last_seen);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_check_jobs_status ON check_jobs(status, lease_expires_at);")
 
         conn.commit()
 
+    # Databases from before latest_prices and the rollups existed: fill
+    # them from the history
+    with get_connection() as conn:
+        has_history, has_latest, has_rollups = conn.execute("""
+            SELECT EXISTS (SELECT 1 FROM price_history) OR EXISTS (SELECT 1 FROM price_intervals),
+                   EXISTS (SELECT 1 FROM latest_prices),
+                   EXISTS (SELECT 1 FROM price_rollups_daily)
+        """).fetchone()
+    if has_history and not has_latest:
+        rebuild_latest_prices()
+    if has_history and not has_rollups:
+        rebuild_price_rollups()
+
 
 def migrate_db(cur):
     """Add new columns to existing tables if they don't exist."""
@@ -83,6 +343,36 @@ def migrate_db(cur):
     if 'group_id' not in columns:
         cur.execute("ALTER TABLE products ADD COLUMN group_id TEXT")
 
+    # HTTP validators and price region fingerprint of the last fetch
+    for column in ('etag', 'last_modified', 'content_hash'):
+        if column not in columns:
+            cur.execute(f"ALTER TABLE products ADD COLUMN {column} TEXT")
+
+    # Adaptive check schedule (see scheduler.py)
+    if 'next_check_at' not in columns:
+        cur.execute("ALTER TABLE products ADD COLUMN next_check_at TEXT")
+    if 'check_interval' not in columns:
+        cur.execute("ALTER TABLE products ADD COLUMN check_interval INTEGER")
+
+    # Canonical product key of the URL (see stores.canonical_url_key)
+    if 'url_key' not in columns:
+        cur.execute("ALTER TABLE products ADD COLUMN url_key TEXT")
+        backfill_url_keys(cur)
+    else:
+        # Flipkart keys from before the variant (?pid=) was part of them
+        cur.execute("""
+            SELECT 1 FROM products
+            WHERE url_key LIKE 'flipkart:%' AND url_key NOT LIKE '%?pid=%' AND url LIKE '%pid=%'
+            LIMIT 1
+        """)
+        if cur.fetchone():
+            backfill_url_keys(cur, reactivate=True)
+
+    # Drop since the previous check, used to sort the dashboard
+    cur.execute("PRAGMA table_xinfo(latest_prices)")
+    if 'drop_pct' not in [row[1] for row in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE latest_prices ADD COLUMN drop_pct REAL GENERATED ALWAYS AS ({DROP_PCT_EXPRESSION}) VIRTUAL")
+
     # Check and add columns to price_history table
     cur.execute("PRAGMA table_info(price_history)")
     columns = [row[1] for row in cur.fetchall()]
@@ -97,9 +387,9 @@ def add_product(name, store, url, target_price=None, currency='INR'):
         cur = conn.cursor()
         try:
             cur.execute("""
-                INSERT INTO products (name, store, url, target_price, currency)
-                VALUES (?, ?, ?, ?, ?)
-            """, (name, store, url, target_price, currency))
+                INSERT INTO products (name, store, url, target_price, currency, next_check_at, url_key)
+                VALUES (?, ?, ?, ?, ?, datetime('now'), ?)
+            """, (name, store, url, target_price, currency, canonical_url_key(url, store)))
             conn.commit()
             return cur.lastrowid
         except sqlite3.IntegrityError as e:
@@ -114,6 +404,160 @@ def get_all_products(status='active'):
         return rows
 
 
+def count_products(status='active'):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM products WHERE status = ?", (status,))
+        return cur.fetchone()[0]
+
+
+# Dashboard sort orders: name -> (sort column, tie-breaker id column, descending).
+# Each has an index that yields rows in this order, so a page costs the
+# same on any catalog size. Descending sort columns must not be NULL.
+DASHBOARD_SORTS = {
+    "recent": ("p.id", "p.id", True),
+    "store": ("p.store", "p.id", False),
+    "group": ("p.group_id", "p.id", False),
+    "drop": ("lp.drop_pct", "lp.product_id", True),
+}
+
+
+def get_dashboard_products(limit, after=None, sort="recent", store=None, group_id=None,
+                           query=None, below_target=False):
+    """
+    One page of active products for the dashboard, with their latest and
+    previous price, change, drop percentage, all-time low/high and whether
+    they are at or below their target price.
+
+    Uses keyset pagination: `after` is the `next_after` of the previous
+    page. Returns (rows, next_after), next_after being None on the last
+    page. Sorting by drop only lists products that have a price.
+    """
+    column, id_column, descending = DASHBOARD_SORTS[sort]
+    # Newest first is cheapest walking the primary key backwards; the unary
+    # + keeps SQLite from picking an index on status (which nearly every
+    # product matches) and sorting the whole catalog instead
+    status = "+p.status" if sort == "recent" and not store else "p.status"
+    conditions = [f"{status} = 'active'"]
+    params = []
+    if store:
+        conditions.append("p.store = ?")
+        params.append(store)
+    if group_id:
+        conditions.append("p.group_id = ?")
+        params.append(group_id)
+    if query:
+        conditions.append("p.name LIKE ?")
+        params.append(f"%{query}%")
+    if below_target:
+        conditions.append("p.target_price IS NOT NULL AND lp.price <= p.target_price")
+
+    if after is not None:
+        # Rows after (value, id) in the sort order
+        value, last_id = after
+        op = "<" if descending else ">"
+        if column == id_column:
+            conditions.append(f"{id_column} {op} ?")
+            params.append(last_id)
+        elif value is None:
+            # NULLs sort first: the remaining NULLs, then every other value
+            conditions.append(f"(({column} IS NULL AND {id_column} > ?) OR {column} IS NOT NULL)")
+            params.append(last_id)
+        else:
+            conditions.append(f"({column}, {id_column}) {op} (?, ?)")
+            params.extend([value, last_id])
+
+    if sort == "drop":
+        # Walk the drop_pct index and look each product up, not the other way round
+        tables = "latest_prices lp CROSS JOIN products p ON p.id = lp.product_id"
+    else:
+        tables = "products p LEFT JOIN latest_prices lp ON lp.product_id = p.id"
+    direction = "DESC" if descending else "ASC"
+    order = id_column if column == id_column else f"{column} {direction}, {id_column}"
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT p.id, p.name, p.store, p.url, p.group_id, p.target_price, p.last_checked,
+                   lp.price AS current_price, lp.previous_price, lp.min_price, lp.max_price,
+                   lp.checked_at, lp.drop_pct,
+                   lp.price - lp.previous_price AS price_change,
+                   (p.target_price IS NOT NULL AND lp.price <= p.target_price) AS at_target
+            FROM {tables}
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {order} {direction}
+            LIMIT ?
+        """, (*params, limit + 1))
+        rows = cur.fetchall()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    key = "id" if column == "p.id" else column.split(".")[1]
+    last = rows[-1]
+    return rows, (last[key], last["id"])
+
+
+def backfill_url_keys(cur, reactivate=False):
+    """
+    Set url_key on products that have none or one computed by an older
+    version of canonical_url_key. Of several products with the same key
+    the oldest keeps it; the others are duplicates and stop being tracked
+    (status 'inactive', no key). With `reactivate`, products an earlier
+    backfill took for duplicates (no key) are tracked again once they get
+    a key of their own. Returns the number of keys set.
+    """
+    cur.execute("SELECT id, store, url, url_key FROM products ORDER BY id")
+    rows = [(row[0], row[3], canonical_url_key(row[2], row[1])) for row in cur.fetchall()]
+    taken = {key for _, stored, key in rows if stored == key}
+    keys, duplicates, restored = [], [], []
+    for product_id, stored, key in rows:
+        if stored == key:
+            continue
+        if key in taken:
+            duplicates.append((product_id,))
+        else:
+            taken.add(key)
+            keys.append((key, product_id))
+            if reactivate and stored is None:
+                restored.append((product_id,))
+    # Free the outdated keys first, one may be another product's new key
+    cur.executemany("UPDATE products SET url_key = NULL WHERE id = ?", [(i,) for _, i in keys] + duplicates)
+    cur.executemany("UPDATE products SET url_key = ? WHERE id = ?", keys)
+    cur.executemany("UPDATE products SET status = 'inactive' WHERE id = ?", duplicates)
+    cur.executemany("UPDATE products SET status = 'active' WHERE id = ?", restored)
+    if duplicates:
+        print(f"Deactivated {len(duplicates)} duplicate products: "
+              f"{', '.join(str(row[0]) for row in duplicates)}")
+    return len(keys)
+
+
+def get_product_by_url(url, store=None):
+    """The product tracking the same item as `url` (any URL variant), or None."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM products WHERE url_key = ?", (canonical_url_key(url, store),))
+        return cur.fetchone()
+
+
+def get_price_updates(product_ids):
+    """
+    Latest price rows of `product_ids` with the fields the pages show
+    (change, drop percentage, low, target status), for live updates.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT lp.product_id, p.target_price, lp.price, lp.previous_price,
+                   lp.min_price, lp.max_price, lp.checked_at, lp.drop_pct,
+                   lp.price - lp.previous_price AS price_change,
+                   (p.target_price IS NOT NULL AND lp.price <= p.target_price) AS at_target
+            FROM json_each(?) ids
+            JOIN latest_prices lp ON lp.product_id = ids.value
+            JOIN products p ON p.id = lp.product_id
+        """, (json.dumps(list(product_ids)),))
+        return cur.fetchall()
+
+
 def get_product(product_id):
     with get_connection() as conn:
         cur = conn.cursor()
@@ -125,43 +569,894 @@ def get_product(product_id):
 def add_price(product_id, price):
     with get_connection() as conn:
         cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO price_history (product_id, price, checked_at)
-                VALUES (?, ?, datetime('now'))
-            """, (product_id, price))
+        checked_at = utc_timestamp()
+        stored = write_prices(cur, [(product_id, price, checked_at)])
+        if stored:
             # Update last_checked in products
             cur.execute("""
-                UPDATE products SET last_checked = datetime('now'), updated_at = datetime('now')
+                UPDATE products SET last_checked = ?, updated_at = ?
                 WHERE id = ?
-            """, (product_id,))
+            """, (checked_at, checked_at, product_id))
+        conn.commit()
+    _notify_prices_written(stored)
+
+
+# Callbacks run with the (product_id, price, checked_at) rows of every
+# committed add_price / PriceWriter flush, in the writing thread
+_price_listeners = []
+
+
+def on_prices_written(callback):
+    """Register `callback(rows)` to run after prices are written."""
+    _price_listeners.append(callback)
+
+
+def _notify_prices_written(rows):
+    if not rows:
+        return
+    for callback in list(_price_listeners):
+        try:
+            callback(rows)
+        except Exception as e:
+            print(f"Error in price listener {callback!r}: {e}")
+
+
+def write_prices(cur, prices):
+    """
+    Store (product_id, price, checked_at) rows as configured by
+    PRICE_STORAGE and bring the rollups up to date, on the caller's cursor
+    and transaction. A price already recorded at the same time is skipped.
+    Returns the rows stored.
+    """
+    replaced = []
+    if PRICE_STORAGE == "raw":
+        cur.executemany("""
+            INSERT OR IGNORE INTO price_history (product_id, price, checked_at)
+            VALUES (?, ?, ?)
+        """, prices)
+        # Only repeats within the batch are known to be skipped
+        stored = list({(row[0], row[2]): row for row in reversed(prices)}.values())
+    else:
+        stored, replaced = _write_intervals(cur, prices)
+    _refresh_rollups(cur, [(row[0], row[2]) for row in stored] + replaced)
+    return stored
+
+
+# Rollup rows of the buckets in `keys` (product_id, bucket, bucket_end),
+# from the stored checks in them: raw rows and interval endpoints, as in
+# price_points but with the range pushed into each table's index.
+_ROLLUP_ROWS = """
+    SELECT product_id, bucket, open, MAX(price), MIN(price), close, COUNT(*),
+           MIN(checked_at), MAX(checked_at)
+    FROM (
+        SELECT product_id, bucket, price, checked_at,
+               FIRST_VALUE(price) OVER (PARTITION BY product_id, bucket ORDER BY checked_at) AS open,
+               FIRST_VALUE(price) OVER (PARTITION BY product_id, bucket ORDER BY checked_at DESC) AS close
+        FROM (
+            SELECT k.product_id, k.bucket, h.price, h.checked_at
+            FROM keys k JOIN price_history h ON h.product_id = k.product_id
+                AND h.checked_at >= k.bucket AND h.checked_at < k.bucket_end
+            UNION ALL
+            SELECT k.product_id, k.bucket, i.price, i.first_seen
+            FROM keys k JOIN price_intervals i ON i.product_id = k.product_id
+                AND i.first_seen >= k.bucket AND i.first_seen < k.bucket_end
+            UNION ALL
+            SELECT k.product_id, k.bucket, i.price, i.last_seen
+            FROM keys k JOIN price_intervals i ON i.product_id = k.product_id
+                AND i.last_seen >= k.bucket AND i.last_seen < k.bucket_end
+            WHERE i.last_seen > i.first_seen
+        )
+    )
+    GROUP BY product_id, bucket
+"""
+
+
+def _refresh_rollups(cur, points):
+    """
+    Recompute the rollup rows of the buckets holding `points`, (product_id,
+    checked_at) pairs of checks just stored or removed, from the stored
+    checks. `count` is the number of stored checks, so these rows are the
+    ones rebuild_price_rollups gives.
+    """
+    if not points:
+        return
+    keys = json.dumps(sorted(set(points)))
+    for table, bucket_format, span in PRICE_ROLLUPS.values():
+        cte = f"""
+            WITH keys AS (
+                SELECT product_id, bucket, datetime(bucket, '{span}') AS bucket_end
+                FROM (
+                    SELECT DISTINCT json_extract(value, '$[0]') AS product_id,
+                           strftime('{bucket_format}', json_extract(value, '$[1]')) AS bucket
+                    FROM json_each(?)
+                )
+            )
+        """
+        cur.execute(f"""
+            {cte}
+            DELETE FROM {table} WHERE (product_id, bucket) IN (SELECT product_id, bucket FROM keys)
+        """, (keys,))
+        cur.execute(f"""
+            {cte}
+            INSERT INTO {table} (product_id, bucket, open, high, low, close, count, first_at, last_at)
+            {_ROLLUP_ROWS}
+        """, (keys,))
+
+
+def rebuild_price_rollups():
+    """
+    Recompute the rollup tables from the stored checks (price_points), e.g.
+    for a database written by an older version. Gives the same rows as the
+    updates on write (see _refresh_rollups). Returns the number of daily rows.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        for table, bucket_format, span in PRICE_ROLLUPS.values():
+            cur.execute(f"DELETE FROM {table}")
+            cur.execute(f"""
+                INSERT INTO {table} (product_id, bucket, open, high, low, close, count, first_at, last_at)
+                WITH keys AS (
+                    SELECT product_id, bucket, datetime(bucket, '{span}') AS bucket_end
+                    FROM (
+                        SELECT DISTINCT product_id, strftime('{bucket_format}', checked_at) AS bucket
+                        FROM price_points
+                    )
+                )
+                {_ROLLUP_ROWS}
+            """)
+        conn.commit()
+        return cur.rowcount
+
+
+def _latest_intervals(cur, product_ids):
+    """Newest interval of each product, by product id."""
+    cur.execute("""
+        SELECT i.id, i.product_id, i.price, i.first_seen, i.last_seen
+        FROM json_each(?) AS wanted
+        JOIN price_intervals i ON i.id = (
+            SELECT id FROM price_intervals
+            WHERE product_id = wanted.value
+            ORDER BY last_seen DESC
+            LIMIT 1
+        )
+    """, (json.dumps(sorted(product_ids)),))
+    return {row["product_id"]: dict(row, added=0) for row in cur.fetchall()}
+
+
+def _preceding_interval(cur, product_id, checked_at):
+    """
+    The product's interval that starts last at or before `checked_at`, and
+    when the next one starts (None if there is none).
+    """
+    cur.execute("""
+        SELECT id, product_id, price, first_seen, last_seen FROM price_intervals
+        WHERE product_id = ? AND first_seen <= ?
+        ORDER BY first_seen DESC
+        LIMIT 1
+    """, (product_id, checked_at))
+    row = cur.fetchone()
+    cur.execute("SELECT MIN(first_seen) FROM price_intervals WHERE product_id = ? AND first_seen > ?",
+                (product_id, checked_at))
+    return (dict(row, added=0) if row else None), cur.fetchone()[0]
+
+
+def _write_intervals(cur, prices):
+    """
+    Fold price rows into price_intervals: a row with the price of the
+    product's newest interval extends it, any other price starts a new
+    interval. Rows older than the newest interval (late writes, compacted
+    history) are chained onto the stored interval that precedes them, so
+    compacting old history next to newer intervals still folds repeated
+    prices. Returns the rows stored, i.e. without repeated checks, and the
+    (product_id, checked_at) of the last checks of intervals that were
+    extended past them.
+    """
+    prices = sorted(prices, key=lambda row: (row[0], row[2]))
+    latest = _latest_intervals(cur, {row[0] for row in prices})
+    # Stored intervals already read, by id, so each is updated only once
+    fetched = {i["id"]: i for i in latest.values()}
+    new = []
+    extended = []
+    replaced = []
+    # Per product: the interval older rows are chained onto, and when the
+    # next stored interval starts
+    older = {}
+    stored = []
+    for product_id, price, checked_at in prices:
+        current = latest.get(product_id)
+        if current and checked_at <= current["last_seen"]:
+            if checked_at in (current["first_seen"], current["last_seen"]):
+                continue
+            current, until = older.get(product_id, (None, None))
+            if current is None or (until is not None and checked_at >= until):
+                current, until = _preceding_interval(cur, product_id, checked_at)
+                if current:
+                    current = fetched.setdefault(current["id"], current)
+                older[product_id] = (current, until)
+            if current and checked_at in (current["first_seen"], current["last_seen"]):
+                continue
+        elif current and checked_at == current["last_seen"]:
+            continue
+        if current and current["price"] == price:
+            if current["id"] and not current["added"]:
+                extended.append(current)
+                replaced.append((product_id, current["last_seen"]))
+            current["last_seen"] = max(current["last_seen"], checked_at)
+            current["added"] += 1
+        else:
+            interval = {"id": None, "product_id": product_id, "price": price,
+                        "first_seen": checked_at, "last_seen": checked_at, "added": 1}
+            new.append(interval)
+            if latest.get(product_id) and checked_at < latest[product_id]["last_seen"]:
+                older[product_id] = (interval, older.get(product_id, (None, None))[1])
+            else:
+                latest[product_id] = interval
+        stored.append((product_id, price, checked_at))
+
+    cur.executemany("""
+        UPDATE price_intervals SET last_seen = ?, observations = observations + ?
+        WHERE id = ?
+    """, [(i["last_seen"], i["added"], i["id"]) for i in extended])
+    cur.executemany("""
+        INSERT OR IGNORE INTO price_intervals (product_id, price, first_seen, last_seen, observations)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(i["product_id"], i["price"], i["first_seen"], i["last_seen"], i["added"]) for i in new])
+    return stored, replaced
+
+
+def compact_price_history(batch_size=COMPACT_BATCH_SIZE, before=None, max_batches=None):
+    """
+    Move price_history rows (only those checked before `before`, if given)
+    into price_intervals, oldest first, `batch_size` rows per transaction
+    and at most `max_batches` transactions. Returns the number of rows moved.
+    """
+    window = "WHERE checked_at < ?" if before else ""
+    extra = (before,) if before else ()
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT id, product_id, price, checked_at FROM price_history
+                {window}
+                ORDER BY checked_at
+                LIMIT ?
+            """, (*extra, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            points = [(row["product_id"], row["price"], row["checked_at"]) for row in rows]
+            _, replaced = _write_intervals(cur, points)
+            cur.execute("DELETE FROM price_history WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps([row["id"] for row in rows]),))
+            # Checks now inside an interval no longer count in the rollups
+            _refresh_rollups(cur, [(row[0], row[2]) for row in points] + replaced)
             conn.commit()
-        except sqlite3.IntegrityError:
-            # Price already recorded at this time, skip
-            pass
+        moved += len(rows)
+        batches += 1
+        incremental_vacuum()
+    return moved
+
+
+def apply_retention(policy=None, batch_size=RETENTION_BATCH_SIZE, max_batches=RETENTION_MAX_BATCHES):
+    """
+    Trim the price history as RETENTION_POLICY (or `policy`) says, in
+    transactions of at most `batch_size` rows and at most `max_batches` of
+    them per table, returning freed pages after each. Raw price_history
+    rows past their retention are folded into price_intervals, so every
+    price change is kept. Returns the rows handled per table and whether
+    anything is left for the next run.
+    """
+    policy = {**RETENTION_POLICY, **(policy or {})}
+    summary = {"done": True}
+
+    if policy["raw_days"] is not None:
+        cutoff = _days_ago(policy["raw_days"])
+        moved = compact_price_history(batch_size, before=cutoff, max_batches=max_batches)
+        summary["price_history"] = moved
+        summary["done"] &= moved < batch_size * max_batches
+
+    for resolution, (table, _, _) in PRICE_ROLLUPS.items():
+        days = policy[f"{resolution}_rollup_days"]
+        if days is None:
+            continue
+        cutoff = _days_ago(days)
+        deleted = 0
+        for _ in range(max_batches):
+            with get_connection() as conn:
+                cur = conn.cursor()
+                cur.execute(f"""
+                    DELETE FROM {table} WHERE (product_id, bucket) IN (
+                        SELECT product_id, bucket FROM {table} WHERE bucket < ? LIMIT ?
+                    )
+                """, (cutoff, batch_size))
+                conn.commit()
+            deleted += cur.rowcount
+            incremental_vacuum()
+            if cur.rowcount < batch_size:
+                break
+        else:
+            summary["done"] = False
+        summary[table] = deleted
+    return summary
+
+
+def _days_ago(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def incremental_vacuum(pages=VACUUM_PAGES):
+    """
+    Return up to `pages` free pages to the file system. Only has an effect
+    on databases with auto_vacuum = INCREMENTAL (see enable_incremental_vacuum).
+    """
+    with get_connection() as conn:
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+
+
+def enable_incremental_vacuum():
+    """
+    Switch a database created without auto_vacuum = INCREMENTAL to it. This
+    rewrites the whole file once (VACUUM). Returns True if it was switched.
+    """
+    with get_connection() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+
+
+def claim_maintenance(name, interval_seconds):
+    """
+    True if the maintenance task `name` hasn't run for `interval_seconds`,
+    in which case it is recorded as running now. Only one of several
+    workers calling this at the same time gets True.
+    """
+    now = time.time()
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO maintenance_runs (name, last_run_at) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET last_run_at = excluded.last_run_at
+            WHERE last_run_at <= ?
+        """, (name, now, now - interval_seconds))
+        conn.commit()
+        return cur.rowcount == 1
+
+
+def utc_timestamp():
+    """Current UTC time in the format of SQLite's datetime('now')."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
 
-def get_price_history(product_id):
+class PriceWriter:
+    """
+    Buffers price rows, page validators, next check times and finished
+    check jobs and writes them in batches: one connection and one
+    transaction per flush, with executemany for the price inserts (see
+    write_prices) and the bulk products updates. A job is only removed
+    from the queue together with its product's price. Thread-safe, so the
+    tracker's check threads can share one writer.
+
+        with PriceWriter() as writer:
+            writer.add_price(product_id, price)
+    """
+
+    def __init__(self, batch_size=PRICE_BATCH_SIZE, flush_seconds=PRICE_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.prices = []
+        self.validators = {}
+        self.schedules = {}
+        self.completed = []
+        self.first_buffered = None
+        self.rows_written = 0
+        self.flushes = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    def add_price(self, product_id, price, checked_at=None):
+        """Buffer a price for `product_id`, checked at `checked_at` (UTC, default now)."""
+        with self.lock:
+            self.prices.append((product_id, price, checked_at or utc_timestamp()))
+            self._mark_buffered()
+            due = self._flush_due()
+        if due:
+            self.flush()
+
+    def extend_price(self, product_id, price, checked_at=None):
+        """
+        Buffer a check that found the product's `price` unchanged without
+        parsing the page. With interval storage it extends the current
+        interval (last_seen and observations) like add_price; raw storage
+        keeps no row for it.
+        """
+        if PRICE_STORAGE != "raw" and price is not None:
+            self.add_price(product_id, price, checked_at)
+
+    def save_validators(self, product_id, etag, last_modified, content_hash, checked=False):
+        """Buffered save_page_validators."""
+        with self.lock:
+            self.validators[product_id] = (etag, last_modified, content_hash,
+                                           utc_timestamp() if checked else None)
+            self._mark_buffered()
+            due = self._flush_due()
+        if due:
+            self.flush()
+
+    def schedule(self, product_id, interval, delay):
+        """Buffered set_next_check; `delay` counts from now, not from the flush."""
+        next_check_at = (datetime.now(timezone.utc) + timedelta(seconds=int(delay))).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            self.schedules[product_id] = (interval, next_check_at)
+            self._mark_buffered()
+            due = self._flush_due()
+        if due:
+            self.flush()
+
+    def complete_job(self, worker_id, product_id):
+        """Buffered complete_check_job."""
+        with self.lock:
+            self.completed.append((product_id, worker_id))
+            self._mark_buffered()
+            due = self._flush_due()
+        if due:
+            self.flush()
+
+    def _mark_buffered(self):
+        if self.first_buffered is None:
+            self.first_buffered = time.monotonic()
+
+    def _flush_due(self):
+        buffered = len(self.prices) + len(self.validators) + len(self.schedules) + len(self.completed)
+        return (buffered >= self.batch_size
+                or time.monotonic() - self.first_buffered >= self.flush_seconds)
+
+    def flush(self):
+        """Write everything buffered so far in one transaction."""
+        with self.flush_lock:
+            with self.lock:
+                prices, self.prices = self.prices, []
+                validators, self.validators = self.validators, {}
+                schedules, self.schedules = self.schedules, {}
+                completed, self.completed = self.completed, []
+                self.first_buffered = None
+            if not prices and not validators and not schedules and not completed:
+                return 0
+
+            # Latest check time per product for the bulk last_checked update
+            last_checked = {}
+            for product_id, _, checked_at in prices:
+                last_checked[product_id] = max(checked_at, last_checked.get(product_id, checked_at))
+
+            with get_connection() as conn:
+                cur = conn.cursor()
+                # Same price twice in one second is skipped, as in add_price
+                stored = write_prices(cur, prices)
+                cur.executemany("""
+                    UPDATE products SET last_checked = ?, updated_at = ?
+                    WHERE id = ?
+                """, [(checked_at, checked_at, product_id) for product_id, checked_at in last_checked.items()])
+                cur.executemany("""
+                    UPDATE products SET etag = ?, last_modified = ?, content_hash = ?,
+                           last_checked = COALESCE(?, last_checked)
+                    WHERE id = ?
+                """, [(*values, product_id) for product_id, values in validators.items()])
+                cur.executemany("""
+                    UPDATE products SET check_interval = ?, next_check_at = ? WHERE id = ?
+                """, [(*values, product_id) for product_id, values in schedules.items()])
+                cur.executemany("DELETE FROM check_jobs WHERE product_id = ? AND worker_id = ?", completed)
+                conn.commit()
+
+            self.rows_written += len(stored)
+            self.flushes += 1
+        _notify_prices_written(stored)
+        return len(stored)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def save_page_validators(product_id, etag, last_modified, content_hash, checked=False):
+    """
+    Store the ETag/Last-Modified and price region fingerprint of the last
+    fetch. With checked=True the check is also recorded in last_checked,
+    for pages that were unchanged and so didn't get a new price row.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        if checked:
+            cur.execute("""
+                UPDATE products SET etag = ?, last_modified = ?, content_hash = ?,
+                       last_checked = datetime('now')
+                WHERE id = ?
+            """, (etag, last_modified, content_hash, product_id))
+        else:
+            cur.execute("""
+                UPDATE products SET etag = ?, last_modified = ?, content_hash = ?
+                WHERE id = ?
+            """, (etag, last_modified, content_hash, product_id))
+        conn.commit()
+
+
+def get_latest_price(product_id):
+    """Most recently recorded price of a product, or None."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT price FROM latest_prices WHERE product_id = ?", (product_id,))
+        row = cur.fetchone()
+        return row["price"] if row else None
+
+
+def get_price_summary(product_id):
+    """Latest, previous, lowest and highest price of a product, or None."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM latest_prices WHERE product_id = ?", (product_id,))
+        return cur.fetchone()
+
+
+def get_price_change(product_id):
+    """
+    (price, changed_at) of a product's current price, `changed_at` being
+    the first check of the run of checks that found it, or None.
+    """
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute("""
-            SELECT price, checked_at
-            FROM price_history
-            WHERE product_id = ?
-            ORDER BY checked_at
+            SELECT lp.price, (
+                SELECT MIN(checked_at) FROM price_points
+                WHERE product_id = lp.product_id AND checked_at > COALESCE((
+                    SELECT MAX(checked_at) FROM price_points
+                    WHERE product_id = lp.product_id AND price != lp.price
+                ), '')
+            ) AS changed_at
+            FROM latest_prices lp
+            WHERE lp.product_id = ?
         """, (product_id,))
+        return cur.fetchone()
+
+
+def rebuild_latest_prices():
+    """
+    Recompute latest_prices from all recorded checks (price_points), e.g. for a
+    database written by an older version. Returns the number of products.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM latest_prices")
+        cur.execute("""
+            INSERT INTO latest_prices (product_id, price, checked_at, previous_price,
+                                       previous_checked_at, min_price, max_price)
+            SELECT product_id, price, checked_at, previous_price, previous_checked_at,
+                   min_price, max_price
+            FROM (
+                SELECT product_id, price, checked_at,
+                       LAG(price) OVER by_time AS previous_price,
+                       LAG(checked_at) OVER by_time AS previous_checked_at,
+                       MIN(price) OVER by_product AS min_price,
+                       MAX(price) OVER by_product AS max_price,
+                       ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY checked_at DESC) AS newest
+                FROM price_points
+                WINDOW by_time AS (PARTITION BY product_id ORDER BY checked_at),
+                       by_product AS (PARTITION BY product_id)
+            )
+            WHERE newest = 1
+        """)
+        conn.commit()
+        return cur.rowcount
+
+
+def get_due_products(limit):
+    """Active products whose next check is due, most overdue first."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT * FROM products
+            WHERE status = 'active' AND next_check_at <= datetime('now')
+            ORDER BY next_check_at
+            LIMIT ?
+        """, (limit,))
+        return cur.fetchall()
+
+
+def schedule_new_products(spread_seconds):
+    """
+    Give active products without a next check time one at a random point
+    in the next `spread_seconds`. Returns the number of products scheduled.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE products
+            SET next_check_at = datetime('now', '+' || (abs(random()) % ?) || ' seconds')
+            WHERE status = 'active' AND next_check_at IS NULL
+        """, (max(1, int(spread_seconds)),))
+        conn.commit()
+        return cur.rowcount
+
+
+def set_next_check(product_id, interval, delay):
+    """Store a product's check interval and schedule its next check `delay` seconds from now."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE products SET check_interval = ?, next_check_at = datetime('now', ?)
+            WHERE id = ?
+        """, (interval, f"+{int(delay)} seconds", product_id))
+        conn.commit()
+
+
+def enqueue_due_checks(max_attempts, retry_seconds):
+    """
+    Queue a check job for every active product that is due and not queued
+    yet. Jobs whose lease expired `max_attempts` times (their worker kept
+    dying) are dropped and their product rescheduled `retry_seconds` from
+    now. Returns the number of jobs added.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            DELETE FROM check_jobs
+            WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= ?
+            RETURNING product_id
+        """, (time.time(), max_attempts))
+        dropped = [row[0] for row in cur.fetchall()]
+        if dropped:
+            print(f"Dropped check jobs after {max_attempts} expired leases: products {dropped}")
+            cur.executemany("""
+                UPDATE products SET next_check_at = datetime('now', ?) WHERE id = ?
+            """, [(f"+{int(retry_seconds)} seconds", product_id) for product_id in dropped])
+        cur.execute("""
+            INSERT OR IGNORE INTO check_jobs (product_id)
+            SELECT id FROM products
+            WHERE status = 'active' AND next_check_at <= datetime('now')
+            ORDER BY next_check_at
+        """)
+        conn.commit()
+        return cur.rowcount
+
+
+def claim_check_jobs(worker_id, limit, lease_seconds, max_attempts):
+    """
+    Atomically lease up to `limit` pending (or expired, if they have been
+    leased fewer than `max_attempts` times) check jobs to `worker_id` and
+    return their product rows. The single UPDATE makes the
+    claim safe across threads, processes and hosts sharing the database.
+    """
+    now = time.time()
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE check_jobs
+            SET status = 'leased', worker_id = ?, lease_expires_at = ?, attempts = attempts + 1
+            WHERE product_id IN (
+                SELECT product_id FROM check_jobs
+                WHERE status = 'pending' OR (lease_expires_at < ? AND attempts < ?)
+                ORDER BY enqueued_at
+                LIMIT ?
+            )
+            RETURNING product_id
+        """, (worker_id, now + lease_seconds, now, max_attempts, limit))
+        product_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        if not product_ids:
+            return []
+        placeholders = ",".join("?" * len(product_ids))
+        cur.execute(f"SELECT * FROM products WHERE id IN ({placeholders})", product_ids)
+        return cur.fetchall()
+
+
+def lease_product_check(worker_id, product_id, lease_seconds):
+    """
+    Lease the check of one product to `worker_id` right away, queued or
+    not, unless another worker holds a live lease on it. True if leased.
+    """
+    now = time.time()
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO check_jobs (product_id, status, worker_id, lease_expires_at, attempts)
+            VALUES (?, 'leased', ?, ?, 1)
+            ON CONFLICT (product_id) DO UPDATE SET
+                status = 'leased', worker_id = excluded.worker_id,
+                lease_expires_at = excluded.lease_expires_at, attempts = attempts + 1
+            WHERE status = 'pending' OR lease_expires_at < ?
+        """, (product_id, worker_id, now + lease_seconds, now))
+        conn.commit()
+        return cur.rowcount == 1
+
+
+def is_check_leased(product_id):
+    """True if a worker is checking the product right now."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT 1 FROM check_jobs
+            WHERE product_id = ? AND status = 'leased' AND lease_expires_at >= ?
+        """, (product_id, time.time()))
+        return cur.fetchone() is not None
+
+
+def heartbeat_check_jobs(worker_id, product_ids, lease_seconds):
+    """Extend the leases `worker_id` still holds. Returns how many were extended."""
+    if not product_ids:
+        return 0
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.executemany("""
+            UPDATE check_jobs SET lease_expires_at = ?
+            WHERE product_id = ? AND worker_id = ? AND status = 'leased'
+        """, [(time.time() + lease_seconds, product_id, worker_id) for product_id in product_ids])
+        conn.commit()
+        return cur.rowcount
+
+
+def complete_check_job(worker_id, product_id):
+    """Remove a finished job, if `worker_id` still holds its lease."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM check_jobs WHERE product_id = ? AND worker_id = ?",
+                    (product_id, worker_id))
+        conn.commit()
+        return cur.rowcount == 1
+
+
+def get_queue_stats():
+    """Number of pending, leased and expired check jobs."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT
+                SUM(status = 'pending'),
+                SUM(status = 'leased' AND lease_expires_at >= ?),
+                SUM(status = 'leased' AND lease_expires_at < ?)
+            FROM check_jobs
+        """, (time.time(), time.time()))
+        pending, leased, expired = cur.fetchone()
+        return {"pending": pending or 0, "leased": leased or 0, "expired": expired or 0}
+
+
+def seconds_until_next_check():
+    """Seconds until the earliest scheduled check of any active product, or None."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT (julianday(MIN(next_check_at)) - julianday('now')) * 86400
+            FROM products WHERE status = 'active'
+        """)
+        return cur.fetchone()[0]
+
+
+def get_price_history(product_id, start=None, end=None, max_points=HISTORY_MAX_POINTS):
+    """
+    Price history of a product between `start` and `end` (UTC timestamps,
+    default: all of it) as (price, checked_at) rows, oldest first.
+
+    While the range holds at most `max_points` stored checks these are the
+    stored checks; runs of an unchanged price stored as intervals come back
+    as their first and last check. Longer ranges are read from the hourly
+    or, if that still gives more than `max_points` rows, the daily rollups:
+    one row per bucket with the closing price as `price`, the bucket start
+    as `checked_at`, and `open`, `high`, `low` and `count`.
+    """
+    resolution = history_resolution(product_id, start, end, max_points)
+    with get_connection() as conn:
+        cur = conn.cursor()
+        if resolution == "raw":
+            where, params = _range_conditions(product_id, start, end)
+            cur.execute(f"""
+                SELECT price, checked_at
+                FROM price_points
+                WHERE {where}
+                ORDER BY checked_at
+            """, params)
+        else:
+            table, bucket_format, _ = PRICE_ROLLUPS[resolution]
+            where, params = _range_conditions(product_id, start, end, bucket_format)
+            cur.execute(f"""
+                SELECT close AS price, bucket AS checked_at, open, high, low, count
+                FROM {table}
+                WHERE {where}
+                ORDER BY bucket
+            """, params)
         rows = cur.fetchall()
         return rows
+
+
+def history_resolution(product_id, start=None, end=None, max_points=HISTORY_MAX_POINTS):
+    """
+    "raw", "hour" or "day": the finest resolution at which a product's
+    history between `start` and `end` has at most `max_points` rows. Stored
+    checks and hourly rows are counted, but no more than max_points + 1 of
+    them. Hourly rollups are only used while they still cover the start of
+    the range (see RETENTION_POLICY).
+    """
+    with get_connection() as conn:
+        where, params = _range_conditions(product_id, start, end)
+        checks = conn.execute(f"""
+            SELECT COUNT(*) FROM (SELECT 1 FROM price_points WHERE {where} LIMIT ?)
+        """, (*params, max_points + 1)).fetchone()[0]
+        if checks <= max_points:
+            return "raw"
+        table, bucket_format, _ = PRICE_ROLLUPS["hour"]
+        where, params = _range_conditions(product_id, start, end, bucket_format)
+        hours = conn.execute(f"""
+            SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {where} LIMIT ?)
+        """, (*params, max_points + 1)).fetchone()[0]
+    if hours <= max_points and _rollup_covers("hour", product_id, start):
+        return "hour"
+    return "day"
+
+
+def _range_conditions(product_id, start, end, bucket_format=None):
+    """
+    WHERE clause and parameters for a product's checks between `start` and
+    `end`, or with `bucket_format` for its rollup buckets, including the
+    one `start` falls in.
+    """
+    column = "bucket" if bucket_format else "checked_at"
+    conditions = ["product_id = ?"]
+    params = [product_id]
+    if start:
+        conditions.append(f"bucket >= strftime('{bucket_format}', ?)" if bucket_format else "checked_at >= ?")
+        params.append(start)
+    if end:
+        conditions.append(f"{column} <= ?")
+        params.append(end)
+    return " AND ".join(conditions), params
+
+
+def _first_check(cur, product_id, start=None):
+    """Time of the product's first recorded check at or after `start`."""
+    since = start or ""
+    return cur.execute("""
+        SELECT MIN(checked_at) FROM (
+            SELECT MIN(checked_at) AS checked_at FROM price_history
+            WHERE product_id = ?1 AND checked_at >= ?2
+            UNION ALL
+            SELECT MIN(first_seen) FROM price_intervals WHERE product_id = ?1 AND first_seen >= ?2
+            UNION ALL
+            SELECT MIN(last_seen) FROM price_intervals WHERE product_id = ?1 AND last_seen >= ?2
+        )
+    """, (product_id, since)).fetchone()[0]
+
+
+def _rollup_covers(resolution, product_id, start=None):
+    """
+    Whether the `resolution` rollup still has the bucket of the product's
+    first check from `start` on, i.e. retention hasn't trimmed that part.
+    """
+    table, bucket_format, _ = PRICE_ROLLUPS[resolution]
+    with get_connection() as conn:
+        cur = conn.cursor()
+        first = _first_check(cur, product_id, start)
+        if first is None:
+            return True
+        return cur.execute(f"""
+            SELECT EXISTS (SELECT 1 FROM {table} WHERE product_id = ? AND bucket = strftime('{bucket_format}', ?))
+        """, (product_id, first)).fetchone()[0] == 1
+
+
 def update_product(product_id, name, store, url, target_price):
     with get_connection() as conn:
         cur = conn.cursor()
         try:
             cur.execute(
                 """
-                UPDATE products SET name=?, store=?, url=?, target_price=?, updated_at=datetime('now')
+                UPDATE products SET name=?, store=?, url=?, url_key=?, target_price=?,
+                                    updated_at=datetime('now')
                 WHERE id=?
                 """,
-                (name, store, url, target_price, product_id),
+                (name, store, url, canonical_url_key(url, store), target_price, product_id),
             )
             if cur.rowcount == 0:
                 raise ValueError(f"Product with id {product_id} not found")
@@ -174,6 +1469,11 @@ def delete_product_db(product_id):
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute("DELETE FROM price_history WHERE product_id=?", (product_id,))
+        cur.execute("DELETE FROM price_intervals WHERE product_id=?", (product_id,))
+        for table, _, _ in PRICE_ROLLUPS.values():
+            cur.execute(f"DELETE FROM {table} WHERE product_id=?", (product_id,))
+        cur.execute("DELETE FROM check_jobs WHERE product_id=?", (product_id,))
+        cur.execute("DELETE FROM latest_prices WHERE product_id=?", (product_id,))
         cur.execute("DELETE FROM products WHERE id=?", (product_id,))
         if cur.rowcount == 0:
             raise ValueError(f"Product with id {product_id} not found")
@@ -186,19 +1486,11 @@ def get_product_comparison(group_id):
         cur = conn.cursor()
         # Get products in the group
         cur.execute("""
-            SELECT p.*, ph.price as current_price, ph.checked_at
+            SELECT p.*, lp.price as current_price, lp.checked_at
             FROM products p
-            LEFT JOIN (
-                SELECT product_id, price, checked_at
-                FROM price_history
-                WHERE (product_id, checked_at) IN (
-                    SELECT product_id, MAX(checked_at)
-                    FROM price_history
-                    GROUP BY product_id
-                )
-            ) ph ON p.id = ph.product_id
+            LEFT JOIN latest_prices lp ON lp.product_id = p.id
             WHERE p.group_id = ? AND p.status = 'active'
-            ORDER BY ph.price ASC
+            ORDER BY lp.price ASC
         """, (group_id,))
         rows = cur.fetchall()
 
@@ -246,3 +1538,35 @@ def update_product_group(product_id, group_id):
             WHERE id = ?
         """, (group_id, product_id))
         conn.commit()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Database maintenance.")
+    parser.add_argument("command", choices=["init", "rebuild-latest", "rebuild-rollups", "compact-history",
+                                            "retention"],
+                        help="init: create/migrate the schema; "
+                             "rebuild-latest: recompute latest_prices from the price history; "
+                             "rebuild-rollups: recompute the hourly/daily rollups; "
+                             "compact-history: fold price_history rows into price_intervals; "
+                             "retention: apply RETENTION_POLICY until nothing is left to trim")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "rebuild-latest":
+        print(f"Rebuilt latest prices of {rebuild_latest_prices()} products.")
+    elif args.command == "rebuild-rollups":
+        print(f"Rebuilt {rebuild_price_rollups()} daily price rollups.")
+    elif args.command == "compact-history":
+        print(f"Compacted {compact_price_history()} price_history rows into intervals.")
+        with get_connection() as conn:
+            conn.execute("VACUUM")
+    elif args.command == "retention":
+        if enable_incremental_vacuum():
+            print("Switched the database to incremental vacuum.")
+        while True:
+            summary = apply_retention()
+            print(f"Retention: {summary}")
+            if summary["done"]:
+                break
@@ -1,23 +1,32 @@
-from scraper import fetch_html
-from bs4 import BeautifulSoup
-url = 'https://www.flipkart.com/oneplus-nord-ce-3-lite-5g-chromatic-gray-256-gb/p/itm2cd5a4e659035'
-html = fetch_html(url)
+import os
+import sys
+
+from scraper import fetch_html, detect_store
+from stores import get_adapter
+
+# Usage: python debug_price.py [product URL or saved HTML file] [store]
+# With no arguments the synthetic Flipkart page in fixtures/ is parsed;
+# a URL is only fetched when one is given.
+target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'flipkart_product.html')
+
+if os.path.exists(target):
+    with open(target, encoding='utf-8') as f:
+        html = f.read()
+    store = sys.argv[2] if len(sys.argv) > 2 else detect_store(os.path.basename(target))
+else:
+    html = fetch_html(target)
+    store = detect_store(target)
 if not html:
     raise ValueError("No HTML content received")
-soup = BeautifulSoup(html, 'html.parser')
-selectors = [
-    "div._30jeq3._16Jk6d",  # classic product price
-    "div._19_Y9G._8XxizX",  # "Special Price" block
-    "div._19_Y9G._1PLdiu",  # "Selling Price" block
-    "div._30jeq3",  # general price class
-    "span._30jeq3",  # price span
-    "div.Nx9bqj",  # newer price class
-]
-for sel in selectors:
-    el = soup.select_one(sel)
+
+adapter = get_adapter(store)
+doc = adapter.parse(html)
+for sel in adapter.price_selectors:
+    el = doc.select_one(sel)
     if el:
-        text = el.get_text(strip=True)
+        text = el.text()
         print(f'{sel}: {text}')
         if '₹' in text:
             print('*** This is the correct price ***')
-        break  # Stop at first match
\ No newline at end of file
+        break  # Stop at first match
@@ -0,0 +1,163 @@
+"""
+Background jobs for long-running web requests (price check rounds,
+adding a product), with progress reporting.
+
+A route submits a function to the JobManager and returns the job id
+straight away. The function runs on a small thread pool and reports
+through its Job: `job.set_total(n)`, `job.advance(result)` per finished
+item and `job.log(message)`. Every report is kept as a numbered event, so
+the job page can stream them with Server-Sent Events (see
+Job.iter_events) and a reconnecting client resumes where it stopped.
+
+Jobs live in memory; finished ones are forgotten after JOB_KEEP_SECONDS
+or once more than JOB_KEEP_FINISHED have finished.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = 2
+JOB_KEEP_SECONDS = 60 * 60
+JOB_KEEP_FINISHED = 100
+# SSE streams send a comment line this often so proxies keep them open
+JOB_KEEPALIVE_SECONDS = 15
+
+
+class Job:
+    """State, progress and event log of one background job."""
+
+    def __init__(self, kind, title, key=None, return_url=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.title = title
+        self.key = key
+        # Page to go back to once the job is done
+        self.return_url = return_url
+        self.status = "queued"
+        self.total = None
+        self.done = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self.condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def _emit(self, event, data):
+        with self.condition:
+            self.events.append((event, data))
+            self.condition.notify_all()
+
+    def set_total(self, total):
+        self.total = total
+        self._emit("progress", self.progress())
+
+    def advance(self, result=None):
+        """Count one finished item, with its (JSON-serializable) result."""
+        with self.condition:
+            self.done += 1
+        if result is not None:
+            self._emit("result", result)
+        self._emit("progress", self.progress())
+
+    def log(self, message):
+        self._emit("log", {"message": message})
+
+    def progress(self):
+        return {"status": self.status, "done": self.done, "total": self.total}
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "title": self.title,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "return_url": self.return_url,
+            "events": len(self.events),
+        }
+
+    def iter_events(self, after=0, keepalive=JOB_KEEPALIVE_SECONDS):
+        """
+        Yield (number, event, data) for every event after number `after`,
+        waiting for new ones until the job has finished. Yields None when
+        nothing happened for `keepalive` seconds.
+        """
+        while True:
+            with self.condition:
+                if len(self.events) <= after and not self.finished:
+                    self.condition.wait(keepalive)
+                new = self.events[after:]
+                finished = self.finished
+            if not new and not finished:
+                yield None
+            for event, data in new:
+                after += 1
+                yield after, event, data
+            if finished and not new:
+                return
+
+
+class JobManager:
+    """Runs jobs on a thread pool and keeps them for status queries."""
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, kind, title, func, *args, key=None, return_url=None, **kwargs):
+        """
+        Run `func(job, *args, **kwargs)` in the background and return its
+        Job. While a job with the same `key` is queued or running, that job
+        is returned instead of starting another. What `func` returns
+        becomes `job.result`.
+        """
+        with self.lock:
+            self._forget_old()
+            if key is not None:
+                for job in self.jobs.values():
+                    if job.key == key and not job.finished:
+                        return job
+            job = Job(kind, title, key, return_url)
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job, func, args, kwargs):
+        job.status = "running"
+        job._emit("progress", job.progress())
+        status = "done"
+        try:
+            job.result = func(job, *args, **kwargs)
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.error = str(e)
+            status = "failed"
+        job.finished_at = time.time()
+        # Finish and emit 'done' together, so streams never end before it
+        with job.condition:
+            job.status = status
+            job._emit("done", job.to_dict())
+
+    def _forget_old(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        expired = time.time() - JOB_KEEP_SECONDS
+        for n, job in enumerate(finished):
+            if job.finished_at < expired or len(finished) - n > JOB_KEEP_FINISHED:
+                del self.jobs[job.id]
@@ -0,0 +1,212 @@
+# parsers.py
+"""
+Pluggable HTML parser engines for the store adapters.
+
+Adapters never touch a parser library directly; they work on the small
+Document/Node API below, so the backend can be switched without changing
+any selectors:
+
+- "html.parser": BeautifulSoup with Python's built-in parser (the default;
+                 slowest, but pure Python)
+- "lxml":        BeautifulSoup with the lxml tree builder (C parser, same
+                 soupsieve CSS engine, so selector results are identical)
+- "selectolax":  selectolax/lexbor, a C parser with a C CSS engine. This
+                 is an optional dependency (`pip install selectolax`).
+
+The faster engines are opt-in: pick one with the PARSER_ENGINE environment
+variable or `set_parser_engine()`. Every engine keeps parse-time statistics, available
+from `get_parser_stats()`.
+"""
+import os
+import threading
+import time
+
+from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
+
+DEFAULT_ENGINE = "html.parser"
+
+
+class ParserError(Exception):
+    pass
+
+
+class ParseStats:
+    """Thread-safe parse counters for one engine."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.parses = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_bytes = 0
+
+    def record(self, seconds, size):
+        with self.lock:
+            self.parses += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.total_bytes += size
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "parses": self.parses,
+                "total_ms": round(self.total_seconds * 1000, 3),
+                "avg_ms": round(self.total_seconds * 1000 / self.parses, 3) if self.parses else 0.0,
+                "max_ms": round(self.max_seconds * 1000, 3),
+                "total_bytes": self.total_bytes,
+            }
+
+
+class SoupNode:
+    def __init__(self, el):
+        self.el = el
+
+    def text(self):
+        return self.el.get_text(strip=True)
+
+    def attr(self, name):
+        return self.el.get(name)
+
+    def select_one(self, css):
+        el = self.el.select_one(css)
+        return SoupNode(el) if el is not None else None
+
+    def select(self, css):
+        return [SoupNode(el) for el in self.el.select(css)]
+
+
+class SoupDocument(SoupNode):
+    def full_text(self):
+        """All visible text of the document (scripts and styles excluded)."""
+        return self.el.get_text()
+
+    def strings(self):
+        """Every text node of the document, including comments and scripts."""
+        return [str(s) for s in self.el.find_all(string=True)]
+
+
+class SoupEngine:
+    def __init__(self, name, features):
+        if builder_registry.lookup(features) is None:
+            raise ParserError(f"The {name} engine needs its parser library installed")
+        self.name = name
+        self.features = features
+        self.stats = ParseStats()
+
+    def parse(self, html):
+        started = time.perf_counter()
+        soup = BeautifulSoup(html, self.features)
+        self.stats.record(time.perf_counter() - started, len(html))
+        return SoupDocument(soup)
+
+
+class LexborNode:
+    def __init__(self, node):
+        self.node = node
+
+    def text(self):
+        return self.node.text(strip=True)
+
+    def attr(self, name):
+        return self.node.attributes.get(name)
+
+    def select_one(self, css):
+        node = self.node.css_first(css)
+        return LexborNode(node) if node is not None else None
+
+    def select(self, css):
+        return [LexborNode(node) for node in self.node.css(css)]
+
+
+class LexborDocument(LexborNode):
+    # Text inside these isn't part of BeautifulSoup's get_text()
+    hidden_tags = ("script", "style", "template")
+
+    def full_text(self):
+        parts = []
+        for node in self.node.root.traverse(include_text=True):
+            if node.tag == "-text" and node.parent.tag not in self.hidden_tags:
+                parts.append(node.text_content)
+        return "".join(parts)
+
+    def strings(self):
+        parts = []
+        for node in self.node.root.traverse(include_text=True):
+            if node.tag == "-text":
+                parts.append(node.text_content)
+            elif node.tag == "-comment":
+                parts.append(node.comment_content or "")
+        return parts
+
+
+class SelectolaxEngine:
+    name = "selectolax"
+
+    def __init__(self):
+        try:
+            from selectolax.lexbor import LexborHTMLParser
+        except ImportError as e:
+            raise ParserError("The selectolax engine needs `pip install selectolax`") from e
+        self.parser_class = LexborHTMLParser
+        self.stats = ParseStats()
+
+    def parse(self, html):
+        started = time.perf_counter()
+        tree = self.parser_class(html)
+        self.stats.record(time.perf_counter() - started, len(html))
+        return LexborDocument(tree)
+
+
+ENGINE_FACTORIES = {
+    "html.parser": lambda: SoupEngine("html.parser", "html.parser"),
+    "lxml": lambda: SoupEngine("lxml", "lxml"),
+    "selectolax": SelectolaxEngine,
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+_current_engine = os.environ.get("PARSER_ENGINE", DEFAULT_ENGINE)
+
+
+def get_engine(name=None):
+    """Return the (shared) engine called `name`, or the configured one."""
+    name = name or _current_engine
+    with _engines_lock:
+        engine = _engines.get(name)
+        if engine is None:
+            factory = ENGINE_FACTORIES.get(name)
+            if factory is None:
+                raise ParserError(f"Unknown parser engine '{name}'. Available: {', '.join(ENGINE_FACTORIES)}")
+            engine = factory()
+            _engines[name] = engine
+        return engine
+
+
+def set_parser_engine(name):
+    """Switch the engine used by the store adapters."""
+    global _current_engine
+    get_engine(name)  # fail early if it can't be used
+    _current_engine = name
+
+
+def available_engines():
+    """Names of the engines whose libraries are installed."""
+    names = []
+    for name in ENGINE_FACTORIES:
+        try:
+            get_engine(name)
+            names.append(name)
+        except ParserError:
+            pass
+    return names
+
+
+def parse_html(html, engine=None):
+    return get_engine(engine).parse(html)
+
+
+def get_parser_stats():
+    with _engines_lock:
+        return {name: engine.stats.as_dict() for name, engine in _engines.items()}
@@ -0,0 +1,85 @@
+"""
+In-process publish/subscribe for live page updates.
+
+Price ingestion publishes the changed latest-price rows (see
+app.publish_price_updates, registered with db.on_prices_written) and each
+open page holds a Subscription, streamed to it as Server-Sent Events.
+A subscription only receives the products it asked for, so a page gets
+just its own rows instead of re-running its queries.
+
+Subscriptions queue at most SUBSCRIPTION_QUEUE_SIZE messages; a client too
+slow to keep up is marked lagged and told to reload the page instead of
+holding more messages in memory.
+"""
+import queue
+import threading
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """Messages for one subscriber, optionally limited to some products."""
+
+    def __init__(self, product_ids=None, maxsize=SUBSCRIPTION_QUEUE_SIZE):
+        self.product_ids = set(product_ids) if product_ids else None
+        self.queue = queue.Queue(maxsize)
+        self.lagged = False
+
+    def wants(self, product_id):
+        return self.product_ids is None or product_id in self.product_ids
+
+    def get(self, timeout=None):
+        """Next (event, data) message, or None after `timeout` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class PriceBus:
+    """Fans out price updates to the subscriptions interested in them."""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "lagged": 0}
+
+    def subscribe(self, product_ids=None):
+        subscription = Subscription(product_ids)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def has_subscribers(self):
+        return bool(self.subscriptions)
+
+    def publish(self, rows):
+        """
+        Send each subscription a 'price' message with the rows (dicts with
+        a 'product_id') it subscribed to.
+        """
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        self.stats["published"] += 1
+        for subscription in subscriptions:
+            if subscription.lagged:
+                continue
+            wanted = [row for row in rows if subscription.wants(row["product_id"])]
+            if not wanted:
+                continue
+            try:
+                subscription.queue.put_nowait(("price", wanted))
+                self.stats["delivered"] += 1
+            except queue.Full:
+                subscription.lagged = True
+                self.stats["lagged"] += 1
+                # Make room for the one message that matters now
+                subscription.get(timeout=0)
+                try:
+                    subscription.queue.put_nowait(("reload", {}))
+                except queue.Full:
+                    pass
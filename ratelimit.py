@@ -0,0 +1,177 @@
+# ratelimit.py
+"""
+Per-host token-bucket rate limiter shared by every scraper call path.
+
+All outgoing store requests (background checks, group checks, product page
+refreshes, searches) go through `acquire(url)`, so politeness is enforced in
+one place instead of scattered sleeps. Each store gets a bucket that refills
+at `rate` requests/second and can hold up to `burst` tokens, shared by all
+of its hosts (amazon.in, www.amazon.in, ...); other hosts get one each.
+
+Buckets live in memory by default. Set the RATE_LIMIT_DB environment
+variable to a SQLite file path to share them between processes (e.g. several
+gunicorn workers or tracker.py workers on the same machine).
+"""
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from stores import store_of
+
+# requests/sec and burst size per store
+RATE_LIMITS = {
+    "amazon": {"rate": 0.5, "burst": 2},
+    "flipkart": {"rate": 0.5, "burst": 2},
+    "myntra": {"rate": 0.5, "burst": 2},
+}
+# Used for hosts that don't belong to a known store
+DEFAULT_RATE_LIMIT = {"rate": 0.3, "burst": 1}
+
+RATE_LIMIT_DB = os.environ.get("RATE_LIMIT_DB")
+
+
+def bucket_key(host):
+    """The store a host belongs to (see stores.store_of), or else the host."""
+    return store_of(host) or (host or "").lower()
+
+
+def limits_for_host(host, limits=None):
+    """Return the rate/burst settings for a host, matched by store name."""
+    limits = RATE_LIMITS if limits is None else limits
+    return limits.get(bucket_key(host), DEFAULT_RATE_LIMIT)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    `reserve()` takes a token immediately, letting the balance go negative,
+    and returns how long the caller must wait before using it. Callers are
+    therefore served in the order they arrive without any polling.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class SQLiteBucketStore:
+    """Token buckets kept in a SQLite file so several processes share them."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    host TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # Autocommit mode; transactions are managed explicitly
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def reserve(self, host, rate, burst):
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so the
+            # read-modify-write below is atomic across processes
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_buckets WHERE host = ?", (host,)
+            ).fetchone()
+            now = time.time()
+            if row:
+                tokens = min(burst, row[0] + (now - row[1]) * rate)
+            else:
+                tokens = float(burst)
+            tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (host, tokens, updated) VALUES (?, ?, ?)",
+                (host, tokens, now),
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if tokens >= 0:
+            return 0.0
+        return -tokens / rate
+
+
+class HostRateLimiter:
+    """
+    Keeps one token bucket per store (see bucket_key) and blocks callers
+    until allowed.
+    """
+
+    def __init__(self, limits=None, db_path=None):
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.store = SQLiteBucketStore(db_path) if db_path else None
+        self.buckets = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, key):
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                config = limits_for_host(key, self.limits)
+                bucket = TokenBucket(config["rate"], config["burst"])
+                self.buckets[key] = bucket
+            return bucket
+
+    def reserve(self, url):
+        """Reserve a request slot for `url` and return the seconds to wait."""
+        key = bucket_key(urlparse(url).hostname or url)
+        if self.store:
+            config = limits_for_host(key, self.limits)
+            wait = self.store.reserve(key, config["rate"], config["burst"])
+        else:
+            wait = self._bucket(key).reserve()
+
+        with self.lock:
+            stats = self.stats.setdefault(key, {"requests": 0, "waited": 0, "wait_seconds": 0.0})
+            stats["requests"] += 1
+            if wait > 0:
+                stats["waited"] += 1
+                stats["wait_seconds"] += wait
+        return wait
+
+    def acquire(self, url):
+        """Block until a request to `url` is allowed by its store's bucket."""
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def get_stats(self):
+        with self.lock:
+            return {host: dict(stats) for host, stats in self.stats.items()}
+
+
+# Process-wide limiter used by scraper.fetch_html
+rate_limiter = HostRateLimiter(db_path=RATE_LIMIT_DB)
+
+
+def acquire(url):
+    return rate_limiter.acquire(url)
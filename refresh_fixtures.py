@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Refresh the fixture corpus in fixtures/ from the live stores.
+
+Every manifest entry with a 'url' is downloaded again (full page, no
+streaming) and overwritten in place. The values the adapters now extract
+are printed next to the expected ones from manifest.json; check them
+against the live page in a browser, then re-run with --accept to store
+them as the new expectations.
+
+Entries without a 'url' (layout variants and error pages) are kept as they
+are, since they capture layouts the stores no longer serve on demand.
+Entries marked 'synthetic' are hand-written pages, not saved copies of a
+live page, and are never downloaded over.
+
+    python refresh_fixtures.py                   # refresh everything
+    python refresh_fixtures.py amazon_product.html --accept
+"""
+import argparse
+import json
+import os
+
+import scraper
+from stores import ScraperError, get_adapter
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+MANIFEST = os.path.join(FIXTURES_DIR, "manifest.json")
+
+
+def extract(entry, html):
+    adapter = get_adapter(entry["store"])
+    if entry["kind"] == "search":
+        return adapter.parse_search(html), None
+    snapshot = adapter.parse_product(html)
+    found = {field: snapshot[field] for field in ("name", "price", "mrp", "available")}
+    return found, adapter.price_selector_hit(adapter.parse(html))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="fixture files to refresh (default: all with a URL)")
+    parser.add_argument("--accept", action="store_true", help="store the extracted values as expectations")
+    args = parser.parse_args()
+
+    with open(MANIFEST, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    for entry in manifest:
+        if entry.get("synthetic") or not entry.get("url"):
+            continue
+        if args.files and entry["file"] not in args.files:
+            continue
+
+        print(f"\n{entry['file']}: {entry['url']}")
+        try:
+            html = scraper.fetch_html(entry["url"])
+        except ScraperError as e:
+            print(f"  ❌ download failed: {e}")
+            continue
+
+        with open(os.path.join(FIXTURES_DIR, entry["file"]), "w", encoding="utf-8") as f:
+            f.write(html)
+        print(f"  saved {len(html)} characters")
+
+        try:
+            found, selector = extract(entry, html)
+        except ScraperError as e:
+            print(f"  ⚠️  extraction failed: {e}")
+            continue
+
+        print(f"  expected: {entry.get('expected')}")
+        print(f"  found:    {found}")
+        if args.accept:
+            entry["expected"] = found
+            if entry["kind"] == "product":
+                entry["price_selector"] = selector
+            print("  ✅ accepted")
+
+    if args.accept:
+        with open(MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
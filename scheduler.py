@@ -0,0 +1,96 @@
+"""
+Adaptive per-product check scheduling.
+
+Every product has a `next_check_at` and a `check_interval` (seconds) in the
+products table. After each check the interval is adjusted:
+  - the price changed        -> interval shrinks (checked more often)
+  - the price stayed the same -> interval grows, up to MAX_CHECK_INTERVAL
+  - the price is close to the product's target price -> capped at
+    NEAR_TARGET_INTERVAL so a drop below the target is noticed quickly
+  - the check failed         -> retried after ERROR_RETRY_INTERVAL, without
+    changing the interval
+
+Next check times get random jitter so products added together drift
+apart instead of being checked in bursts. The background checker only
+picks products that are due (see tracker.run_due_checks).
+"""
+import random
+
+from db import set_next_check
+
+# Interval bounds in seconds
+MIN_CHECK_INTERVAL = 15 * 60
+DEFAULT_CHECK_INTERVAL = 60 * 60
+MAX_CHECK_INTERVAL = 24 * 60 * 60
+
+# Multipliers applied to the interval after a check
+CHANGED_FACTOR = 0.5
+UNCHANGED_FACTOR = 1.25
+
+# Within this fraction of target_price a product counts as near its target
+NEAR_TARGET_RATIO = 0.05
+NEAR_TARGET_INTERVAL = 30 * 60
+
+ERROR_RETRY_INTERVAL = 30 * 60
+
+# +/- fraction of random jitter on every next check time
+INTERVAL_JITTER = 0.1
+
+# Background checker: products checked per round, and seconds between rounds.
+# New products without a schedule are spread over SCHEDULE_SPREAD seconds.
+SCHEDULER_BATCH_SIZE = 50
+SCHEDULER_POLL_SECONDS = 60
+SCHEDULE_SPREAD = 10 * 60
+
+
+def is_near_target(price, target_price):
+    """True if `price` is within NEAR_TARGET_RATIO of `target_price`."""
+    try:
+        target = float(target_price)
+    except (TypeError, ValueError):
+        return False
+    if price is None or target <= 0:
+        return False
+    return abs(price - target) / target <= NEAR_TARGET_RATIO
+
+
+def next_interval(interval, changed, near_target=False):
+    """Return the new check interval after a successful check."""
+    interval = interval or DEFAULT_CHECK_INTERVAL
+    interval *= CHANGED_FACTOR if changed else UNCHANGED_FACTOR
+    interval = max(MIN_CHECK_INTERVAL, min(MAX_CHECK_INTERVAL, interval))
+    if near_target:
+        interval = min(interval, NEAR_TARGET_INTERVAL)
+    return int(interval)
+
+
+def jittered(seconds):
+    return int(seconds * random.uniform(1 - INTERVAL_JITTER, 1 + INTERVAL_JITTER))
+
+
+def reschedule(product, result, previous_price=None, writer=None):
+    """
+    Set a product's next check time from the result of a check
+    (as returned by tracker.check_product). `previous_price` is the last
+    recorded price before this check. With a db.PriceWriter as `writer`
+    the update is buffered there, with the check's price. Returns the new
+    interval.
+    """
+    save = writer.schedule if writer is not None else set_next_check
+    interval = product["check_interval"] if "check_interval" in product.keys() else None
+    interval = interval or DEFAULT_CHECK_INTERVAL
+
+    if result["error"]:
+        save(product["id"], interval, jittered(min(interval, ERROR_RETRY_INTERVAL)))
+        return interval
+
+    price = result["price"]
+    if result["unchanged"]:
+        changed = False
+        price = previous_price
+    else:
+        changed = previous_price is not None and price != previous_price
+
+    interval = next_interval(interval, changed, is_near_target(price, product["target_price"]))
+    save(product["id"], interval, jittered(interval))
+    return interval
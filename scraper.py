@@ -1,14 +1,16 @@
 # scraper.py
+import codecs
+import os
 import requests
 import time
 import random
 import threading
 import concurrent.futures
-from bs4 import BeautifulSoup
+from urllib.parse import urlparse
 
-
-class ScraperError(Exception):
-    pass
+from ratelimit import rate_limiter
+from session_pool import SessionPool
+from stores import ADAPTERS, ScraperError, extract_price_number, get_adapter, store_of
 
 
 HEADERS = {
@@ -51,14 +53,12 @@ USER_AGENTS = [
 # - Flipkart
 # - Myntra
 #
-# Note: Websites frequently change their HTML structure, so these scrapers
-# are best-effort implementations and may need updates over time.
-
+# Page parsing lives in the store adapters in stores.py; this module does
+# the fetching and exposes the functions used by the app and tracker.
 
-def create_realistic_session(url: str):
-    """Create a requests session with realistic browser-like behavior."""
-    session = requests.Session()
 
+def seed_session_identity(session, url: str):
+    """Seed a session with cookies that look like a real browsing session."""
     if "amazon" in url.lower():
         # Set realistic cookies that look like a real browsing session
         session.cookies.set("session-id", f"{random.randint(100, 999)}-{'-'.join(str(random.randint(1000, 9999)) for _ in range(4))}", domain=".amazon.in")
@@ -73,6 +73,12 @@ def create_realistic_session(url: str):
         session.cookies.set("AMCVS_17EB401053DAF4840A490D4C%40AdobeOrg", "1", domain=".flipkart.com")
         session.cookies.set("AMCV_17EB401053DAF4840A490D4C%40AdobeOrg", "179643557%7CMCIDTS%7C19917%7CMCMID%7C1234567890%7CMCAAMLH-1234567890%7C9%7CMCAAMB-1234567890%7C6G1ynYcLPuiQxYZrsz_pkqfLG9yMXBpb2zX5dvJdYQJzPXImdj0y%7CMCOPTOUT-1234567890s%7CNONE%7CMCAID%7CNONE", domain=".flipkart.com")
 
+
+def create_realistic_session(url: str):
+    """Create a requests session with realistic browser-like behavior."""
+    session = requests.Session()
+    seed_session_identity(session, url)
+
     # Set up session with proper SSL verification and redirects
     session.max_redirects = 5
     session.verify = True
@@ -80,6 +86,43 @@ def create_realistic_session(url: str):
     return session
 
 
+# Persistent sessions shared by all fetches, one per store
+session_pool = SessionPool(seed_session_identity)
+
+
+def session_key(url: str) -> str:
+    """Key used to pick a pooled session: the store name, or the host."""
+    return store_of(url) or urlparse(url.lower()).hostname or url.lower()
+
+
+# Host override: when set (e.g. "http://127.0.0.1:8765"), every request is
+# sent to that server instead, with the original host as the first path
+# segment: https://www.amazon.in/dp/X -> http://127.0.0.1:8765/www.amazon.in/dp/X
+# Rate limits, sessions and store detection still use the original URL.
+# Used to load-test against stub_store.py.
+HOST_OVERRIDE = os.environ.get("SCRAPER_HOST_OVERRIDE")
+
+
+def set_host_override(base_url):
+    global HOST_OVERRIDE
+    HOST_OVERRIDE = base_url.rstrip("/") if base_url else None
+
+
+def apply_host_override(url: str) -> str:
+    if not HOST_OVERRIDE:
+        return url
+    parts = urlparse(url)
+    rewritten = f"{HOST_OVERRIDE.rstrip('/')}/{parts.hostname}{parts.path or '/'}"
+    if parts.query:
+        rewritten += "?" + parts.query
+    return rewritten
+
+
+def get_session_stats() -> dict:
+    """Connection reuse statistics of the pooled sessions."""
+    return session_pool.get_stats()
+
+
 def simulate_human_behavior():
     """Add random delays and mouse movements to simulate human behavior."""
     # Random delay between actions (like a human reading/thinking)
@@ -89,22 +132,122 @@ def simulate_human_behavior():
     # In a real browser, this would happen naturally
 
 
+# Streaming mode: product pages are read in chunks and the download stops
+# once the regions the store adapter needs have arrived (see
+# StoreAdapter.stream_markers). Full downloads are used as a fallback.
+STREAMING_ENABLED = os.environ.get("SCRAPER_STREAMING", "1") != "0"
+STREAM_CHUNK_SIZE = 16 * 1024
+# How much more to read after the last marker, so the elements around it
+# are complete before we stop
+STREAM_TAIL_CHARS = 64 * 1024
+
+fetch_stats = {
+    "pages": 0,
+    "streamed": 0,
+    "truncated": 0,
+    "not_modified": 0,
+    "unchanged_hash": 0,
+    "chars_read": 0,
+    "retries": 0,
+}
+_fetch_stats_lock = threading.Lock()
+
+
+def _count(**increments):
+    with _fetch_stats_lock:
+        for name, value in increments.items():
+            fetch_stats[name] = fetch_stats.get(name, 0) + value
+
+
+def get_fetch_stats() -> dict:
+    with _fetch_stats_lock:
+        return dict(fetch_stats)
+
+
+def read_streamed_body(resp, stop_markers):
+    """
+    Read a streamed response until every marker group has been seen plus
+    STREAM_TAIL_CHARS, then drop the rest of the body.
+    `stop_markers` is a list of tuples of alternatives; a group counts as
+    seen when any of its markers appears.
+    Returns (html, truncated).
+    """
+    decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+    overlap = max(len(m) for group in stop_markers for m in group)
+    unseen = list(stop_markers)
+    parts = []
+    tail = ""
+    size = 0
+    stop_at = None
+    try:
+        for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+            text = decoder.decode(chunk)
+            parts.append(text)
+            size += len(text)
+            if unseen:
+                # Only scan the new text, plus an overlap for split markers
+                window = tail + text
+                unseen = [group for group in unseen if not any(m in window for m in group)]
+                tail = window[-overlap:]
+                if not unseen:
+                    stop_at = size + STREAM_TAIL_CHARS
+            if stop_at is not None and size >= stop_at:
+                return "".join(parts), True
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts), False
+    finally:
+        # Closing early gives up the connection, which is cheaper than
+        # downloading the rest of a multi-megabyte page
+        resp.close()
+
+
+def truncate_at_markers(html, stop_markers, tail=STREAM_TAIL_CHARS):
+    """
+    The prefix of `html` a streamed download would stop at, or None when
+    it would read the whole page. Used to replay streaming offline.
+    """
+    end = 0
+    for group in stop_markers:
+        positions = [pos + len(m) for m in group for pos in (html.find(m),) if pos >= 0]
+        if not positions:
+            return None
+        end = max(end, min(positions))
+    if end + tail >= len(html):
+        return None
+    return html[:end + tail]
+
+
 def fetch_html(url: str) -> str:
     """Download HTML of the given product URL with advanced anti-bot measures."""
-    # Create a session for persistent cookies and connection reuse
-    session = create_realistic_session(url)
+    return fetch_page(url)["html"]
 
-    # Add random delay to look more human-like (reduced for speed)
-    base_delay = random.uniform(1, 3)  # Reduced from 2-8 to 1-3 seconds
-    # Add extra delay during business hours (reduced)
-    current_hour = time.localtime().tm_hour
-    if 9 <= current_hour <= 17:  # Business hours
-        base_delay *= 1.2  # Reduced from 1.5x to 1.2x
-    time.sleep(base_delay)
+
+def fetch_page(url: str, stop_markers=None, validators=None) -> dict:
+    """
+    Download a page. With `stop_markers` the body is streamed and the
+    download stops early once they've been seen. `validators` is a dict
+    with the 'etag'/'last_modified' of a previous fetch; they are sent as
+    If-None-Match/If-Modified-Since so stores that support it can answer
+    304 Not Modified.
+    Returns dict with 'html', 'truncated', 'not_modified', 'etag' and
+    'last_modified'.
+    """
+    # Pooled per-store session for persistent cookies and connection reuse
+    key = session_key(url)
+    stream = bool(stop_markers)
+
+    # Where the request actually goes (the stub storefront in load tests)
+    request_url = apply_host_override(url)
 
     max_retries = 5  # Increased retries
     for attempt in range(max_retries):
+        if attempt:
+            _count(retries=1)
         try:
+            # Every attempt, including retries, waits for the host's
+            # shared rate limiter instead of sleeping on its own
+            rate_limiter.acquire(url)
+
             # Rotate user agents
             request_headers = HEADERS.copy()
             request_headers["User-Agent"] = random.choice(USER_AGENTS)
@@ -153,13 +296,49 @@ def fetch_html(url: str) -> str:
                     "",
                 ])
 
-            resp = session.get(url, headers=request_headers, timeout=30)
+            # Conditional request, for stores that honour it
+            if validators:
+                if validators.get("etag"):
+                    request_headers["If-None-Match"] = validators["etag"]
+                if validators.get("last_modified"):
+                    request_headers["If-Modified-Since"] = validators["last_modified"]
+
+            session = session_pool.get(key, url)
+            resp = session.get(request_url, headers=request_headers, timeout=30, stream=stream)
+            if resp.status_code != 200:
+                _count(**{f"http_{resp.status_code}": 1})
+                if stream:
+                    resp.close()
 
             if resp.status_code == 200:
-                return resp.text or ''
+                if stream:
+                    html, truncated = read_streamed_body(resp, stop_markers)
+                    _count(pages=1, streamed=1, truncated=int(truncated), chars_read=len(html))
+                else:
+                    html = resp.text or ''
+                    truncated = False
+                    _count(pages=1, chars_read=len(html))
+                return {
+                    "html": html,
+                    "truncated": truncated,
+                    "not_modified": False,
+                    "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified"),
+                }
+            elif resp.status_code == 304 and validators:
+                _count(pages=1, not_modified=1)
+                return {
+                    "html": None,
+                    "truncated": False,
+                    "not_modified": True,
+                    "etag": resp.headers.get("ETag") or validators.get("etag"),
+                    "last_modified": resp.headers.get("Last-Modified") or validators.get("last_modified"),
+                }
             elif resp.status_code == 403:
                 # 403 Forbidden - site is blocking us
                 if attempt < max_retries - 1:
+                    # Start over with a fresh cookie identity for this store
+                    session_pool.rotate(key, url)
                     # Wait longer and try again with different user agent (reduced for speed)
                     wait_time = random.uniform(5, 10) * (attempt + 1)  # Reduced from 10-20 to 5-10 seconds
                     print(f"403 blocked, retrying in {wait_time:.1f} seconds...")
@@ -196,6 +375,8 @@ def fetch_html(url: str) -> str:
                 continue
             raise ScraperError(f"Network error: {e}")
 
+    raise ScraperError(f"Failed to fetch page - server errors after {max_retries} attempts")
+
 
 def test_scraper_bypass():
     """Test if our anti-bot measures work against blocking sites."""
@@ -219,65 +400,13 @@ def test_scraper_bypass():
         except Exception as e:
             print(f"❌ {site_name}: Unexpected error - {e}")
 
-        # Small delay between tests
-        import time
-        time.sleep(2)
-
-
-def extract_price_number(text: str) -> float:
-    """
-    Clean a price string like '₹ 13,999.00' -> 13999.00
-    """
-    cleaned = ""
-    for ch in text:
-        if ch.isdigit() or ch == ".":
-            cleaned += ch
-
-    if not cleaned:
-        raise ScraperError(f"Could not parse price from: {text!r}")
-
-    return float(cleaned)
-
 
 def get_price_amazon(url: str) -> float:
     """
     Extract price from an Amazon / Amazon.in product page.
     NOTE: Amazon HTML can change any time, this is a best-effort demo.
     """
-    html = fetch_html(url)
-    if not html:
-        raise ScraperError("No HTML content received from Amazon")
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Try multiple common selectors used by Amazon
-    selectors = [
-        "#corePriceDisplay_desktop_feature_div .a-price-whole",
-        "#corePrice_feature_div .a-price .a-offscreen",
-        "#priceblock_ourprice",
-        "#priceblock_dealprice",
-        ".a-price .a-offscreen",
-        ".a-price-whole",
-        ".a-color-price",
-        "#price_inside_buybox",
-        ".a-price span[aria-hidden='true']",
-    ]
-
-    for sel in selectors:
-        el = soup.select_one(sel)
-        if el and el.get_text(strip=True):
-            text = el.get_text(strip=True)
-            return extract_price_number(text)
-
-    # Try to find any element containing ₹ followed by numbers
-    import re
-    price_pattern = r'₹\s*[\d,]+\.?\d*'
-    all_text = soup.get_text()
-    matches = re.findall(price_pattern, all_text)
-    if matches:
-        # Take the first price found
-        return extract_price_number(matches[0])
-
-    raise ScraperError("Could not find price on Amazon page")
+    return get_product_snapshot(url, "amazon")["price"]
 
 
 def get_price_flipkart(url: str) -> float:
@@ -285,75 +414,14 @@ def get_price_flipkart(url: str) -> float:
     Extract price from a Flipkart product page.
     NOTE: Flipkart often changes CSS classes, so we try multiple known patterns.
     """
-    html = fetch_html(url)
-    if not html:
-        raise ScraperError("No HTML content received from Flipkart")
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Try multiple possible price locations (detail page & offers)
-    selectors = [
-        "div._30jeq3._16Jk6d",  # classic product price
-        "div._19_Y9G._8XxizX",  # "Special Price" block
-        "div._19_Y9G._1PLdiu",  # "Selling Price" block
-        "div._30jeq3",  # general price class
-        "span._30jeq3",  # price span
-        "div.Nx9bqj",  # newer price class
-    ]
+    return get_product_snapshot(url, "flipkart")["price"]
 
-    for sel in selectors:
-        el = soup.select_one(sel)
-        if el and el.get_text(strip=True):
-            text = el.get_text(strip=True)
-            return extract_price_number(text)
-
-    # If still not found, try any element that looks like a ₹ price
-    # as a last fallback (for new layouts)
-    possible_prices = soup.find_all(string=lambda s: s and "₹" in s and len(s.strip()) < 20)  # avoid long texts
-    for txt in possible_prices:
-        # Skip if it contains words like "off", "cashback", etc.
-        if any(word in txt.lower() for word in ['off', 'cashback', 'fee', 'up to']):
-            continue
-        try:
-            return extract_price_number(txt)
-        except ScraperError:
-            continue
 
 def get_price_myntra(url: str) -> float:
     """
     Extract price from a Myntra product page.
     """
-    html = fetch_html(url)
-    if not html:
-        raise ScraperError("No HTML content received from Myntra")
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Try common Myntra price selectors (updated for current layout)
-    selectors = [
-        "span.pdp-price",  # Main price
-        "span.pdp-mrp",    # MRP if discounted
-        "div.price-container span",  # Alternative
-        ".price-heading",  # New price class
-        ".pdp-price",      # Price container
-        "[data-price]",    # Data attribute
-        ".price",          # Generic price
-    ]
-
-    for sel in selectors:
-        el = soup.select_one(sel)
-        if el and el.get_text(strip=True):
-            text = el.get_text(strip=True)
-            return extract_price_number(text)
-
-    # Try to find any element containing ₹ followed by numbers
-    import re
-    price_pattern = r'₹\s*[\d,]+\.?\d*'
-    all_text = soup.get_text()
-    matches = re.findall(price_pattern, all_text)
-    if matches:
-        # Take the first price found (usually the main price)
-        return extract_price_number(matches[0])
-
-    raise ScraperError("Could not find price on Myntra page")
+    return get_product_snapshot(url, "myntra")["price"]
 
 
 def search_single_store(store_name, search_url_template, product_name, exclude_store):
@@ -365,66 +433,20 @@ def search_single_store(store_name, search_url_template, product_name, exclude_s
         search_url = search_url_template.format(product_name.replace(' ', '+'))
         print(f"Searching {store_name} for: {product_name}")
         
-        # Get search results
+        # Get search results and parse them once with the store's adapter
+        adapter = get_adapter(store_name)
+        if adapter is None:
+            raise ScraperError(f"Store '{store_name}' is not supported yet in scraper")
         html = fetch_html(search_url)
-        if not html:
-            raise ScraperError(f"No HTML content received from {store_name}")
-        soup = BeautifulSoup(html, "html.parser")
-        
-        product_url = None
-        product_name_found = None
-        product_price = None
+        found = adapter.parse_search(html)
         
-        if store_name == "amazon":
-            # Find first product link
-            link_elem = soup.select_one("a.a-link-normal.s-no-outline")
-            if link_elem and link_elem.get("href"):
-                product_url = "https://www.amazon.in" + link_elem["href"]
-                # Try to get name and price
-                title_elem = link_elem.select_one("h2.a-size-mini")
-                if title_elem:
-                    product_name_found = title_elem.get_text(strip=True)
-                price_elem = link_elem.select_one(".a-price-whole")
-                if price_elem:
-                    price_text = price_elem.get_text(strip=True).replace(',', '')
-                    try:
-                        product_price = float(price_text)
-                    except ValueError:
-                        pass
-                        
-        elif store_name == "flipkart":
-            # Find first product
-            product_elem = soup.select_one("a[href*='/p/']")
-            if product_elem:
-                href = product_elem.get("href")
-                if href.startswith('/'):
-                    product_url = "https://www.flipkart.com" + href
-                else:
-                    product_url = href
-                    
-                # Try to get name and price
-                name_elem = product_elem.select_one("div.RG5Slk")
-                if name_elem:
-                    product_name_found = name_elem.get_text(strip=True)
-                # Find price element containing ₹ symbol
-                price_elems = product_elem.select("div.HZ0E6r.Rm9_cy")
-                for price_elem in price_elems:
-                    price_text = price_elem.get_text(strip=True)
-                    if '₹' in price_text:
-                        price_text = price_text.replace('₹', '').replace(',', '')
-                        try:
-                            product_price = float(price_text)
-                            break
-                        except ValueError:
-                            pass
-        
-        if product_url:
-            print(f"Found product on {store_name}: {product_url}")
+        if found:
+            print(f"Found product on {store_name}: {found['url']}")
             return {
-                "name": product_name_found or f"{product_name} ({store_name.title()})",
+                "name": found["name"] or f"{product_name} ({store_name.title()})",
                 "store": store_name,
-                "url": product_url,
-                "estimated_price": product_price
+                "url": found["url"],
+                "estimated_price": found["price"]
             }
         else:
             print(f"No product found on {store_name}")
@@ -453,12 +475,10 @@ def search_similar_products(product_name, exclude_store=None, fast_mode=True):
         exclude_store: Store to exclude from search (optional)
         fast_mode: If True, uses parallel processing for faster results
     """
-    base_name = product_name.lower().strip()
-    
     # Define stores to search
     stores = [
-        ("amazon", "https://www.amazon.in/s?k={}&ref=sr_pg_1"),
-        ("flipkart", "https://www.flipkart.com/search?q={}&page=1")
+        (name, ADAPTERS[name].search_url)
+        for name in ("amazon", "flipkart")
     ]
     
     if fast_mode:
@@ -479,175 +499,90 @@ def search_similar_products(product_name, exclude_store=None, fast_mode=True):
                     
         return similar_products
     else:
-        # Original sequential processing (slower but more reliable for debugging)
+        # Sequential processing (slower but more reliable for debugging)
         similar_products = []
-        
         for store_name, search_url_template in stores:
-            if exclude_store == store_name:
-                continue
-                
-            try:
-                search_url = search_url_template.format(product_name.replace(' ', '+'))
-                print(f"Searching {store_name} for: {product_name}")
-                
-                # Get search results
-                html = fetch_html(search_url)
-                if not html:
-                    raise ScraperError(f"No HTML content received from {store_name}")
-                soup = BeautifulSoup(html, "html.parser")
-                
-                product_url = None
-                product_name_found = None
-                product_price = None
-                
-                if store_name == "amazon":
-                    # Find first product link
-                    link_elem = soup.select_one("a.a-link-normal.s-no-outline")
-                    if link_elem and link_elem.get("href"):
-                        product_url = "https://www.amazon.in" + link_elem["href"]
-                        # Try to get name and price
-                        title_elem = link_elem.select_one("h2.a-size-mini")
-                        if title_elem:
-                            product_name_found = title_elem.get_text(strip=True)
-                        price_elem = link_elem.select_one(".a-price-whole")
-                        if price_elem:
-                            price_text = price_elem.get_text(strip=True).replace(',', '')
-                            try:
-                                product_price = float(price_text)
-                            except ValueError:
-                                pass
-                                
-                elif store_name == "flipkart":
-                    # Find first product
-                    product_elem = soup.select_one("a[href*='/p/']")
-                    if product_elem:
-                        href = product_elem.get("href")
-                        if href.startswith('/'):
-                            product_url = "https://www.flipkart.com" + href
-                        else:
-                            product_url = href
-                            
-                        # Try to get name and price
-                        name_elem = product_elem.select_one("div.RG5Slk")
-                        if name_elem:
-                            product_name_found = name_elem.get_text(strip=True)
-                        # Find price element containing ₹ symbol
-                        price_elems = product_elem.select("div.HZ0E6r.Rm9_cy")
-                        for price_elem in price_elems:
-                            price_text = price_elem.get_text(strip=True)
-                            if '₹' in price_text:
-                                price_text = price_text.replace('₹', '').replace(',', '')
-                                try:
-                                    product_price = float(price_text)
-                                    break
-                                except ValueError:
-                                    pass
-                                
-                if product_url:
-                    similar_products.append({
-                        "name": product_name_found or f"{product_name} ({store_name.title()})",
-                        "store": store_name,
-                        "url": product_url,
-                        "estimated_price": product_price
-                    })
-                    print(f"Found product on {store_name}: {product_url}")
-                else:
-                    print(f"No product found on {store_name}")
-                    
-            except ScraperError as e:
-                if "403" in str(e) or "forbidden" in str(e).lower():
-                    print(f"Skipping {store_name} - site is blocking requests")
-                else:
-                    print(f"Error searching {store_name}: {e}")
-            except Exception as e:
-                print(f"Unexpected error searching {store_name}: {e}")
-        
+            result = search_single_store(store_name, search_url_template, product_name, exclude_store)
+            if result:
+                similar_products.append(result)
         return similar_products
 
 
+def get_product_snapshot(url: str, store: str, validators=None, last_hash=None) -> dict:
+    """
+    Fetch a product page once and extract everything from it in one parse.
+    Returns dict with 'name', 'price', 'mrp', 'available', 'store', plus
+    'etag', 'last_modified' and 'content_hash' for the next check.
+
+    With `validators` (from the last fetch) and `last_hash` (the last price
+    region fingerprint, see StoreAdapter.fingerprint) an unchanged page is
+    recognised, without parsing it on a 304; the snapshot then has
+    'unchanged' set and no page fields.
+    """
+    adapter = get_adapter(store)
+    if adapter is None or not adapter.supports_price:
+        # You can add more store-specific parsers in stores.py
+        raise ScraperError(f"Store '{store}' is not supported yet in scraper. Supported stores: Amazon, Flipkart, Myntra")
+
+    stop_markers = adapter.stream_markers if STREAMING_ENABLED else None
+    page = fetch_page(url, stop_markers=stop_markers, validators=validators)
+    state = {
+        "etag": page["etag"],
+        "last_modified": page["last_modified"],
+        "content_hash": last_hash,
+        "unchanged": True,
+    }
+    if page["not_modified"]:
+        return dict(state, name=None, price=None, mrp=None, available=None, store=adapter.name)
+
+    snapshot = None
+    if page["truncated"]:
+        try:
+            snapshot = adapter.parse_product(page["html"], targeted=True)
+        except ScraperError as e:
+            print(f"Targeted parse failed ({e}), fetching full page")
+            page = fetch_page(url)
+    if snapshot is None:
+        snapshot = adapter.parse_product(page["html"])
+
+    state["content_hash"] = snapshot.pop("fingerprint")
+    if last_hash and state["content_hash"] == last_hash:
+        _count(unchanged_hash=1)
+        return dict(state, name=None, price=None, mrp=None, available=None, store=adapter.name)
+    state["unchanged"] = False
+    snapshot.update(state)
+    return snapshot
+
+
 def get_price(url: str, store: str) -> float:
     """
     Main function used by tracker.py.
     store field should be something like: 'amazon', 'flipkart', 'myntra'
     """
-    s = (store or "").lower()
-
-    if "amazon" in s:
-        return get_price_amazon(url)
-    elif "flipkart" in s:
-        return get_price_flipkart(url)
-    elif "myntra" in s:
-        return get_price_myntra(url)
-    else:
-        # You can add more store-specific parsers here
-        raise ScraperError(f"Store '{store}' is not supported yet in scraper. Supported stores: Amazon, Flipkart, Myntra")
+    return get_product_snapshot(url, store)["price"]
 
 
 def detect_store(url: str) -> str:
     """Detect store from URL."""
-    url_lower = url.lower()
-    if "amazon" in url_lower:
-        return "amazon"
-    elif "flipkart" in url_lower:
-        return "flipkart"
-    elif "myntra" in url_lower:
-        return "myntra"
-    else:
+    adapter = get_adapter(url)
+    if adapter is None or not adapter.supports_price:
         raise ScraperError("Unsupported store URL")
+    return adapter.name
 
 
 def get_product_details(url: str) -> dict:
     """
     Extract product name and price from URL.
-    Returns dict with 'name', 'price', 'store'
+    Returns dict with 'name', 'price', 'store', 'url', 'mrp', 'available'
     """
     store = detect_store(url)
-    price = get_price(url, store)
-    
-    # Now extract name - need to modify each get_price function to also return name
-    # For now, let's add name extraction to each function
-    html = fetch_html(url)
-    soup = BeautifulSoup(html, "html.parser")
-    
-    name = None
-    if store == "amazon":
-        selectors = ["#productTitle", ".a-size-large.product-title-word-break"]
-        for sel in selectors:
-            el = soup.select_one(sel)
-            if el:
-                name = el.get_text(strip=True)
-                break
-    elif store == "flipkart":
-        el = soup.select_one("h1 span")
-        if el:
-            name = el.get_text(strip=True)
-    elif store == "myntra":
-        el = soup.select_one("h1.pdp-title")
-        if el:
-            name = el.get_text(strip=True)
-    elif store == "ajio":
-        el = soup.select_one("h1.prod-name")
-        if el:
-            name = el.get_text(strip=True)
-    elif store == "croma":
-        el = soup.select_one("h1.product-title")
-        if el:
-            name = el.get_text(strip=True)
-    elif store == "tatacliq":
-        el = soup.select_one("h1.product-name")
-        if el:
-            name = el.get_text(strip=True)
-    elif store == "reliancedigital":
-        el = soup.select_one("h1.product-title")
-        if el:
-            name = el.get_text(strip=True)
-    
-    if not name:
-        name = "Unknown Product"
+    snapshot = get_product_snapshot(url, store)
     
     return {
-        "name": name,
-        "price": price,
+        "name": snapshot["name"] or "Unknown Product",
+        "price": snapshot["price"],
         "store": store,
-        "url": url
+        "url": url,
+        "mrp": snapshot["mrp"],
+        "available": snapshot["available"],
     }
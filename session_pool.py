@@ -0,0 +1,125 @@
+# session_pool.py
+"""
+Long-lived HTTP sessions, one per store.
+
+Reusing a `requests.Session` keeps TCP/TLS connections alive between price
+checks instead of paying a handshake for every product. Each session has a
+bounded urllib3 connection pool, and its cookie identity is re-seeded
+periodically so a store sees a fresh "browser" from time to time without
+dropping the warm connections.
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Maximum number of connections kept open per host
+POOL_MAXSIZE = 10
+# Re-seed a store's cookie identity after this many seconds or requests
+IDENTITY_MAX_AGE = 30 * 60
+IDENTITY_MAX_REQUESTS = 200
+
+
+class SessionPool:
+    """Thread-safe pool of persistent sessions keyed by store."""
+
+    def __init__(self, seed_identity, pool_maxsize=POOL_MAXSIZE,
+                 identity_max_age=IDENTITY_MAX_AGE,
+                 identity_max_requests=IDENTITY_MAX_REQUESTS):
+        # seed_identity(session, url) sets the store specific cookies
+        self.seed_identity = seed_identity
+        self.pool_maxsize = pool_maxsize
+        self.identity_max_age = identity_max_age
+        self.identity_max_requests = identity_max_requests
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def _new_session(self, url):
+        session = requests.Session()
+        # pool_block makes threads wait for a free connection instead of
+        # opening (and then discarding) extra ones beyond pool_maxsize
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, pool_block=True)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.max_redirects = 5
+        session.verify = True
+        self.seed_identity(session, url)
+        return session
+
+    def get(self, key, url):
+        """Return the session for `key`, creating or re-seeding it as needed."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = {
+                    "session": self._new_session(url),
+                    "identity_since": now,
+                    "identity_requests": 0,
+                    "requests": 0,
+                    "rotations": 0,
+                }
+                self.entries[key] = entry
+            elif (now - entry["identity_since"] > self.identity_max_age
+                  or entry["identity_requests"] >= self.identity_max_requests):
+                self._rotate(entry, url, now)
+
+            entry["identity_requests"] += 1
+            entry["requests"] += 1
+            return entry["session"]
+
+    def _rotate(self, entry, url, now):
+        # Only the cookies change; the adapter and its connections are kept
+        session = entry["session"]
+        session.cookies.clear()
+        self.seed_identity(session, url)
+        entry["identity_since"] = now
+        entry["identity_requests"] = 0
+        entry["rotations"] += 1
+
+    def rotate(self, key, url):
+        """Force a new cookie identity for `key` (e.g. after being blocked)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                self._rotate(entry, url, time.time())
+
+    def close(self):
+        with self.lock:
+            for entry in self.entries.values():
+                entry["session"].close()
+            self.entries.clear()
+
+    def get_stats(self):
+        """
+        Per-store connection reuse numbers.
+
+        'connections' is the number of TCP connections urllib3 opened and
+        'http_requests' the number of requests sent over them, so
+        'reuse_rate' is the share of requests that didn't need a new
+        connection (and TLS handshake).
+        """
+        stats = {}
+        with self.lock:
+            for key, entry in self.entries.items():
+                connections = 0
+                http_requests = 0
+                adapters = {id(a): a for a in entry["session"].adapters.values()}
+                for adapter in adapters.values():
+                    pools = adapter.poolmanager.pools
+                    for pool_key in list(pools.keys()):
+                        pool = pools.get(pool_key)
+                        if pool is None:
+                            continue
+                        connections += pool.num_connections
+                        http_requests += pool.num_requests
+                reuse_rate = 1 - connections / http_requests if http_requests else 0.0
+                stats[key] = {
+                    "requests": entry["requests"],
+                    "http_requests": http_requests,
+                    "connections": connections,
+                    "reuse_rate": round(reuse_rate, 3),
+                    "identity_rotations": entry["rotations"],
+                }
+        return stats
@@ -0,0 +1,50 @@
+// Live price updates from /api/prices/events, patched into the page.
+//
+// Include with data-url set to the event stream of the page's products.
+// Each product's markup sits in an element with data-product-id; inside
+// it, elements with data-live="<field>" show that field of the update:
+//
+//   data-digits="N"        money with N decimals (₹1,299)
+//   data-format="change"   ▼/▲ amount (and drop %), hidden when unchanged
+//   data-format="flag"     shown only while the field is true
+//
+// Containers get data-price set and briefly the class "live-updated".
+// A "price-update" event is dispatched on document for page-specific
+// work (best price, chart) with the update as its detail.
+(function () {
+  const script = document.currentScript;
+  const money = (value, digits) => "₹" + Number(value).toLocaleString("en-IN", {
+    minimumFractionDigits: digits, maximumFractionDigits: digits});
+
+  function show(node, update) {
+    const value = update[node.dataset.live];
+    if (node.dataset.format === "flag") {
+      node.hidden = !value;
+    } else if (node.dataset.format === "change") {
+      node.hidden = !value;
+      if (!value) return;
+      node.className = value < 0 ? "price-down" : "price-up";
+      let text = (value < 0 ? "▼" : "▲") + " " + money(Math.abs(value), 0);
+      if (update.drop_pct !== null) text += " (" + Math.abs(update.drop_pct).toFixed(1) + "%)";
+      node.textContent = text;
+    } else if (value !== null && value !== undefined) {
+      node.textContent = "digits" in node.dataset ? money(value, +node.dataset.digits) : value;
+      node.hidden = false;
+    }
+  }
+
+  function patch(update) {
+    document.querySelectorAll('[data-product-id="' + update.product_id + '"]').forEach((container) => {
+      container.dataset.price = update.price;
+      container.querySelectorAll("[data-live]").forEach((node) => show(node, update));
+      container.classList.add("live-updated");
+      setTimeout(() => container.classList.remove("live-updated"), 2000);
+    });
+    document.dispatchEvent(new CustomEvent("price-update", {detail: update}));
+  }
+
+  if (!window.EventSource || !script.dataset.url) return;
+  const source = new EventSource(script.dataset.url);
+  source.addEventListener("price", (event) => JSON.parse(event.data).forEach(patch));
+  source.addEventListener("reload", () => { source.close(); location.reload(); });
+})();
@@ -0,0 +1,447 @@
+# stores.py
+"""
+Store adapters.
+
+Each adapter turns a single downloaded HTML document into everything we
+need from it - name, price, MRP and availability for product pages, or the
+first result for search pages - with exactly one parse per document.
+Network access lives in scraper.py; this module only parses.
+
+Note: Websites frequently change their HTML structure, so these selectors
+are best-effort and may need updates over time.
+"""
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from parsers import parse_html
+
+
+class ScraperError(Exception):
+    pass
+
+
+PRICE_PATTERN = re.compile(r'₹\s*[\d,]+\.?\d*')
+
+
+def extract_price_number(text: str) -> float:
+    """
+    Clean a price string like '₹ 13,999.00' -> 13999.00
+    """
+    cleaned = ""
+    for ch in text:
+        if ch.isdigit() or ch == ".":
+            cleaned += ch
+
+    if not cleaned:
+        raise ScraperError(f"Could not parse price from: {text!r}")
+
+    return float(cleaned)
+
+
+class StoreAdapter:
+    """
+    Base adapter. Subclasses list their CSS selectors; the shared
+    `parse_product` walks them over one parsed document. Documents come
+    from the configured parser engine (see parsers.py); pass `engine` to
+    force a specific one.
+    """
+    name = None
+    label = None
+    base_url = None
+    search_url = None
+    title_selectors = []
+    price_selectors = []
+    mrp_selectors = []
+    availability_selectors = []
+    unavailable_markers = ["currently unavailable", "out of stock", "sold out"]
+    # Raw HTML snippets that show the title and price regions have been
+    # downloaded. Each entry is a tuple of alternatives. Used to stop
+    # streamed downloads early; empty means always download everything.
+    stream_markers = []
+    # Regex over the URL path whose first group is the store's id of the
+    # product (see url_key)
+    url_key_pattern = None
+    # Query parameters that pick a variant with a price of its own; part of
+    # the key when present
+    url_key_params = ()
+
+    @property
+    def supports_price(self):
+        return bool(self.price_selectors)
+
+    def parse(self, html, engine=None):
+        if not html:
+            raise ScraperError(f"No HTML content received from {self.label}")
+        return parse_html(html, engine)
+
+    def parse_product(self, html, engine=None, targeted=False) -> dict:
+        """
+        Build a product snapshot from one product page.
+        Returns dict with 'name', 'price', 'mrp', 'available', 'store'.
+
+        `targeted` is for partial documents from a streamed download: only
+        the selectors are tried, and the whole-page text fallbacks are
+        skipped so the caller can retry with the full page instead.
+        """
+        doc = self.parse(html, engine)
+        return {
+            "name": self.find_name(doc),
+            "price": self.find_price(doc, targeted),
+            "mrp": self.find_mrp(doc),
+            "available": self.find_availability(doc),
+            "store": self.name,
+            "fingerprint": self.fingerprint(doc),
+        }
+
+    def first_text(self, doc, selectors):
+        for sel in selectors:
+            el = doc.select_one(sel)
+            if el:
+                text = el.text()
+                if text:
+                    return text
+        return None
+
+    def price_selector_hit(self, doc):
+        """The first price selector with text on the page, or None."""
+        for sel in self.price_selectors:
+            el = doc.select_one(sel)
+            if el and el.text():
+                return sel
+        return None
+
+    def find_name(self, doc):
+        return self.first_text(doc, self.title_selectors)
+
+    def find_price(self, doc, targeted=False) -> float:
+        text = self.first_text(doc, self.price_selectors)
+        if text:
+            return extract_price_number(text)
+        if targeted:
+            raise ScraperError(f"Price not found in the targeted part of the {self.label} page")
+        return self.fallback_price(doc)
+
+    def fallback_price(self, doc) -> float:
+        raise ScraperError(f"Could not find price on {self.label} page")
+
+    def find_mrp(self, doc):
+        text = self.first_text(doc, self.mrp_selectors)
+        if text:
+            try:
+                return extract_price_number(text)
+            except ScraperError:
+                pass
+        return None
+
+    def find_availability(self, doc):
+        """True/False when the page says so, None when it can't be told."""
+        text = self.first_text(doc, self.availability_selectors)
+        if text is None:
+            return None
+        text = text.lower()
+        return not any(marker in text for marker in self.unavailable_markers)
+
+    def fingerprint(self, doc):
+        """
+        Hash of the text of the title, price, MRP and availability elements
+        of a parsed page, so a check can tell the price region hasn't
+        changed. None when the page has no price element.
+        """
+        price = self.first_text(doc, self.price_selectors)
+        if price is None:
+            return None
+        digest = hashlib.sha1()
+        for selectors in (self.title_selectors, self.mrp_selectors, self.availability_selectors):
+            text = self.first_text(doc, selectors) or ""
+            digest.update(text.encode("utf-8", "replace") + b"\0")
+        digest.update(price.encode("utf-8", "replace"))
+        return digest.hexdigest()
+
+    def url_key(self, url):
+        """
+        '<store>:<product id>' for a product URL of this store, e.g.
+        'amazon:B0CHX1W1XY', followed by its url_key_params if it has any
+        ('flipkart:ITM6AC6485515AE4?pid=MOBGTAGPTB3VS24W'). None if the
+        URL has no recognizable id.
+        """
+        if not self.url_key_pattern:
+            return None
+        parts = urlsplit(url)
+        match = re.search(self.url_key_pattern, parts.path, re.IGNORECASE)
+        if not match:
+            return None
+        key = f"{self.name}:{match.group(1).upper()}"
+        params = dict(parse_qsl(parts.query))
+        variant = [(name, params[name].upper()) for name in self.url_key_params if params.get(name)]
+        return f"{key}?{urlencode(variant)}" if variant else key
+
+    def parse_search(self, html, engine=None):
+        """
+        Find the first product on a search results page.
+        Returns dict with 'url', 'name', 'price' (name/price may be None), or None.
+        """
+        raise ScraperError(f"Searching {self.label} is not supported")
+
+
+class AmazonAdapter(StoreAdapter):
+    name = "amazon"
+    label = "Amazon"
+    base_url = "https://www.amazon.in"
+    search_url = "https://www.amazon.in/s?k={}&ref=sr_pg_1"
+    title_selectors = ["#productTitle", ".a-size-large.product-title-word-break"]
+    # Try multiple common selectors used by Amazon
+    price_selectors = [
+        "#corePriceDisplay_desktop_feature_div .a-price-whole",
+        "#corePrice_feature_div .a-price .a-offscreen",
+        "#priceblock_ourprice",
+        "#priceblock_dealprice",
+        ".a-price .a-offscreen",
+        ".a-price-whole",
+        ".a-color-price",
+        "#price_inside_buybox",
+        ".a-price span[aria-hidden='true']",
+    ]
+    mrp_selectors = [
+        "#corePriceDisplay_desktop_feature_div .basisPrice .a-offscreen",
+        ".basisPrice .a-offscreen",
+        "span.a-price.a-text-price .a-offscreen",
+    ]
+    availability_selectors = ["#availability"]
+    # ASIN: /dp/<ASIN>, /gp/product/<ASIN>, /gp/aw/d/<ASIN>, with or without a slug before it
+    url_key_pattern = r"/(?:dp|gp/product|gp/aw/d)/([A-Z0-9]{10})(?:[/?]|$)"
+    stream_markers = [
+        ('id="productTitle"', 'product-title-word-break'),
+        ('id="corePriceDisplay_desktop_feature_div"', 'id="corePrice_feature_div"',
+         'id="priceblock_ourprice"', 'id="priceblock_dealprice"'),
+    ]
+
+    def fallback_price(self, doc) -> float:
+        # Try to find any element containing ₹ followed by numbers
+        matches = PRICE_PATTERN.findall(doc.full_text())
+        if matches:
+            # Take the first price found
+            return extract_price_number(matches[0])
+        raise ScraperError("Could not find price on Amazon page")
+
+    def parse_search(self, html, engine=None):
+        doc = self.parse(html, engine)
+        # Find first product link
+        link_elem = doc.select_one("a.a-link-normal.s-no-outline")
+        if not (link_elem and link_elem.attr("href")):
+            return None
+
+        result = {"url": self.base_url + link_elem.attr("href"), "name": None, "price": None}
+        # Try to get name and price
+        title_elem = link_elem.select_one("h2.a-size-mini")
+        if title_elem:
+            result["name"] = title_elem.text()
+        price_elem = link_elem.select_one(".a-price-whole")
+        if price_elem:
+            price_text = price_elem.text().replace(',', '')
+            try:
+                result["price"] = float(price_text)
+            except ValueError:
+                pass
+        return result
+
+
+class FlipkartAdapter(StoreAdapter):
+    name = "flipkart"
+    label = "Flipkart"
+    base_url = "https://www.flipkart.com"
+    search_url = "https://www.flipkart.com/search?q={}&page=1"
+    title_selectors = ["h1 span"]
+    # Flipkart often changes CSS classes, so we try multiple known patterns
+    price_selectors = [
+        "div._30jeq3._16Jk6d",  # classic product price
+        "div._19_Y9G._8XxizX",  # "Special Price" block
+        "div._19_Y9G._1PLdiu",  # "Selling Price" block
+        "div._30jeq3",  # general price class
+        "span._30jeq3",  # price span
+        "div.Nx9bqj",  # newer price class
+    ]
+    mrp_selectors = ["div._3I9_wc._2p6lqe", "div.yRaY8j"]
+    availability_selectors = ["div._16FRp0", "div.Z8JjpR"]
+    # Item id: /<slug>/p/itm<id>; ?pid= picks a variant (color, storage)
+    # of the item, which has its own price
+    url_key_pattern = r"/p/(itm[0-9a-z]+)"
+    url_key_params = ("pid",)
+    stream_markers = [
+        ("<h1",),
+        ("_30jeq3", "Nx9bqj", "_19_Y9G"),
+    ]
+
+    def fallback_price(self, doc) -> float:
+        # If still not found, try any element that looks like a ₹ price
+        # as a last fallback (for new layouts)
+        possible_prices = [s for s in doc.strings() if s and "₹" in s and len(s.strip()) < 20]  # avoid long texts
+        for txt in possible_prices:
+            # Skip if it contains words like "off", "cashback", etc.
+            if any(word in txt.lower() for word in ['off', 'cashback', 'fee', 'up to']):
+                continue
+            try:
+                return extract_price_number(txt)
+            except ScraperError:
+                continue
+        raise ScraperError("Could not find price on Flipkart page")
+
+    def find_availability(self, doc):
+        # Flipkart only renders these blocks when the item can't be bought
+        text = self.first_text(doc, self.availability_selectors)
+        if text is None:
+            return True if doc.select_one("button._2KpZ6l._2U9uOA") else None
+        return not any(marker in text.lower() for marker in self.unavailable_markers)
+
+    def parse_search(self, html, engine=None):
+        doc = self.parse(html, engine)
+        # Find first product
+        product_elem = doc.select_one("a[href*='/p/']")
+        if not product_elem:
+            return None
+
+        href = product_elem.attr("href")
+        result = {
+            "url": self.base_url + href if href.startswith('/') else href,
+            "name": None,
+            "price": None,
+        }
+        # Try to get name and price
+        name_elem = product_elem.select_one("div.RG5Slk")
+        if name_elem:
+            result["name"] = name_elem.text()
+        # Find price element containing ₹ symbol
+        for price_elem in product_elem.select("div.HZ0E6r.Rm9_cy"):
+            price_text = price_elem.text()
+            if '₹' in price_text:
+                price_text = price_text.replace('₹', '').replace(',', '')
+                try:
+                    result["price"] = float(price_text)
+                    break
+                except ValueError:
+                    pass
+        return result
+
+
+class MyntraAdapter(StoreAdapter):
+    name = "myntra"
+    label = "Myntra"
+    base_url = "https://www.myntra.com"
+    title_selectors = ["h1.pdp-title"]
+    # Try common Myntra price selectors (updated for current layout)
+    price_selectors = [
+        "span.pdp-price",  # Main price
+        "span.pdp-mrp",    # MRP if discounted
+        "div.price-container span",  # Alternative
+        ".price-heading",  # New price class
+        ".pdp-price",      # Price container
+        "[data-price]",    # Data attribute
+        ".price",          # Generic price
+    ]
+    mrp_selectors = ["span.pdp-mrp s", "span.pdp-mrp"]
+    availability_selectors = [".size-buttons-out-of-stock", "div.pdp-out-of-stock"]
+    # Style id: /<category>/<brand>/<slug>/<style id>/buy
+    url_key_pattern = r"/(\d+)(?:/buy)?/?$"
+    stream_markers = [
+        ("pdp-title",),
+        ("pdp-price",),
+    ]
+
+    def fallback_price(self, doc) -> float:
+        # Try to find any element containing ₹ followed by numbers
+        matches = PRICE_PATTERN.findall(doc.full_text())
+        if matches:
+            # Take the first price found (usually the main price)
+            return extract_price_number(matches[0])
+        raise ScraperError("Could not find price on Myntra page")
+
+    def find_availability(self, doc):
+        # The out-of-stock blocks are only present when sold out
+        if self.first_text(doc, self.availability_selectors):
+            return False
+        return True if doc.select_one(".pdp-add-to-bag") else None
+
+
+# Stores we can read the name from but don't extract prices for yet
+class AjioAdapter(StoreAdapter):
+    name = "ajio"
+    label = "Ajio"
+    title_selectors = ["h1.prod-name"]
+
+
+class CromaAdapter(StoreAdapter):
+    name = "croma"
+    label = "Croma"
+    title_selectors = ["h1.product-title"]
+
+
+class TataCliqAdapter(StoreAdapter):
+    name = "tatacliq"
+    label = "Tata CLiQ"
+    title_selectors = ["h1.product-name"]
+
+
+class RelianceDigitalAdapter(StoreAdapter):
+    name = "reliancedigital"
+    label = "Reliance Digital"
+    title_selectors = ["h1.product-title"]
+
+
+ADAPTERS = {}
+
+
+def register_adapter(adapter):
+    ADAPTERS[adapter.name] = adapter
+    return adapter
+
+
+for _adapter_class in (AmazonAdapter, FlipkartAdapter, MyntraAdapter,
+                       AjioAdapter, CromaAdapter, TataCliqAdapter, RelianceDigitalAdapter):
+    register_adapter(_adapter_class())
+
+
+def store_of(value: str):
+    """
+    Name of the store a store field ('Amazon.in'), host or URL belongs to,
+    e.g. 'amazon', or None for other stores. The one place stores are told
+    apart: adapters, sessions, rate limits and concurrency caps all use it.
+    """
+    s = (value or "").lower()
+    if "://" in s:
+        s = urlsplit(s).hostname or s
+    if s in ADAPTERS:
+        return s
+    return next((name for name in ADAPTERS if name in s), None)
+
+
+def get_adapter(store: str):
+    """Return the adapter for a store field like 'amazon' or 'Amazon.in' (or a URL), or None."""
+    return ADAPTERS.get(store_of(store))
+
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = re.compile(r"^(utm_.*|ref|ref_|tag|psc|smid|linkCode|linkId|fbclid|gclid|"
+                             r"affid|affExtParam\d*|lid|marketplace|srno|otracker\d*|iid|ssid|qH)$")
+
+
+def canonical_url_key(url: str, store: str = None) -> str:
+    """
+    Stable key of the product a URL points to, so variants of one product
+    URL (tracking parameters, slugs, mobile paths) are recognized as the
+    same product: '<store>:<product id>' for stores with an id in their
+    URLs (ASIN, Flipkart item id and variant, Myntra style id), otherwise
+    the URL with its host lowercased and fragment and tracking parameters
+    dropped.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    adapter = get_adapter(store) or get_adapter(host)
+    key = adapter.url_key(url) if adapter else None
+    if key:
+        return key
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not TRACKING_PARAMS.match(name))
+    path = parts.path.rstrip("/")
+    return f"{host}{path}?{urlencode(query)}" if query else f"{host}{path}"
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Local stub storefront for load-testing the tracker without touching real
+stores.
+
+Serves Amazon, Flipkart and Myntra shaped product pages (built from the
+pages in fixtures/) for any number of synthetic product URLs. Point the
+scraper at it with the host override, which keeps the original host as
+the first path segment:
+
+    python stub_store.py --port 8765 --latency 200 --error-429 0.02
+    SCRAPER_HOST_OVERRIDE=http://127.0.0.1:8765 python tracker.py
+
+    https://www.amazon.in/dp/B000000001  ->  /www.amazon.in/dp/B000000001
+
+Every product has a stable starting price derived from its URL. With
+--drift, each request has that probability of moving the price by a few
+percent. Pages carry an ETag of their price, so conditional requests work.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Fixture used as the template for each store's product page
+TEMPLATES = {
+    "amazon": "amazon_product.html",
+    "flipkart": "flipkart_product.html",
+    "myntra": "myntra_product.html",
+}
+
+
+def format_inr(value):
+    return f"{value:,}"
+
+
+class StubCatalog:
+    """Templates plus the current (drifting) price of every product."""
+
+    def __init__(self, drift=0.0, seed=0):
+        self.drift = drift
+        self.random = random.Random(seed)
+        self.prices = {}
+        self.lock = threading.Lock()
+        with open(os.path.join(FIXTURES_DIR, "manifest.json"), encoding="utf-8") as f:
+            manifest = {e["file"]: e for e in json.load(f)}
+        self.templates = {}
+        for store, name in TEMPLATES.items():
+            with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+                html = f.read()
+            expected = manifest[name]["expected"]
+            self.templates[store] = (html, expected["name"], int(expected["price"]))
+
+    def price_for(self, path):
+        with self.lock:
+            price = self.prices.get(path)
+            if price is None:
+                seed = int(hashlib.md5(path.encode()).hexdigest()[:8], 16)
+                price = 500 + seed % 50000
+            elif self.drift and self.random.random() < self.drift:
+                price = max(99, int(price * self.random.uniform(0.95, 1.05)))
+            self.prices[path] = price
+            return price
+
+    def render(self, store, path):
+        html, name, base_price = self.templates[store]
+        price = self.price_for(path)
+        product_id = [part for part in path.split("/") if part and part != "buy"][-1]
+        html = html.replace(name, f"{name} [{product_id}]")
+        if store == "amazon":
+            html = html.replace(format_inr(base_price), format_inr(price))
+        else:
+            html = html.replace(f"₹{format_inr(base_price)}", f"₹{format_inr(price)}")
+            html = html.replace(f"₹{base_price}", f"₹{price}")
+        return html, price
+
+
+def store_for_host(host):
+    for store in TEMPLATES:
+        if store in host:
+            return store
+    return None
+
+
+def make_handler(catalog, options, stats):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, status, body, headers=None):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            with stats["lock"]:
+                stats["requests"] += 1
+
+            if options.latency:
+                time.sleep(max(0, random.gauss(options.latency, options.latency / 4)) / 1000)
+
+            roll = random.random()
+            for status, rate in ((403, options.error_403), (429, options.error_429), (503, options.error_5xx)):
+                if roll < rate:
+                    with stats["lock"]:
+                        stats[status] = stats.get(status, 0) + 1
+                    self.send_body(status, f"<html><body>Error {status}</body></html>")
+                    return
+                roll -= rate
+
+            host, _, path = self.path.lstrip("/").partition("/")
+            store = store_for_host(host)
+            if store is None:
+                self.send_body(404, "<html><body>Unknown store</body></html>")
+                return
+
+            html, price = catalog.render(store, "/" + path.split("?")[0])
+            etag = f'"{price}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_body(200, html, {"ETag": etag})
+
+    return StubHandler
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The scraper drops streamed connections once it has what it needs
+        pass
+
+
+def start_stub_server(port=0, latency=0, error_403=0.0, error_429=0.0, error_5xx=0.0, drift=0.0, seed=0):
+    """
+    Start the stub storefront in a background thread.
+    Returns (server, stats); server.server_port has the bound port.
+    """
+    options = argparse.Namespace(latency=latency, error_403=error_403,
+                                 error_429=error_429, error_5xx=error_5xx)
+    stats = {"requests": 0, "lock": threading.Lock()}
+    catalog = StubCatalog(drift=drift, seed=seed)
+    server = StubServer(("127.0.0.1", port), make_handler(catalog, options, stats))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def synthetic_products(count):
+    """(name, store, url) for `count` synthetic products spread over the stores."""
+    products = []
+    for i in range(count):
+        store = ("amazon", "flipkart", "myntra")[i % 3]
+        if store == "amazon":
+            url = f"https://www.amazon.in/dp/B{i:09d}"
+        elif store == "flipkart":
+            url = f"https://www.flipkart.com/stub-product-{i}/p/itm{i:013x}"
+        else:
+            url = f"https://www.myntra.com/stub/{i}/buy"
+        products.append((f"Stub product {i}", store, url))
+    return products
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="mean response latency in ms")
+    parser.add_argument("--error-403", type=float, default=0.0, help="share of requests answered 403")
+    parser.add_argument("--error-429", type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="share of requests answered 503")
+    parser.add_argument("--drift", type=float, default=0.0, help="chance per request that a price changes")
+    args = parser.parse_args()
+
+    server, stats = start_stub_server(args.port, args.latency, args.error_403,
+                                      args.error_429, args.error_5xx, args.drift)
+    print(f"Stub storefront on http://127.0.0.1:{server.server_port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{stats['requests']} requests served")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
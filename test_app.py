@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Tests for the web app's routes, with Flask's test client on a temporary
+database. No network access needed:
+
+    python -m pytest test_app.py
+"""
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+import charts
+import db
+import pubsub
+import tracker
+from jobs import JobManager
+
+# Price listeners the app registers when it is imported; only installed
+# while an app test runs, so other tests don't render charts or publish
+APP_LISTENERS = []
+
+
+def load_app():
+    if "app" not in sys.modules:
+        registered = len(db._price_listeners)
+        import app
+        APP_LISTENERS[:] = db._price_listeners[registered:]
+        del db._price_listeners[registered:]
+        app.stop_background_price_checker()
+    return sys.modules["app"]
+
+
+@pytest.fixture
+def app(temp_db, tmp_path, monkeypatch):
+    app = load_app()
+    monkeypatch.setattr(db, "_price_listeners", list(APP_LISTENERS))
+    monkeypatch.setattr(app, "chart_renderer", charts.ChartRenderer(cache_dir=str(tmp_path / "charts")))
+    monkeypatch.setattr(app, "job_manager", JobManager())
+    monkeypatch.setattr(app, "price_bus", pubsub.PriceBus())
+    yield app
+    app.chart_renderer.executor.shutdown(wait=True)
+    app.job_manager.executor.shutdown(wait=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+def priced_product(name, prices):
+    product_id = db.add_product(name, "amazon", f"https://www.amazon.in/dp/{name}")
+    with db.PriceWriter() as writer:
+        for n, price in enumerate(prices):
+            writer.add_price(product_id, price, f"2024-01-{1 + n // 24:02d} {n % 24:02d}:00:00")
+    return product_id
+
+
+def test_history_api_revalidates_with_its_etag(client):
+    product_id = priced_product("A", [100, 90, 95])
+    response = client.get(f"/api/products/{product_id}/history")
+    assert response.status_code == 200
+    assert response.json["p"] == [100, 90, 95]
+    assert response.json["t"][0] == charts.to_epoch("2024-01-01 00:00:00")
+    assert response.cache_control.no_cache
+    etag = response.headers["ETag"]
+
+    again = client.get(f"/api/products/{product_id}/history", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["ETag"] == etag
+
+    # A new price changes the ETag
+    db.PriceWriter(flush_seconds=0).add_price(product_id, 80, "2024-01-01 05:00:00")
+    changed = client.get(f"/api/products/{product_id}/history", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json["p"][-1] == 80
+
+
+def test_versioned_history_urls_are_immutable(client):
+    product_id = priced_product("A", [100, 90])
+    version = charts.history_version(product_id)
+    response = client.get(f"/api/products/{product_id}/history?v={version}")
+    assert response.cache_control.immutable and response.cache_control.max_age == 365 * 24 * 3600
+    assert response.cache_control.public
+    # An outdated version is revalidated like an unversioned URL
+    stale = client.get(f"/api/products/{product_id}/history?v=0123456789abcdef")
+    assert stale.cache_control.no_cache and not stale.cache_control.immutable
+
+
+def test_history_api_range_arguments(client):
+    # Hourly prices over two days
+    product_id = priced_product("A", [100 + n for n in range(48)])
+    url = f"/api/products/{product_id}/history"
+
+    start = charts.to_epoch("2024-01-02 00:00:00")
+    assert client.get(f"{url}?start={start}").json["p"][0] == 124
+    assert client.get(f"{url}?start=2024-01-02T12:00:00&end=2024-01-02T13:00:00").json["p"] == [136, 137]
+    # Counted back from the latest check (2024-01-02 23:00)
+    assert client.get(f"{url}?days=0.5").json["p"][0] == 135
+    # Too few points are raised to 3
+    assert len(client.get(f"{url}?points=1").json["p"]) == 3
+
+    for bad in ("points=many", "days=week", "start=yesterday", "end=2024-13-01"):
+        assert client.get(f"{url}?{bad}").status_code == 400, bad
+    assert client.get("/api/products/999/history").status_code == 404
+
+
+def test_history_api_downsampling_keeps_the_ends(client):
+    prices = [100 + (n * 37) % 23 for n in range(48)]
+    product_id = priced_product("A", prices)
+    payload = client.get(f"/api/products/{product_id}/history?points=10").json
+    assert len(payload["t"]) == len(payload["p"]) == 10
+    assert (payload["t"][0], payload["p"][0]) == (charts.to_epoch("2024-01-01 00:00:00"), prices[0])
+    assert (payload["t"][-1], payload["p"][-1]) == (charts.to_epoch("2024-01-02 23:00:00"), prices[-1])
+    assert payload["resolution"] == "raw"
+
+
+def test_stale_product_pages_refresh_once_in_the_background(client, monkeypatch):
+    product_id = priced_product("A", [100, 90])
+    release = threading.Event()
+    checks = []
+
+    def snapshot(url, store, **kwargs):
+        checks.append(url)
+        release.wait(5)
+        return {"price": 85, "unchanged": False, "etag": None, "last_modified": None, "content_hash": None}
+
+    monkeypatch.setattr(tracker, "get_product_snapshot", snapshot)
+    # Last checked in 2024: the stored page is served and a check started
+    page = client.get(f"/product/{product_id}")
+    assert page.status_code == 200 and b"90" in page.data
+    status = client.get(f"/api/products/{product_id}/status")
+    assert status.json["refreshing"] and status.json["price"] == 90
+    assert status.cache_control.no_store
+
+    # Reloading while the check runs doesn't start another
+    assert client.get(f"/product/{product_id}").status_code == 200
+    release.set()
+    for _ in range(50):
+        status = client.get(f"/api/products/{product_id}/status").json
+        if not status["refreshing"]:
+            break
+        time.sleep(0.1)
+    assert len(checks) == 1
+    summary = db.get_price_summary(product_id)
+    assert status == {"product_id": product_id, "refreshing": False, "last_checked": summary["checked_at"],
+                      "price": 85, "version": charts.history_version(product_id)}
+
+    # Fresh now: no further check
+    client.get(f"/product/{product_id}")
+    assert not tracker.is_refreshing(product_id) and len(checks) == 1
+    assert client.get("/api/products/999/status").status_code == 404
+
+
+def sse_events(body):
+    """(id, event, data) of each event in a Server-Sent Events body."""
+    events = []
+    for block in body.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def wait(job):
+    for _ in job.iter_events(keepalive=1):
+        pass
+
+
+def test_adding_a_product_redirects_to_its_job(app, client, monkeypatch):
+    def add_product_job(job, url, target_price):
+        job.log(f"Adding {url} below {target_price}")
+        return {"product_id": 1}
+
+    monkeypatch.setattr(app, "add_product_job", add_product_job)
+    response = client.post("/add", data={"url": "https://www.amazon.in/dp/B1", "target_price": "99"})
+    assert response.status_code == 302
+    job_id = response.headers["Location"].rsplit("/", 1)[1]
+    assert response.headers["Location"] == f"/jobs/{job_id}"
+    job = app.job_manager.get(job_id)
+    wait(job)
+    assert job.result == {"product_id": 1}
+    assert client.get(f"/jobs/{job_id}").status_code == 200
+
+    assert client.post("/add", data={"url": ""}).headers["Location"] == "/add"
+    assert client.post("/add", data={"url": "x", "target_price": "cheap"}).headers["Location"] == "/add"
+    # Unknown (or forgotten) jobs go back to the dashboard
+    assert client.get("/jobs/missing").headers["Location"] == "/"
+    assert client.get("/api/jobs/missing").status_code == 404
+
+
+def test_a_running_check_is_joined_instead_of_restarted(app, client, monkeypatch):
+    release = threading.Event()
+
+    def price_check_job(job, products=None):
+        release.wait(5)
+        return {"checked": 0}
+
+    monkeypatch.setattr(app, "price_check_job", price_check_job)
+    headers = {"Accept": "application/json"}
+    first = client.get("/run_check", headers=headers)
+    assert first.status_code == 202
+    job_id = first.json["job_id"]
+    assert first.headers["Location"] == f"/api/jobs/{job_id}"
+    assert client.get("/run_check", headers=headers).json["job_id"] == job_id
+    release.set()
+    wait(app.job_manager.get(job_id))
+    assert client.get(f"/api/jobs/{job_id}").json["status"] == "done"
+    # Once it has finished a new round starts, and browsers are sent to its page
+    location = client.get("/run_check").headers["Location"]
+    assert location.startswith("/jobs/") and location != f"/jobs/{job_id}"
+
+
+def test_group_check_events_resume_after_the_last_event_id(app, client, monkeypatch):
+    ids = [priced_product(name, [100]) for name in ("A", "B")]
+    for product_id in ids:
+        db.update_product_group(product_id, "g1")
+    monkeypatch.setattr(tracker, "get_product_snapshot", lambda url, store, **kwargs: {
+        "price": 90, "unchanged": False, "etag": None, "last_modified": None, "content_hash": None})
+
+    job_id = client.get("/run_check_group/g1", headers={"Accept": "application/json"}).json["job_id"]
+    wait(app.job_manager.get(job_id))
+    events = sse_events(client.get(f"/api/jobs/{job_id}/events").data)
+    assert [int(number) for number, _, _ in events] == list(range(1, len(events) + 1))
+    assert sorted(data["product_id"] for _, event, data in events if event == "result") == ids
+    assert events[-1][1] == "done" and events[-1][2]["result"]["checked"] == 2
+
+    resumed = sse_events(client.get(f"/api/jobs/{job_id}/events", headers={"Last-Event-ID": "3"}).data)
+    assert resumed == events[3:]
+    assert sse_events(client.get(f"/api/jobs/{job_id}/events?after=3").data) == events[3:]
+    assert client.get("/api/jobs/missing/events").status_code == 404
+    assert client.get("/run_check_group/none").headers["Location"] == "/compare"
+
+
+def test_price_events_only_carry_the_requested_products(app, client):
+    first, second, other = (priced_product(name, [100]) for name in ("A", "B", "C"))
+    response = client.get(f"/api/prices/events?products={first},{second}", buffered=False)
+    assert response.mimetype == "text/event-stream" and response.cache_control.no_cache
+    chunks = response.iter_encoded()
+    assert next(chunks) == b"retry: 5000\n\n"
+
+    with db.PriceWriter() as writer:
+        writer.add_price(first, 90, "2024-02-01 10:00:00")
+        writer.add_price(other, 80, "2024-02-01 10:00:00")
+    (_, event, rows), = sse_events(next(chunks))
+    assert event == "price"
+    assert [(row["product_id"], row["price"]) for row in rows] == [(first, 90)]
+    assert rows[0]["version"] == charts.history_version(first)
+    response.close()
+    assert not app.price_bus.has_subscribers()
+
+    assert client.get("/api/prices/events?products=1,x").status_code == 400
+    too_many = ",".join(str(i) for i in range(app.LIVE_MAX_PRODUCTS + 1))
+    assert client.get(f"/api/prices/events?products={too_many}").status_code == 400
+
+
+def test_lagging_price_streams_are_told_to_reload(app, client):
+    response = client.get("/api/prices/events?products=1", buffered=False)
+    for n in range(pubsub.SUBSCRIPTION_QUEUE_SIZE + 1):
+        app.price_bus.publish([{"product_id": 1, "price": n}, {"product_id": 2, "price": n}])
+    # The stream ends with the reload, after what was still queued
+    events = sse_events(response.get_data())
+    assert [event for _, event, _ in events] == ["price"] * (pubsub.SUBSCRIPTION_QUEUE_SIZE - 1) + ["reload"]
+    assert all(len(rows) == 1 for _, event, rows in events if event == "price")
+    assert not app.price_bus.has_subscribers()
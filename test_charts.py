@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for the chart renderer and its caches, on a temporary database:
+
+    python -m pytest test_charts.py
+"""
+import os
+
+import pytest
+
+import charts
+import db
+
+
+@pytest.fixture
+def renderer(tmp_path):
+    renderer = charts.ChartRenderer(cache_dir=str(tmp_path / "charts"), memory_size=2)
+    yield renderer
+    renderer.shutdown()
+
+
+def priced_product(name, prices):
+    product_id = db.add_product(name, "amazon", f"https://www.amazon.in/dp/{name}")
+    with db.PriceWriter() as writer:
+        for day, price in enumerate(prices, start=1):
+            writer.add_price(product_id, price, f"2024-01-0{day} 10:00:00")
+    return product_id
+
+
+def test_render_price_chart():
+    history = [{"price": 100, "checked_at": "2024-01-01 10:00:00"},
+               {"price": 90, "checked_at": "2024-01-02 10:00:00"}]
+    assert charts.render_price_chart(history).startswith(b"\x89PNG")
+    assert charts.render_price_chart(history[:1]) is None
+
+
+def test_charts_are_cached_until_the_price_changes(temp_db, renderer):
+    product_id = priced_product("A", [100, 90])
+    version = charts.chart_version(product_id)
+    png = renderer.get(product_id, timeout=30)
+    assert png.startswith(b"\x89PNG")
+    assert renderer.get(product_id, timeout=30) == png
+    assert renderer.stats["renders"] == 1 and renderer.stats["memory_hits"] == 1
+
+    # Checks that find the same price keep the chart
+    db.PriceWriter(flush_seconds=0).add_price(product_id, 90, "2024-01-03 10:00:00")
+    assert charts.chart_version(product_id) == version
+    db.PriceWriter(flush_seconds=0).add_price(product_id, 80, "2024-01-04 10:00:00")
+    assert charts.chart_version(product_id) != version
+    renderer.get(product_id, timeout=30)
+    assert renderer.stats["renders"] == 2
+    # Only the current version is kept on disk
+    assert os.listdir(os.path.join(renderer.cache_dir, str(product_id))) == \
+        [f"{charts.chart_version(product_id)}.png"]
+
+
+def test_stale_renders_are_not_cached(temp_db, renderer):
+    product_id = priced_product("A", [100, 90])
+    version = charts.chart_version(product_id)
+    db.PriceWriter(flush_seconds=0).add_price(product_id, 80, "2024-01-03 10:00:00")
+    # Rendered, but with the newer history, so not kept as `version`
+    assert renderer.get(product_id, version, timeout=30).startswith(b"\x89PNG")
+    assert renderer.memory == {} and not os.path.exists(renderer.cache_dir)
+
+
+def test_only_older_versions_are_removed_from_disk(renderer):
+    renderer._store(1, "1704103200-aaaaaaaa", b"new")
+    renderer._store(1, "1704016800-bbbbbbbb", b"old")
+    renderer._store(1, "0123456789abcdef", b"unversioned")
+    assert sorted(os.listdir(os.path.join(renderer.cache_dir, "1"))) == \
+        ["0123456789abcdef.png", "1704016800-bbbbbbbb.png", "1704103200-aaaaaaaa.png"]
+    renderer._store(1, "1704189600-cccccccc", b"newest")
+    assert os.listdir(os.path.join(renderer.cache_dir, "1")) == ["1704189600-cccccccc.png"]
+
+
+def test_memory_cache_is_bounded_and_backed_by_disk(temp_db, renderer):
+    ids = [priced_product(name, [100, 90]) for name in "ABC"]
+    for product_id in ids:
+        renderer.get(product_id, timeout=30)
+    assert len(renderer.memory) == 2
+
+    renderer.get(ids[0], timeout=30)
+    assert renderer.stats["renders"] == 3 and renderer.stats["disk_hits"] == 1
+
+
+def test_prerender(temp_db, renderer):
+    product_id = priced_product("A", [100, 90])
+    without_changes = priced_product("B", [100])
+    renderer.prerender([product_id, without_changes])
+    renderer.executor.shutdown(wait=True)
+    assert (product_id, charts.chart_version(product_id)) in renderer.memory
+    assert renderer.stats["renders"] == 2
+
+
+def test_lttb_keeps_extremes():
+    times = list(range(1000))
+    values = [100.0] * 1000
+    values[500] = 20.0
+    values[700] = 180.0
+    sampled_times, sampled_values = charts.lttb(times, values, 50)
+    assert len(sampled_times) == 50
+    assert (sampled_times[0], sampled_times[-1]) == (0, 999)
+    assert min(sampled_values) == 20.0 and max(sampled_values) == 180.0
+    assert charts.lttb([1, 2], [5, 6], 50) == ([1, 2], [5, 6])
+
+
+def test_to_epoch():
+    assert charts.to_epoch("1970-01-02 00:00:00") == 86400
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Tests for the database layer, on a temporary database:
+
+    python -m pytest test_db.py
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import db
+
+
+def product_ids(count):
+    return [db.add_product(f"p{i}", "amazon", f"https://www.amazon.in/dp/B{i}") for i in range(count)]
+
+
+def test_price_writer_batches_rows(temp_db):
+    ids = product_ids(5)
+    writer = db.PriceWriter(batch_size=4, flush_seconds=3600)
+    for i, product_id in enumerate(ids[:3]):
+        writer.add_price(product_id, 100 + i, "2024-01-01 10:00:00")
+    assert db.get_price_history(ids[0]) == []
+
+    writer.add_price(ids[3], 103, "2024-01-01 10:00:00")
+    assert writer.flushes == 1 and writer.rows_written == 4
+    assert [tuple(r) for r in db.get_price_history(ids[0])] == [(100, "2024-01-01 10:00:00")]
+    assert db.get_product(ids[0])["last_checked"] == "2024-01-01 10:00:00"
+
+    writer.save_validators(ids[4], '"etag"', None, "hash", checked=True)
+    writer.close()
+    product = db.get_product(ids[4])
+    assert (product["etag"], product["content_hash"]) == ('"etag"', "hash")
+    assert product["last_checked"] is not None
+    assert writer.flushes == 2
+
+
+def test_price_writer_skips_duplicate_rows(temp_db):
+    product_id = product_ids(1)[0]
+    with db.PriceWriter() as writer:
+        writer.add_price(product_id, 100, "2024-01-01 10:00:00")
+        writer.add_price(product_id, 101, "2024-01-01 10:00:00")
+        writer.add_price(product_id, 102, "2024-01-01 10:05:00")
+    assert writer.rows_written == 2
+    assert db.get_product(product_id)["last_checked"] == "2024-01-01 10:05:00"
+
+
+def test_price_writer_flushes_after_time_window(temp_db):
+    product_id = product_ids(1)[0]
+    writer = db.PriceWriter(batch_size=100, flush_seconds=0)
+    writer.add_price(product_id, 100)
+    assert len(db.get_price_history(product_id)) == 1
+
+
+def test_connections_are_reused_per_thread(temp_db):
+    with db.get_connection() as first:
+        with db.get_connection() as nested:
+            assert nested is first
+    with db.get_connection() as again:
+        assert again is first
+        assert again.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+
+    def connect():
+        with db.get_connection() as conn:
+            other.append(conn)
+
+    thread = threading.Thread(target=connect)
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+
+def test_uncommitted_writes_are_rolled_back(temp_db):
+    product_id = product_ids(1)[0]
+    with pytest.raises(RuntimeError):
+        with db.get_connection() as conn:
+            conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            raise RuntimeError
+    assert db.get_product(product_id) is not None
+
+
+def test_latest_prices_follow_inserts(temp_db):
+    first, second = product_ids(2)
+    with db.PriceWriter() as writer:
+        for checked_at, price in [("2024-01-01 10:00:00", 100), ("2024-01-02 10:00:00", 120),
+                                  ("2024-01-03 10:00:00", 90)]:
+            writer.add_price(first, price, checked_at)
+        # Out of order: only widens the range
+        writer.add_price(first, 80, "2023-12-31 10:00:00")
+    db.add_price(second, 50)
+
+    summary = db.get_price_summary(first)
+    assert (summary["price"], summary["previous_price"]) == (90, 120)
+    assert (summary["min_price"], summary["max_price"]) == (80, 120)
+    assert db.get_latest_price(second) == 50
+
+    db.update_product_group(first, "g")
+    db.update_product_group(second, "g")
+    assert [(p["id"], p["current_price"]) for p in db.get_product_comparison("g")] == [(second, 50), (first, 90)]
+
+
+def test_rebuild_latest_prices(temp_db):
+    ids = product_ids(2)
+    with db.PriceWriter() as writer:
+        for day, price in enumerate([100, 120, 90], start=1):
+            writer.add_price(ids[0], price, f"2024-01-0{day} 10:00:00")
+        writer.add_price(ids[1], 10, "2024-01-01 10:00:00")
+    expected = [tuple(db.get_price_summary(i)) for i in ids]
+
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM latest_prices")
+        conn.commit()
+    assert db.rebuild_latest_prices() == 2
+    assert [tuple(db.get_price_summary(i)) for i in ids] == expected
+
+
+@pytest.mark.parametrize("sort", list(db.DASHBOARD_SORTS))
+def test_dashboard_pages_cover_every_product_once(temp_db, sort):
+    ids = product_ids(23)
+    for n, product_id in enumerate(ids):
+        db.update_product_group(product_id, f"g{n % 4}" if n % 3 else None)
+    with db.PriceWriter() as writer:
+        for n, product_id in enumerate(ids[:20]):
+            writer.add_price(product_id, 100, "2024-01-01 10:00:00")
+            writer.add_price(product_id, 100 - n % 7, "2024-01-02 10:00:00")
+
+    seen, after = [], None
+    while True:
+        rows, after = db.get_dashboard_products(5, after=after, sort=sort)
+        seen.extend(rows)
+        if after is None:
+            break
+
+    # Sorting by drop lists only the products with a price
+    expected = ids[:20] if sort == "drop" else ids
+    assert sorted(r["id"] for r in seen) == sorted(expected)
+    if sort == "drop":
+        drops = [r["drop_pct"] for r in seen]
+        assert drops == sorted(drops, reverse=True)
+
+
+def test_dashboard_row_values(temp_db):
+    product_id = product_ids(1)[0]
+    db.update_product(product_id, "p0", "amazon", "https://www.amazon.in/dp/B0", 95)
+    with db.PriceWriter() as writer:
+        writer.add_price(product_id, 100, "2024-01-01 10:00:00")
+        writer.add_price(product_id, 90, "2024-01-02 10:00:00")
+    (row,), _ = db.get_dashboard_products(10, below_target=True, store="amazon")
+    assert (row["current_price"], row["price_change"], row["drop_pct"], row["min_price"], row["at_target"]) == \
+        (90, -10, 10, 90, 1)
+    assert db.get_dashboard_products(10, store="flipkart") == ([], None)
+
+
+def test_url_variants_are_one_product(temp_db):
+    product_id = db.add_product("Phone", "amazon", "https://www.amazon.in/Phone/dp/B0CHX1W1XY?ref=x")
+    assert db.get_product_by_url("https://amazon.in/dp/B0CHX1W1XY")["id"] == product_id
+    assert db.get_product_by_url("https://amazon.in/dp/B000000000") is None
+    with pytest.raises(ValueError):
+        db.add_product("Phone", "amazon", "https://www.amazon.in/gp/product/B0CHX1W1XY")
+
+    other = db.add_product("Case", "amazon", "https://www.amazon.in/dp/B0CASE0000")
+    with pytest.raises(ValueError):
+        db.update_product(other, "Case", "amazon", "https://www.amazon.in/dp/B0CHX1W1XY?th=1", None)
+    db.update_product(other, "Case", "amazon", "https://www.amazon.in/dp/B0CASE0001", None)
+    assert db.get_product_by_url("https://www.amazon.in/dp/B0CASE0001")["id"] == other
+
+
+def test_backfill_deactivates_duplicates(temp_db):
+    with db.get_connection() as conn:
+        # Rows from before url_key existed
+        conn.executemany("INSERT INTO products (name, store, url) VALUES (?, ?, ?)", [
+            ("Phone", "flipkart", "https://www.flipkart.com/phone/p/itm123abc?pid=A"),
+            ("Phone", "flipkart", "https://www.flipkart.com/phone/p/itm123abc?pid=A&lid=x"),
+            ("Phone", "flipkart", "https://www.flipkart.com/phone-blue/p/itm123abc?pid=B"),
+            ("Shirt", "myntra", "https://www.myntra.com/shirts/x/y/1700944/buy"),
+        ])
+        assert db.backfill_url_keys(conn.cursor()) == 3
+        conn.commit()
+        rows = conn.execute("SELECT url_key, status FROM products ORDER BY id").fetchall()
+    assert [tuple(row) for row in rows] == [("flipkart:ITM123ABC?pid=A", "active"), (None, "inactive"),
+                                            ("flipkart:ITM123ABC?pid=B", "active"),
+                                            ("myntra:1700944", "active")]
+
+
+def test_flipkart_variants_are_separate_products(temp_db):
+    black = db.add_product("Phone", "flipkart", "https://www.flipkart.com/phone-black/p/itm123abc?pid=MOBBLACK")
+    blue = db.add_product("Phone", "flipkart", "https://www.flipkart.com/phone-blue/p/itm123abc?pid=MOBBLUE")
+    assert black != blue
+    assert db.get_product_by_url("https://www.flipkart.com/phone/p/itm123abc?pid=MOBBLUE&lid=x")["id"] == blue
+    with pytest.raises(ValueError):
+        db.add_product("Phone", "flipkart", "https://dl.flipkart.com/dl/phone/p/itm123abc?pid=MOBBLACK")
+
+    # Keys from before the variant was part of them are updated on start,
+    # and variants taken for duplicates then are tracked again
+    with db.get_connection() as conn:
+        conn.execute("UPDATE products SET url_key = 'flipkart:ITM123ABC' WHERE id = ?", (black,))
+        conn.execute("UPDATE products SET url_key = NULL, status = 'inactive' WHERE id = ?", (blue,))
+        conn.commit()
+    db.init_db()
+    assert db.get_product(black)["url_key"] == "flipkart:ITM123ABC?pid=MOBBLACK"
+    assert tuple(db.get_product(blue)[name] for name in ("url_key", "status")) == \
+        ("flipkart:ITM123ABC?pid=MOBBLUE", "active")
+
+
+def test_price_updates_are_published_after_writes(temp_db):
+    first, second, without_price = product_ids(3)
+    published = []
+    listener = lambda rows: published.append(db.get_price_updates({row[0] for row in rows}))
+    db.on_prices_written(listener)
+    try:
+        with db.PriceWriter() as writer:
+            writer.add_price(first, 100, "2024-01-01 10:00:00")
+            writer.add_price(first, 90, "2024-01-02 10:00:00")
+            writer.add_price(second, 50, "2024-01-02 10:00:00")
+    finally:
+        db._price_listeners.remove(listener)
+    (updates,) = published
+    assert {row["product_id"]: (row["price"], row["price_change"]) for row in updates} == \
+        {first: (90, -10), second: (50, None)}
+    assert db.get_price_updates([without_price]) == []
+
+
+def test_unchanged_prices_extend_an_interval(temp_db):
+    product_id = product_ids(1)[0]
+    with db.PriceWriter() as writer:
+        for hour, price in enumerate([100, 100, 100, 90, 90, 100], start=10):
+            writer.add_price(product_id, price, f"2024-01-01 {hour}:00:00")
+    with db.PriceWriter() as writer:
+        writer.add_price(product_id, 100, "2024-01-01 16:00:00")
+        writer.add_price(product_id, 100, "2024-01-01 16:00:00")
+    assert writer.rows_written == 1
+
+    with db.get_connection() as conn:
+        intervals = [tuple(r) for r in conn.execute(
+            "SELECT price, first_seen, last_seen, observations FROM price_intervals ORDER BY first_seen")]
+    assert intervals == [(100, "2024-01-01 10:00:00", "2024-01-01 12:00:00", 3),
+                         (90, "2024-01-01 13:00:00", "2024-01-01 14:00:00", 2),
+                         (100, "2024-01-01 15:00:00", "2024-01-01 16:00:00", 2)]
+    assert [r["checked_at"][11:13] for r in db.get_price_history(product_id)] == ["10", "12", "13", "14", "15", "16"]
+    summary = db.get_price_summary(product_id)
+    assert (summary["price"], summary["checked_at"], summary["min_price"]) == (100, "2024-01-01 16:00:00", 90)
+
+
+def test_compact_price_history(temp_db, monkeypatch):
+    first, second = product_ids(2)
+    monkeypatch.setattr(db, "PRICE_STORAGE", "raw")
+    with db.PriceWriter() as writer:
+        for day, price in enumerate([100, 100, 120, 120, 120, 90], start=1):
+            writer.add_price(first, price, f"2024-01-0{day} 10:00:00")
+        writer.add_price(second, 10, "2024-01-01 10:00:00")
+    before = [tuple(db.get_price_summary(i)) for i in (first, second)]
+
+    assert db.compact_price_history(batch_size=1, before="2024-01-04") == 4
+    assert db.compact_price_history(batch_size=1) == 3
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM price_history").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM price_intervals").fetchone()[0] == 4
+    # The interval split by the `before` cut-off is joined again
+    assert [(r["price"], r["checked_at"][8:10]) for r in db.get_price_history(first)] == \
+        [(100, "01"), (100, "02"), (120, "03"), (120, "05"), (90, "06")]
+    assert [tuple(db.get_price_summary(i)) for i in (first, second)] == before
+    # The 120 on the 4th is folded into an interval and leaves the rollups
+    with db.get_connection() as conn:
+        daily = [tuple(r) for r in conn.execute("SELECT * FROM price_rollups_daily ORDER BY product_id, bucket")]
+    assert [row[1][8:10] for row in daily if row[0] == first] == ["01", "02", "03", "05", "06"]
+    db.rebuild_price_rollups()
+    with db.get_connection() as conn:
+        assert [tuple(r) for r in conn.execute("SELECT * FROM price_rollups_daily ORDER BY product_id, bucket")] == daily
+
+
+def test_compaction_after_newer_checks_keeps_folding(temp_db, monkeypatch):
+    first, second = product_ids(2)
+    monkeypatch.setattr(db, "PRICE_STORAGE", "raw")
+    with db.PriceWriter() as writer:
+        for product_id in (first, second):
+            for day, price in enumerate([100, 100, 100, 120, 120, 100], start=1):
+                writer.add_price(product_id, price, f"2024-01-0{day} 10:00:00")
+    # Checks after upgrading write intervals newer than the raw history
+    monkeypatch.setattr(db, "PRICE_STORAGE", "intervals")
+    with db.PriceWriter() as writer:
+        writer.add_price(first, 100, "2024-02-01 10:00:00")
+        writer.add_price(second, 80, "2024-02-01 10:00:00")
+
+    assert db.compact_price_history(batch_size=2) == 12
+    with db.get_connection() as conn:
+        intervals = [tuple(r) for r in conn.execute("""
+            SELECT product_id, price, first_seen, last_seen, observations FROM price_intervals
+            ORDER BY product_id, first_seen
+        """)]
+    assert intervals == [
+        (first, 100, "2024-01-01 10:00:00", "2024-01-03 10:00:00", 3),
+        (first, 120, "2024-01-04 10:00:00", "2024-01-05 10:00:00", 2),
+        (first, 100, "2024-01-06 10:00:00", "2024-01-06 10:00:00", 1),
+        (first, 100, "2024-02-01 10:00:00", "2024-02-01 10:00:00", 1),
+        (second, 100, "2024-01-01 10:00:00", "2024-01-03 10:00:00", 3),
+        (second, 120, "2024-01-04 10:00:00", "2024-01-05 10:00:00", 2),
+        (second, 100, "2024-01-06 10:00:00", "2024-01-06 10:00:00", 1),
+        (second, 80, "2024-02-01 10:00:00", "2024-02-01 10:00:00", 1),
+    ]
+    with db.get_connection() as conn:
+        daily = [tuple(r) for r in conn.execute("SELECT * FROM price_rollups_daily ORDER BY product_id, bucket")]
+    db.rebuild_price_rollups()
+    with db.get_connection() as conn:
+        assert [tuple(r) for r in conn.execute("SELECT * FROM price_rollups_daily ORDER BY product_id, bucket")] == daily
+
+
+def test_rollups_follow_inserts(temp_db):
+    product_id = product_ids(1)[0]
+    with db.PriceWriter() as writer:
+        for minute, price in [(10, 100), (20, 90), (30, 120), (40, 110)]:
+            writer.add_price(product_id, price, f"2024-01-01 10:{minute}:00")
+    # Late row: becomes the bucket's open price
+    with db.PriceWriter() as writer:
+        writer.add_price(product_id, 95, "2024-01-01 10:05:00")
+    db.PriceWriter(flush_seconds=0).add_price(product_id, 80, "2024-01-02 09:00:00")
+
+    with db.get_connection() as conn:
+        hourly = [tuple(r) for r in conn.execute(
+            "SELECT bucket, open, high, low, close, count FROM price_rollups_hourly ORDER BY bucket")]
+        daily = [tuple(r) for r in conn.execute(
+            "SELECT bucket, open, high, low, close, count FROM price_rollups_daily ORDER BY bucket")]
+    assert hourly == [("2024-01-01 10:00:00", 95, 120, 90, 110, 5), ("2024-01-02 09:00:00", 80, 80, 80, 80, 1)]
+    assert daily == [("2024-01-01 00:00:00", 95, 120, 90, 110, 5), ("2024-01-02 00:00:00", 80, 80, 80, 80, 1)]
+
+    expected = hourly
+    assert db.rebuild_price_rollups() == 2
+    with db.get_connection() as conn:
+        assert [tuple(r) for r in conn.execute(
+            "SELECT bucket, open, high, low, close, count FROM price_rollups_hourly ORDER BY bucket")] == expected
+
+
+def test_history_resolution_follows_range(temp_db):
+    product_id = product_ids(1)[0]
+    with db.PriceWriter(batch_size=1000) as writer:
+        # Every 10 minutes for 10 days, a new price every check
+        for n in range(10 * 24 * 6):
+            writer.add_price(product_id, 1000 + n % 2,
+                             f"2024-01-{1 + n // 144:02d} {n // 6 % 24:02d}:{n % 6 * 10:02d}:00")
+
+    assert db.history_resolution(product_id, max_points=100) == "day"
+    assert db.history_resolution(product_id, max_points=500) == "hour"
+    assert db.history_resolution(product_id) == "hour"
+    assert db.history_resolution(product_id, start="2024-01-10 00:00:00") == "raw"
+
+    daily = db.get_price_history(product_id, max_points=100)
+    assert [r["checked_at"] for r in daily][:2] == ["2024-01-01 00:00:00", "2024-01-02 00:00:00"]
+    assert len(daily) == 10 and daily[0]["count"] == 144
+    hourly = db.get_price_history(product_id, start="2024-01-05 00:00:00", end="2024-01-06 23:59:59", max_points=100)
+    assert len(hourly) == 48 and (hourly[0]["low"], hourly[0]["high"]) == (1000, 1001)
+    raw = db.get_price_history(product_id, start="2024-01-10 12:00:00")
+    assert len(raw) == 72 and raw[0]["checked_at"] == "2024-01-10 12:00:00"
+
+
+def test_history_of_few_price_changes_stays_raw(temp_db):
+    product_id = product_ids(1)[0]
+    start = datetime(2024, 1, 1)
+    with db.PriceWriter(batch_size=1000) as writer:
+        # Hourly checks for 180 days, three price changes
+        for n in range(180 * 24):
+            price = 1000 if n < 1000 else 900 if n < 2000 else 950 if n < 3000 else 1000
+            writer.add_price(product_id, price, (start + timedelta(hours=n)).strftime("%Y-%m-%d %H:%M:%S"))
+
+    assert db.history_resolution(product_id, max_points=100) == "raw"
+    history = db.get_price_history(product_id, max_points=100)
+    assert [(r["price"], r["checked_at"]) for r in history] == [
+        (1000, "2024-01-01 00:00:00"), (1000, "2024-02-11 15:00:00"),
+        (900, "2024-02-11 16:00:00"), (900, "2024-03-24 07:00:00"),
+        (950, "2024-03-24 08:00:00"), (950, "2024-05-04 23:00:00"),
+        (1000, "2024-05-05 00:00:00"), (1000, "2024-06-28 23:00:00"),
+    ]
+
+
+def test_rebuilt_rollups_match_the_written_ones(temp_db):
+    product_id = product_ids(1)[0]
+    prices = [(100, "2024-01-01 10:00:00"), (100, "2024-01-01 10:30:00"), (100, "2024-01-01 11:10:00"),
+              (90, "2024-01-01 11:20:00"), (90, "2024-01-02 09:00:00"), (90, "2024-01-02 09:30:00")]
+    for price, checked_at in prices:
+        with db.PriceWriter() as writer:
+            writer.add_price(product_id, price, checked_at)
+
+    def rollups():
+        with db.get_connection() as conn:
+            return {table: [tuple(r) for r in conn.execute(f"SELECT * FROM {table} ORDER BY bucket")]
+                    for table, _, _ in db.PRICE_ROLLUPS.values()}
+
+    written = rollups()
+    # Extended intervals count their first and last check only
+    assert written["price_rollups_daily"][0][2:7] == (100, 100, 90, 90, 3)
+    db.rebuild_price_rollups()
+    assert rollups() == written
+
+
+def test_retention_folds_old_rows_and_trims_rollups(temp_db, monkeypatch):
+    product_id = product_ids(1)[0]
+    monkeypatch.setattr(db, "PRICE_STORAGE", "raw")
+    old = [(100, "2024-01-01 10:00:00"), (100, "2024-01-01 11:00:00"), (90, "2024-01-02 10:00:00"),
+           (90, "2024-01-03 10:00:00"), (95, "2024-01-04 10:00:00")]
+    with db.PriceWriter() as writer:
+        for price, checked_at in old:
+            writer.add_price(product_id, price, checked_at)
+        writer.add_price(product_id, 95, db.utc_timestamp())
+
+    policy = {"raw_days": 30, "hour_rollup_days": 30}
+    assert db.apply_retention(policy, batch_size=2, max_batches=1) == \
+        {"done": False, "price_history": 2, "price_rollups_hourly": 2}
+    summary = db.apply_retention(policy, batch_size=2, max_batches=10)
+    assert summary == {"done": True, "price_history": 3, "price_rollups_hourly": 3}
+
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM price_history").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM price_rollups_hourly").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM price_rollups_daily").fetchone()[0] == 5
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    # Every price change survives
+    prices = [r["price"] for r in db.get_price_history(product_id)]
+    assert prices == [100, 100, 90, 90, 95, 95]
+
+
+def test_hourly_rollups_are_trimmed_and_history_falls_back_to_daily(temp_db):
+    product_id = product_ids(1)[0]
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    with db.PriceWriter(batch_size=1000) as writer:
+        # Every 30 minutes for 180 days, a new price every check
+        for n in range(180 * 48):
+            checked_at = now - timedelta(minutes=30 * n)
+            writer.add_price(product_id, 1000 + n % 2, checked_at.strftime("%Y-%m-%d %H:%M:%S"))
+
+    while not db.apply_retention()["done"]:
+        pass
+    with db.get_connection() as conn:
+        hourly = conn.execute("SELECT COUNT(*) FROM price_rollups_hourly").fetchone()[0]
+    assert hourly <= (db.RETENTION_POLICY["hour_rollup_days"] + 1) * 24
+
+    # Hours older than the retention window are gone: use the daily rollups
+    assert db.history_resolution(product_id, max_points=5000) == "day"
+    last_month = (now - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+    assert db.history_resolution(product_id, start=last_month, max_points=1000) == "hour"
+
+
+def test_maintenance_runs_once_per_interval(temp_db):
+    assert db.claim_maintenance("retention", 600)
+    assert not db.claim_maintenance("retention", 600)
+    assert db.claim_maintenance("other", 600)
+    assert db.claim_maintenance("retention", 0)
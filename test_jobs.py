@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the background job manager:
+
+    python -m pytest test_jobs.py
+"""
+import threading
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def manager():
+    manager = jobs.JobManager()
+    yield manager
+    manager.executor.shutdown(wait=True)
+
+
+def wait(job):
+    for _ in job.iter_events(keepalive=1):
+        pass
+
+
+def test_job_reports_progress_and_result(manager):
+    def count(job, items):
+        job.set_total(len(items))
+        for item in items:
+            job.advance({"item": item})
+        return {"checked": len(items)}
+
+    job = manager.submit("count", "Counting", count, ["a", "b"])
+    assert manager.get(job.id) is job
+    wait(job)
+    assert job.status == "done" and job.result == {"checked": 2}
+    assert (job.done, job.total) == (2, 2)
+    events = [event for event, _ in job.events]
+    assert events.count("result") == 2 and events[-1] == "done"
+
+
+def test_failed_job(manager):
+    def fail(job):
+        raise ValueError("no such product")
+
+    job = manager.submit("fail", "Failing", fail)
+    wait(job)
+    assert job.status == "failed" and job.error == "no such product"
+
+
+def test_jobs_with_the_same_key_are_shared(manager):
+    release = threading.Event()
+
+    def blocked(job):
+        release.wait(5)
+
+    first = manager.submit("check", "Checking", blocked, key="run_check")
+    assert manager.submit("check", "Checking", blocked, key="run_check") is first
+    release.set()
+    wait(first)
+    assert manager.submit("check", "Checking", blocked, key="run_check") is not first
+
+
+def test_events_resume_after_a_given_number(manager):
+    def steps(job):
+        for n in range(3):
+            job.log(f"step {n}")
+
+    job = manager.submit("steps", "Steps", steps)
+    wait(job)
+    numbers = [item[0] for item in job.iter_events(after=2)]
+    assert numbers == list(range(3, len(job.events) + 1))
+
+
+def test_finished_jobs_are_forgotten(manager, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_KEEP_FINISHED", 2)
+    finished = []
+    for _ in range(3):
+        job = manager.submit("noop", "Nothing", lambda job: None)
+        wait(job)
+        finished.append(job)
+    manager.submit("noop", "Nothing", lambda job: None)
+    assert manager.get(finished[0].id) is None
+    assert manager.get(finished[2].id) is finished[2]
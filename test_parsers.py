@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the store adapters, run against the synthetic pages in
+fixtures/ with every installed parser engine. No network access needed:
+
+    python -m pytest test_parsers.py
+"""
+import json
+import os
+
+import pytest
+
+import scraper
+from parsers import available_engines
+from stores import ScraperError, canonical_url_key, get_adapter, store_of
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+with open(os.path.join(FIXTURES_DIR, "manifest.json"), encoding="utf-8") as f:
+    MANIFEST = json.load(f)
+
+ENGINES = available_engines()
+PRODUCT_PAGES = [e for e in MANIFEST if e["kind"] == "product"]
+SEARCH_PAGES = [e for e in MANIFEST if e["kind"] == "search"]
+
+
+def load(entry):
+    with open(os.path.join(FIXTURES_DIR, entry["file"]), encoding="utf-8") as f:
+        return f.read()
+
+
+def ids(entries):
+    return [e["file"] for e in entries]
+
+
+def test_synthetic_fixtures_have_no_live_url():
+    # refresh_fixtures.py would overwrite them with an unrelated live page
+    assert all(not e["url"] for e in MANIFEST if e.get("synthetic"))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("entry", PRODUCT_PAGES, ids=ids(PRODUCT_PAGES))
+def test_product_page(entry, engine):
+    adapter = get_adapter(entry["store"])
+    html = load(entry)
+
+    if "expected_error" in entry:
+        with pytest.raises(ScraperError, match=entry["expected_error"]):
+            adapter.parse_product(html, engine)
+        return
+
+    snapshot = adapter.parse_product(html, engine)
+    for field, value in entry["expected"].items():
+        assert snapshot[field] == value, field
+    assert adapter.price_selector_hit(adapter.parse(html, engine)) == entry["price_selector"]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("entry", SEARCH_PAGES, ids=ids(SEARCH_PAGES))
+def test_search_page(entry, engine):
+    adapter = get_adapter(entry["store"])
+    assert adapter.parse_search(load(entry), engine) == entry["expected"]
+
+
+@pytest.mark.parametrize("entry", [e for e in PRODUCT_PAGES if "expected" in e], ids=ids([e for e in PRODUCT_PAGES if "expected" in e]))
+def test_get_price_functions(entry, monkeypatch):
+    html = load(entry)
+    monkeypatch.setattr(scraper, "fetch_page", lambda url, **kwargs: {
+        "html": html, "truncated": False, "not_modified": False, "etag": None, "last_modified": None,
+    })
+    get_price_func = getattr(scraper, f"get_price_{entry['store']}")
+    assert get_price_func("https://example.invalid/product") == entry["expected"]["price"]
+
+
+@pytest.mark.parametrize("entry", [e for e in PRODUCT_PAGES if e.get("price_selector")], ids=ids([e for e in PRODUCT_PAGES if e.get("price_selector")]))
+def test_targeted_parse_of_truncated_page(entry):
+    adapter = get_adapter(entry["store"])
+    html = load(entry)
+    # Cut right after the markers, as an early-stopped download would
+    prefix = scraper.truncate_at_markers(html, adapter.stream_markers, tail=2000)
+    assert prefix is not None
+    snapshot = adapter.parse_product(prefix, targeted=True)
+    assert snapshot["price"] == entry["expected"]["price"]
+    assert snapshot["name"] == entry["expected"]["name"]
+
+
+def test_targeted_parse_skips_text_fallback():
+    entry = next(e for e in MANIFEST if e["file"] == "amazon_product_text_fallback.html")
+    with pytest.raises(ScraperError):
+        get_adapter("amazon").parse_product(load(entry), targeted=True)
+
+
+@pytest.mark.parametrize("entry", SEARCH_PAGES, ids=ids(SEARCH_PAGES))
+def test_search_single_store(entry, monkeypatch):
+    html = load(entry)
+    monkeypatch.setattr(scraper, "fetch_html", lambda url: html)
+    adapter = get_adapter(entry["store"])
+    result = scraper.search_single_store(entry["store"], adapter.search_url, "OnePlus Nord", None)
+    assert result == {
+        "name": entry["expected"]["name"],
+        "store": entry["store"],
+        "url": entry["expected"]["url"],
+        "estimated_price": entry["expected"]["price"],
+    }
+
+
+def test_search_single_store_excluded_store():
+    assert scraper.search_single_store("amazon", "https://www.amazon.in/s?k={}", "x", "amazon") is None
+
+
+def test_fingerprint_ignores_changes_outside_price_region():
+    entry = next(e for e in MANIFEST if e["file"] == "amazon_product.html")
+    adapter = get_adapter("amazon")
+    html = load(entry)
+    reviews_changed = html.replace("Reviewed in India", "Reviewed in India (edited)")
+    price_changed = html.replace("17,999", "16,999")
+    assert adapter.fingerprint(adapter.parse(html)) == adapter.fingerprint(adapter.parse(reviews_changed))
+    assert adapter.fingerprint(adapter.parse(html)) != adapter.fingerprint(adapter.parse(price_changed))
+    assert adapter.fingerprint(adapter.parse("<html><body>No price</body></html>")) is None
+
+
+class StubResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class StubSession:
+    """Answers requests with the given responses, in order, and records the headers sent."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.sent.append(headers)
+        return self.responses.pop(0)
+
+
+def test_fetch_page_revalidates_with_validators(monkeypatch):
+    session = StubSession(
+        StubResponse(200, "<html>page</html>", {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 10:00:00 GMT"}),
+        StubResponse(304),
+    )
+    monkeypatch.setattr(scraper.session_pool, "get", lambda key, url: session)
+    monkeypatch.setattr(scraper.rate_limiter, "acquire", lambda url: 0)
+
+    page = scraper.fetch_page("https://www.amazon.in/dp/B0CHX1W1XY")
+    assert (page["html"], page["not_modified"], page["etag"]) == ("<html>page</html>", False, '"v1"')
+    assert "If-None-Match" not in session.sent[0]
+
+    validators = {"etag": page["etag"], "last_modified": page["last_modified"]}
+    page = scraper.fetch_page("https://www.amazon.in/dp/B0CHX1W1XY", validators=validators)
+    assert session.sent[1]["If-None-Match"] == '"v1"'
+    assert session.sent[1]["If-Modified-Since"] == "Mon, 01 Jan 2024 10:00:00 GMT"
+    # Validators the 304 doesn't repeat are kept for the next check
+    assert page == {"html": None, "truncated": False, "not_modified": True, **validators}
+
+
+@pytest.mark.parametrize("urls, key", [
+    (["https://www.amazon.in/Apple-iPhone-15-128-GB/dp/B0CHX1W1XY/ref=sr_1_1?crid=2&keywords=iphone",
+      "https://amazon.in/dp/b0chx1w1xy?psc=1",
+      "https://www.amazon.in/gp/product/B0CHX1W1XY"], "amazon:B0CHX1W1XY"),
+    (["https://www.flipkart.com/apple-iphone-15-black-128-gb/p/itm6ac6485515ae4?pid=MOBGTAGPTB3VS24W&lid=LST",
+      "https://www.flipkart.com/apple-iphone-15/p/itm6ac6485515ae4?otracker=search&pid=mobgtagptb3vs24w"],
+     "flipkart:ITM6AC6485515AE4?pid=MOBGTAGPTB3VS24W"),
+    (["https://www.flipkart.com/apple-iphone-15/p/itm6ac6485515ae4",
+      "https://dl.flipkart.com/dl/apple-iphone-15/p/itm6ac6485515ae4?pid="], "flipkart:ITM6AC6485515AE4"),
+    (["https://www.myntra.com/tshirts/roadster/roadster-men-black-t-shirt/1700944/buy",
+      "https://www.myntra.com/1700944"], "myntra:1700944"),
+    (["https://www.croma.com/apple-iphone-15/p/300652/?utm_source=mail#reviews",
+      "https://WWW.Croma.com/apple-iphone-15/p/300652"], "croma.com/apple-iphone-15/p/300652"),
+])
+def test_canonical_url_key(urls, key):
+    assert {canonical_url_key(url) for url in urls} == {key}
+    assert canonical_url_key(urls[0], key.split(":")[0]) == key
+
+
+@pytest.mark.parametrize("value, store", [
+    ("amazon", "amazon"), ("Amazon.in", "amazon"), ("https://www.amazon.in/dp/B0CHX1W1XY", "amazon"),
+    ("dl.flipkart.com", "flipkart"), ("https://www.myntra.com/1700944", "myntra"),
+    ("https://www.example.com/?q=amazon", None), (None, None),
+])
+def test_store_of(value, store):
+    assert store_of(value) == store
+    assert scraper.session_key(value or "https://www.example.com/") == (store or "www.example.com")
+
+
+def test_flipkart_variants_have_their_own_keys():
+    black = "https://www.flipkart.com/apple-iphone-15-black-128-gb/p/itm6ac6485515ae4?pid=MOBGTAGPTB3VS24W"
+    blue = "https://www.flipkart.com/apple-iphone-15-blue-128-gb/p/itm6ac6485515ae4?pid=MOBGTAGPDX5HYHYZ"
+    assert canonical_url_key(black) != canonical_url_key(blue)
+    assert canonical_url_key(blue) == "flipkart:ITM6AC6485515AE4?pid=MOBGTAGPDX5HYHYZ"
+
+
+def test_canonical_url_key_keeps_meaningful_parameters():
+    assert canonical_url_key("https://example.com/item?id=2&utm_medium=x") == "example.com/item?id=2"
+    assert canonical_url_key("https://example.com/item?id=2") != canonical_url_key("https://example.com/item?id=3")
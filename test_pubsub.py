@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Tests for the live price update bus:
+
+    python -m pytest test_pubsub.py
+"""
+import pubsub
+
+
+def test_subscribers_get_only_their_products():
+    bus = pubsub.PriceBus()
+    everything = bus.subscribe()
+    one = bus.subscribe([1])
+    bus.publish([{"product_id": 1, "price": 90}, {"product_id": 2, "price": 50}])
+    assert everything.get(timeout=0) == ("price", [{"product_id": 1, "price": 90},
+                                                   {"product_id": 2, "price": 50}])
+    assert one.get(timeout=0) == ("price", [{"product_id": 1, "price": 90}])
+
+    bus.publish([{"product_id": 2, "price": 45}])
+    assert one.get(timeout=0) is None
+    bus.unsubscribe(everything)
+    bus.unsubscribe(one)
+    assert not bus.has_subscribers()
+
+
+def test_slow_subscribers_are_told_to_reload():
+    bus = pubsub.PriceBus()
+    slow = pubsub.Subscription(maxsize=2)
+    bus.subscriptions.add(slow)
+    for price in (100, 90, 80, 70):
+        bus.publish([{"product_id": 1, "price": price}])
+    assert slow.lagged and bus.stats["lagged"] == 1
+    assert slow.get(timeout=0) == ("price", [{"product_id": 1, "price": 90}])
+    assert slow.get(timeout=0) == ("reload", {})
+    assert slow.get(timeout=0) is None
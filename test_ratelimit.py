@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-bucket rate limiter, with a fake clock:
+
+    python -m pytest test_ratelimit.py
+"""
+import pytest
+
+import ratelimit
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    monkeypatch.setattr(ratelimit.time, "time", clock)
+    return clock
+
+
+def test_bucket_allows_a_burst_then_paces(clock):
+    bucket = ratelimit.TokenBucket(rate=0.5, burst=2)
+    assert [bucket.reserve(), bucket.reserve()] == [0.0, 0.0]
+    # Each further caller waits one refill interval longer than the last
+    assert [bucket.reserve(), bucket.reserve()] == [2.0, 4.0]
+    assert bucket.tokens == -2
+
+
+def test_bucket_refills_up_to_its_burst(clock):
+    bucket = ratelimit.TokenBucket(rate=0.5, burst=2)
+    bucket.reserve()
+    bucket.reserve()
+    clock.now += 2
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 2.0
+    # A long pause refills the burst but no more
+    clock.now += 3600
+    assert [bucket.reserve(), bucket.reserve(), bucket.reserve()] == [0.0, 0.0, 2.0]
+
+
+def test_negative_balance_is_paid_back_before_new_requests(clock):
+    bucket = ratelimit.TokenBucket(rate=1, burst=1)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 1.0, 2.0, 3.0]
+    clock.now += 2
+    assert bucket.reserve() == 2.0
+
+
+def test_hosts_of_a_store_share_one_bucket(clock):
+    limiter = ratelimit.HostRateLimiter(limits={"amazon": {"rate": 1, "burst": 1}})
+    assert limiter.reserve("https://www.amazon.in/dp/B0CHX1W1XY") == 0.0
+    assert limiter.reserve("https://amazon.in/dp/B0CHX1W1XY") == 1.0
+    assert limiter.reserve("https://m.amazon.in/dp/B0CHX1W1XY") == 2.0
+    # Unknown hosts are paced on their own
+    assert limiter.reserve("https://www.example.com/p/1") == 0.0
+    assert set(limiter.get_stats()) == {"amazon", "www.example.com"}
+    assert limiter.get_stats()["amazon"]["waited"] == 2
+
+
+def test_sqlite_buckets_are_shared_between_connections(tmp_path, clock):
+    path = str(tmp_path / "buckets.db")
+    first = ratelimit.SQLiteBucketStore(path)
+    second = ratelimit.SQLiteBucketStore(path)
+    assert first.reserve("amazon", 0.5, 2) == 0.0
+    assert second.reserve("amazon", 0.5, 2) == 0.0
+    assert first.reserve("amazon", 0.5, 2) == 2.0
+    assert second.reserve("amazon", 0.5, 2) == 4.0
+    assert second.reserve("flipkart", 0.5, 2) == 0.0
+    # Four seconds pay back the two borrowed tokens, not the next one
+    clock.now += 4
+    assert first.reserve("amazon", 0.5, 2) == 2.0
+
+    limiters = [ratelimit.HostRateLimiter(limits={"flipkart": {"rate": 1, "burst": 1}}, db_path=path)
+                for _ in range(2)]
+    clock.now += 100
+    assert limiters[0].reserve("https://www.flipkart.com/p/itm1") == 0.0
+    assert limiters[1].reserve("https://dl.flipkart.com/dl/p/itm1") == 1.0
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive check scheduler and the check work queue, on a
+temporary database:
+
+    python -m pytest test_scheduler.py
+"""
+import os
+import threading
+import time
+import types
+
+import pytest
+
+import db
+import scheduler
+import scraper
+import tracker
+
+
+def test_interval_shrinks_on_change_and_grows_when_flat():
+    assert scheduler.next_interval(3600, changed=True) == 1800
+    assert scheduler.next_interval(3600, changed=False) == 4500
+    assert scheduler.next_interval(None, changed=False) == int(scheduler.DEFAULT_CHECK_INTERVAL * 1.25)
+
+
+def test_interval_is_bounded():
+    assert scheduler.next_interval(scheduler.MIN_CHECK_INTERVAL, changed=True) == scheduler.MIN_CHECK_INTERVAL
+    assert scheduler.next_interval(scheduler.MAX_CHECK_INTERVAL, changed=False) == scheduler.MAX_CHECK_INTERVAL
+    assert scheduler.next_interval(scheduler.MAX_CHECK_INTERVAL, changed=False,
+                                   near_target=True) == scheduler.NEAR_TARGET_INTERVAL
+
+
+def test_near_target():
+    assert scheduler.is_near_target(1020, 1000)
+    assert scheduler.is_near_target(990, "1000")
+    assert not scheduler.is_near_target(1200, 1000)
+    assert not scheduler.is_near_target(1000, None)
+
+
+def test_new_products_are_due_and_checks_push_them_back(temp_db, monkeypatch):
+    product_id = db.add_product("Phone", "amazon", "https://www.amazon.in/dp/B0TEST")
+    assert [p["id"] for p in db.get_due_products(10)] == [product_id]
+
+    prices = iter([1000, 1000, 900])
+    monkeypatch.setattr(tracker, "get_product_snapshot", lambda url, store, **kwargs: {
+        "price": next(prices), "unchanged": False, "etag": None,
+        "last_modified": None, "content_hash": None,
+    })
+
+    tracker.check_product(db.get_product(product_id))
+    product = db.get_product(product_id)
+    assert product["check_interval"] == int(scheduler.DEFAULT_CHECK_INTERVAL * 1.25)
+    assert db.get_due_products(10) == []
+    assert db.seconds_until_next_check() > 0
+
+    tracker.check_product(db.get_product(product_id))
+    flat_interval = db.get_product(product_id)["check_interval"]
+    assert flat_interval > product["check_interval"]
+
+    tracker.check_product(db.get_product(product_id))
+    assert db.get_product(product_id)["check_interval"] == flat_interval // 2
+
+
+def test_unscheduled_products_are_spread(temp_db):
+    with db.get_connection() as conn:
+        conn.executemany("INSERT INTO products (name, store, url) VALUES (?, ?, ?)",
+                         [(f"p{i}", "amazon", f"https://www.amazon.in/dp/B{i}") for i in range(50)])
+        conn.commit()
+    assert db.schedule_new_products(600) == 50
+    with db.get_connection() as conn:
+        times = {row[0] for row in conn.execute("SELECT next_check_at FROM products")}
+    assert len(times) > 10
+
+
+def test_workers_lease_disjoint_batches(temp_db):
+    for i in range(5):
+        db.add_product(f"p{i}", "amazon", f"https://www.amazon.in/dp/B{i}")
+    assert db.enqueue_due_checks(3, 600) == 5
+    # Already queued products are not queued twice
+    assert db.enqueue_due_checks(3, 600) == 0
+
+    first = {p["id"] for p in db.claim_check_jobs("worker-a", 3, 60, 3)}
+    second = {p["id"] for p in db.claim_check_jobs("worker-b", 3, 60, 3)}
+    assert len(first) == 3 and len(second) == 2
+    assert not first & second
+    assert db.claim_check_jobs("worker-c", 3, 60, 3) == []
+
+    product_id = next(iter(first))
+    assert not db.complete_check_job("worker-b", product_id)
+    assert db.complete_check_job("worker-a", product_id)
+    assert db.get_queue_stats() == {"pending": 0, "leased": 4, "expired": 0}
+
+
+def test_expired_leases_are_reclaimed(temp_db):
+    product_id = db.add_product("p", "amazon", "https://www.amazon.in/dp/B1")
+    db.enqueue_due_checks(2, 600)
+    assert [p["id"] for p in db.claim_check_jobs("crashed", 10, -1, 2)] == [product_id]
+    assert db.get_queue_stats()["expired"] == 1
+
+    assert [p["id"] for p in db.claim_check_jobs("survivor", 10, -1, 2)] == [product_id]
+    # A crashed worker's heartbeat no longer extends the lease
+    assert db.heartbeat_check_jobs("crashed", [product_id], 60) == 0
+
+    # Leased and expired twice: dropped and rescheduled instead
+    assert db.claim_check_jobs("third", 10, 60, 2) == []
+    db.enqueue_due_checks(2, 600)
+    assert db.get_queue_stats() == {"pending": 0, "leased": 0, "expired": 0}
+    assert db.get_due_products(10) == []
+
+
+def test_run_due_checks_completes_jobs(temp_db, monkeypatch):
+    for i in range(4):
+        db.add_product(f"p{i}", "amazon", f"https://www.amazon.in/dp/B{i}")
+    monkeypatch.setattr(tracker, "get_product_snapshot", lambda url, store, **kwargs: {
+        "price": 100, "unchanged": False, "etag": None, "last_modified": None, "content_hash": None,
+    })
+    summary = tracker.run_due_checks(limit=3, worker_id="w")
+    assert summary["checked"] == 3
+    assert db.get_queue_stats() == {"pending": 1, "leased": 0, "expired": 0}
+    assert tracker.run_due_checks(worker_id="w")["checked"] == 1
+    assert tracker.run_due_checks(worker_id="w")["checked"] == 0
+
+
+def test_checks_complete_their_jobs_with_the_price(temp_db, monkeypatch):
+    ids = [db.add_product(f"p{i}", "amazon", f"https://www.amazon.in/dp/B{i}") for i in range(3)]
+    db.enqueue_due_checks(3, 600)
+    products = db.claim_check_jobs("w", 10, 60, 3)
+    monkeypatch.setattr(tracker, "get_product_snapshot", lambda url, store, **kwargs: {
+        "price": 100, "unchanged": False, "etag": None, "last_modified": None, "content_hash": None,
+    })
+
+    writer = db.PriceWriter(batch_size=1000, flush_seconds=3600)
+    for product in products:
+        tracker.check_product(product, writer, worker_id="w")
+    # Nothing is written, or marked done, before the flush
+    assert db.get_queue_stats()["leased"] == 3
+    assert [p["id"] for p in db.get_due_products(10)] == ids
+
+    writer.flush()
+    assert writer.flushes == 1
+    assert db.get_queue_stats() == {"pending": 0, "leased": 0, "expired": 0}
+    assert db.get_due_products(10) == []
+    assert all(db.get_product(i)["check_interval"] for i in ids)
+
+
+def test_checks_skip_pages_with_an_unchanged_price_region(temp_db, monkeypatch):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "amazon_product.html"),
+              encoding="utf-8") as f:
+        html = f.read()
+    pages = [html, html.replace("Reviewed in India", "Reviewed in India (edited)"), html.replace("17,999", "16,999")]
+    monkeypatch.setattr(scraper, "STREAMING_ENABLED", False)
+    monkeypatch.setattr(scraper.rate_limiter, "acquire", lambda url: 0)
+    monkeypatch.setattr(scraper.session_pool, "get", lambda key, url: types.SimpleNamespace(
+        get=lambda *args, **kwargs: types.SimpleNamespace(status_code=200, text=pages.pop(0), headers={})))
+    # One check per minute, so no two prices share a timestamp
+    minutes = iter(range(60))
+    monkeypatch.setattr(db, "utc_timestamp", lambda: f"2024-01-01 10:{next(minutes):02d}:00")
+    product_id = db.add_product("Phone", "amazon", "https://www.amazon.in/dp/B0TEST")
+
+    results = [tracker.check_product(db.get_product(product_id)) for _ in range(3)]
+    assert [(r["price"], r["unchanged"]) for r in results] == [(17999, False), (None, True), (16999, False)]
+    # The unchanged check still extends the current interval
+    assert [tuple(r) for r in db.get_price_history(product_id)] == \
+        [(17999, "2024-01-01 10:00:00"), (17999, "2024-01-01 10:01:00"), (16999, "2024-01-01 10:03:00")]
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT observations FROM price_intervals ORDER BY first_seen").fetchone()[0] == 2
+    assert db.get_product(product_id)["content_hash"] is not None
+
+
+def test_store_caps_hold_and_a_slow_store_does_not_block_others(monkeypatch):
+    products = [{"id": i, "store": "amazon"} for i in range(4)] + \
+               [{"id": i, "store": "Flipkart"} for i in range(4, 10)]
+    lock = threading.Lock()
+    in_flight = {"amazon": 0, "flipkart": 0}
+    peak = dict(in_flight)
+    fast_done = []
+    slow_store_released = threading.Event()
+    # Flipkart checks finish in pairs, so both of its slots are used
+    pairs = threading.Barrier(2, timeout=5)
+    waits = []
+
+    def check(p, writer=None, worker_id=None):
+        store = p["store"].lower()
+        with lock:
+            in_flight[store] += 1
+            peak[store] = max(peak[store], in_flight[store])
+        if store == "amazon":
+            # Held until every flipkart product is done
+            waits.append(slow_store_released.wait(5))
+        else:
+            pairs.wait()
+        with lock:
+            in_flight[store] -= 1
+            if store == "flipkart":
+                fast_done.append(p["id"])
+                if len(fast_done) == 6:
+                    slow_store_released.set()
+        return {"product_id": p["id"], "error": None, "unchanged": False}
+
+    monkeypatch.setattr(tracker, "check_product", check)
+    summary = tracker.run_price_check(products, max_workers=4, store_limits={"amazon": 2, "flipkart": 2})
+    assert summary["checked"] == 10
+    assert peak == {"amazon": 2, "flipkart": 2}
+    # No amazon check timed out waiting, so flipkart kept going meanwhile
+    assert waits == [True] * 4
+
+
+def test_concurrent_refreshes_share_one_check(temp_db, monkeypatch):
+    product_id = db.add_product("p", "amazon", "https://www.amazon.in/dp/B1")
+    release = threading.Event()
+    calls = []
+
+    def snapshot(url, store, **kwargs):
+        calls.append(url)
+        release.wait(5)
+        return {"price": 100, "unchanged": False, "etag": None, "last_modified": None, "content_hash": None}
+
+    monkeypatch.setattr(tracker, "get_product_snapshot", snapshot)
+    futures = [tracker.refresh_product_async(product_id) for _ in range(5)]
+    assert len(set(futures)) == 1
+    assert tracker.is_refreshing(product_id)
+    release.set()
+    assert futures[0].result(5)["price"] == 100
+    assert len(calls) == 1
+    assert not tracker.is_refreshing(product_id)
+    assert db.get_queue_stats() == {"pending": 0, "leased": 0, "expired": 0}
+
+
+def test_refresh_skips_products_leased_by_another_worker(temp_db, monkeypatch):
+    product_id = db.add_product("p", "amazon", "https://www.amazon.in/dp/B1")
+    monkeypatch.setattr(tracker, "get_product_snapshot", lambda *a, **k: pytest.fail("checked twice"))
+    assert db.lease_product_check("other-worker", product_id, 60)
+    assert tracker.is_refreshing(product_id)
+    assert tracker.refresh_product_async(product_id).result(5) is None
+    assert not db.lease_product_check("third-worker", product_id, 60)
+
+
+def test_on_demand_checks_skip_products_leased_by_another_worker(temp_db, monkeypatch):
+    free = db.add_product("free", "amazon", "https://www.amazon.in/dp/B1")
+    busy = db.add_product("busy", "amazon", "https://www.amazon.in/dp/B2")
+    checked = []
+
+    def snapshot(url, store, **kwargs):
+        checked.append(url)
+        return {"price": 100, "unchanged": False, "etag": None, "last_modified": None, "content_hash": None}
+
+    monkeypatch.setattr(tracker, "get_product_snapshot", snapshot)
+    assert db.lease_product_check("other-worker", busy, 60)
+    summary = tracker.run_leased_check(worker_id="app:job")
+    assert (summary["checked"], summary["skipped"]) == (1, 1)
+    assert checked == ["https://www.amazon.in/dp/B1"]
+    # Its own lease is released with the price, the other worker's is kept
+    assert db.get_queue_stats() == {"pending": 0, "leased": 1, "expired": 0}
+    assert db.lease_product_check("third-worker", free, 60)
+
+
+def test_leases_are_held_until_their_jobs_are_flushed(temp_db, monkeypatch):
+    fast = db.add_product("fast", "amazon", "https://www.amazon.in/dp/B1")
+    db.add_product("slow", "amazon", "https://www.amazon.in/dp/B2")
+    monkeypatch.setattr(tracker, "JOB_LEASE_SECONDS", 0.5)
+    monkeypatch.setattr(tracker, "JOB_HEARTBEAT_SECONDS", 0.1)
+    fast_done = threading.Event()
+    claimed = []
+
+    def snapshot(url, store, **kwargs):
+        if url.endswith("B2"):
+            # The fast product's job waits for the next flush meanwhile
+            fast_done.wait(5)
+            time.sleep(1)
+            claimed.append(db.lease_product_check("other-worker", fast, 60))
+        return {"price": 100, "unchanged": False, "etag": None, "last_modified": None, "content_hash": None}
+
+    monkeypatch.setattr(tracker, "get_product_snapshot", snapshot)
+    summary = tracker.run_leased_check(
+        worker_id="app:job", on_result=lambda r: r["product_id"] == fast and fast_done.set())
+    assert summary["checked"] == 2
+    assert claimed == [False]
+    assert db.get_queue_stats() == {"pending": 0, "leased": 0, "expired": 0}
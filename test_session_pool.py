@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent session pool, with a fake clock and no network:
+
+    python -m pytest test_session_pool.py
+"""
+import types
+
+import pytest
+
+import session_pool
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_pool.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def seeds():
+    return []
+
+
+@pytest.fixture
+def pool(seeds):
+    def seed(session, url):
+        seeds.append(url)
+        session.cookies.set("identity", str(len(seeds)))
+
+    pool = session_pool.SessionPool(seed, identity_max_age=60, identity_max_requests=3)
+    yield pool
+    pool.close()
+
+
+def test_sessions_are_reused_per_key(clock, pool, seeds):
+    session = pool.get("amazon", "https://www.amazon.in/dp/A")
+    assert pool.get("amazon", "https://www.amazon.in/dp/B") is session
+    assert pool.get("flipkart", "https://www.flipkart.com/p/itm1") is not session
+    assert len(seeds) == 2
+
+
+def test_identity_rotates_after_max_requests(clock, pool, seeds):
+    session = pool.get("amazon", "https://www.amazon.in/dp/A")
+    pool.get("amazon", "https://www.amazon.in/dp/A")
+    pool.get("amazon", "https://www.amazon.in/dp/A")
+    assert session.cookies["identity"] == "1"
+    # The fourth request gets a new identity on the same session
+    assert pool.get("amazon", "https://www.amazon.in/dp/A") is session
+    assert session.cookies["identity"] == "2"
+    assert pool.entries["amazon"]["identity_requests"] == 1
+
+
+def test_identity_rotates_after_max_age(clock, pool, seeds):
+    session = pool.get("amazon", "https://www.amazon.in/dp/A")
+    clock.now += 60
+    pool.get("amazon", "https://www.amazon.in/dp/A")
+    assert len(seeds) == 1
+    clock.now += 1
+    pool.get("amazon", "https://www.amazon.in/dp/A")
+    assert len(seeds) == 2 and session.cookies["identity"] == "2"
+    assert pool.get_stats()["amazon"]["identity_rotations"] == 1
+
+
+def test_forced_rotation_keeps_the_connections(clock, pool, seeds):
+    session = pool.get("amazon", "https://www.amazon.in/dp/A")
+    adapter = session.get_adapter("https://www.amazon.in/")
+    pool.rotate("amazon", "https://www.amazon.in/dp/A")
+    pool.rotate("unknown", "https://www.example.com/")
+    assert session.cookies["identity"] == "2"
+    assert session.get_adapter("https://www.amazon.in/") is adapter
+    assert len(seeds) == 2
+
+
+def test_stats_report_connection_reuse(clock, pool):
+    session = pool.get("amazon", "https://www.amazon.in/dp/A")
+    pools = {"www.amazon.in": types.SimpleNamespace(num_connections=2, num_requests=10),
+             "m.media-amazon.com": types.SimpleNamespace(num_connections=1, num_requests=2)}
+    adapter = types.SimpleNamespace(poolmanager=types.SimpleNamespace(pools=pools), close=lambda: None)
+    # Mounted for both schemes, as the pool does, but counted once
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    pool.get("amazon", "https://www.amazon.in/dp/A")
+    pool.get("flipkart", "https://www.flipkart.com/p/itm1")
+
+    stats = pool.get_stats()
+    assert stats["amazon"] == {"requests": 2, "http_requests": 12, "connections": 3,
+                               "reuse_rate": 0.75, "identity_rotations": 0}
+    assert stats["flipkart"]["reuse_rate"] == 0.0
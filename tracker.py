@@ -1,48 +1,387 @@
-from db import get_all_products, add_price
-from scraper import get_price, ScraperError
+import argparse
+import os
+import socket
+import threading
+import time
+import concurrent.futures
+from collections import deque
 
+from db import (
+    get_all_products, get_latest_price, PriceWriter,
+    schedule_new_products, enqueue_due_checks, claim_check_jobs,
+    heartbeat_check_jobs, complete_check_job, get_queue_stats,
+    claim_maintenance, apply_retention, get_product, lease_product_check,
+    is_check_leased,
+)
+from parsers import get_parser_stats
+from scheduler import (
+    reschedule, SCHEDULER_BATCH_SIZE, SCHEDULER_POLL_SECONDS, SCHEDULE_SPREAD,
+    ERROR_RETRY_INTERVAL,
+)
+from scraper import get_product_snapshot, get_session_stats, ScraperError
+from stores import store_of
 
-def run_price_check():
-    products = get_all_products()
+# Concurrency settings for a price check round.
+# Products are checked in parallel, but every store has its own cap on
+# requests in flight, so a round scales with the number of stores rather
+# than the number of products. Request pacing per store is handled by the
+# shared rate limiter in ratelimit.py.
+MAX_CONCURRENT_CHECKS = 8
+STORE_CONCURRENCY = {
+    "amazon": 2,
+    "flipkart": 2,
+    "myntra": 2,
+}
+DEFAULT_STORE_CONCURRENCY = 1
+
+# Work queue settings (check_jobs table).
+# Any number of workers - the web app's background thread and
+# `python tracker.py --worker` processes on any host sharing the database -
+# lease disjoint batches of due products. A worker renews its leases every
+# JOB_HEARTBEAT_SECONDS; leases of a crashed worker expire after
+# JOB_LEASE_SECONDS and the jobs go to another worker, at most
+# MAX_JOB_ATTEMPTS times.
+JOB_LEASE_SECONDS = 120
+JOB_HEARTBEAT_SECONDS = 30
+MAX_JOB_ATTEMPTS = 3
+
+# Seconds between retention runs (db.apply_retention), shared by all workers
+RETENTION_INTERVAL = 10 * 60
+
+# On-demand refreshes of single products (refresh_product_async), e.g. for
+# a product page showing a stale price
+REFRESH_WORKERS = 4
+_refresh_executor = concurrent.futures.ThreadPoolExecutor(REFRESH_WORKERS, thread_name_prefix="refresh")
+_refreshing = {}
+_refreshing_lock = threading.Lock()
+
+
+def _field(p, name):
+    # Product rows may come from older callers without the newer columns
+    return p[name] if name in p.keys() else None
+
+
+def check_product(p, writer=None, worker_id=None):
+    """
+    Fetch the current price of a single product, record it and schedule
+    the product's next check. With a `worker_id`, the product's check job
+    leased to that worker is completed as well. All of it is buffered in
+    `writer` (a db.PriceWriter shared by a whole round) and written in one
+    transaction; without one it is written before returning.
+    """
+    if writer is None:
+        with PriceWriter() as writer:
+            return check_product(p, writer, worker_id)
+
+    product_id = p["id"]
+    name = p["name"]
+    store = p["store"]
+    url = p["url"]
+    target_price = p["target_price"]
+
+    result = {"product_id": product_id, "name": name, "store": store, "price": None,
+              "unchanged": False, "error": None}
+
+    print(f"\nChecking: {name} [{store}]")
+    print(f"URL: {url}")
+
+    previous_price = get_latest_price(product_id)
+    try:
+        validators = {"etag": _field(p, "etag"), "last_modified": _field(p, "last_modified")}
+        snapshot = get_product_snapshot(url, store, validators=validators,
+                                        last_hash=_field(p, "content_hash"))
+        if snapshot["unchanged"]:
+            # Same page as last time: skip parsing, only extend the current price
+            print("Page unchanged since last check")
+            writer.extend_price(product_id, previous_price)
+            writer.save_validators(product_id, snapshot["etag"], snapshot["last_modified"],
+                                   snapshot["content_hash"], checked=True)
+            result["unchanged"] = True
+            _finish(p, result, previous_price, writer, worker_id)
+            return result
+
+        current_price = snapshot["price"]   # <--- REAL PRICE HERE
+        print(f"Current price: {current_price}")
+        writer.add_price(product_id, current_price)
+        writer.save_validators(product_id, snapshot["etag"], snapshot["last_modified"],
+                               snapshot["content_hash"])
+        result["price"] = current_price
+
+        # Convert target_price to float for comparison
+        if target_price is not None and str(target_price).strip():
+            try:
+                target_price_float = float(target_price)
+                if current_price <= target_price_float:
+                    print("⚠ ALERT: Price dropped below target price!")
+                    print(f"   Target Price : {target_price_float}")
+                    print(f"   Current Price: {current_price}")
+            except (ValueError, TypeError):
+                print(f"Warning: Invalid target price '{target_price}' for {name}")
+
+    except ScraperError as e:
+        print(f"Error for {name}: {e}")
+        result["error"] = str(e)
+    except Exception as e:
+        print(f"Unexpected error for {name}: {e}")
+        result["error"] = str(e)
+
+    _finish(p, result, previous_price, writer, worker_id)
+    return result
+
+
+def _finish(p, result, previous_price, writer, worker_id):
+    try:
+        reschedule(p, result, previous_price, writer)
+    except Exception as e:
+        print(f"Could not schedule next check for {p['name']}: {e}")
+    if worker_id:
+        writer.complete_job(worker_id, p["id"])
+
+
+def run_price_check(products=None, max_workers=None, store_limits=None, on_result=None, worker_id=None):
+    """
+    Check prices for all active products (or the given list) concurrently.
+    With a `worker_id`, the check jobs it leased for the products are
+    completed along with their prices (see check_product).
+
+    Work is dispatched per store: a product is only submitted to the pool
+    once its store has a free slot, so slow stores never tie up workers
+    that other stores could use. `on_result` is called with each result as
+    soon as its check finishes.
+
+    Prices are written in batches through one shared PriceWriter, which
+    is flushed before returning.
+
+    Returns a summary dict with 'checked', 'failed', 'unchanged' (checks
+    short-circuited because the page hadn't changed) and 'results'.
+    """
+    if products is None:
+        products = get_all_products()
     if not products:
         print("No products found. Add products first from the web app.")
-        return
+        return {"checked": 0, "failed": 0, "unchanged": 0, "results": []}
 
+    max_workers = max_workers or MAX_CONCURRENT_CHECKS
+    limits = dict(STORE_CONCURRENCY)
+    if store_limits:
+        limits.update(store_limits)
+
+    # Queue products per store, preserving their original order
+    pending = {}
     for p in products:
-        product_id = p["id"]
-        name = p["name"]
-        store = p["store"]
-        url = p["url"]
-        target_price = p["target_price"]
+        pending.setdefault(store_of(p["store"]) or (p["store"] or "").lower(), deque()).append(p)
+    in_flight = {key: 0 for key in pending}
+
+    results = []
+    started = time.time()
+    writer = PriceWriter()
+    with writer, concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_store = {}
+
+        def dispatch():
+            # Round-robin over stores so each one gets its share of workers
+            progress = True
+            while progress and len(future_to_store) < max_workers:
+                progress = False
+                for key, queue in pending.items():
+                    if not queue or len(future_to_store) >= max_workers:
+                        continue
+                    if in_flight[key] >= max(1, limits.get(key, DEFAULT_STORE_CONCURRENCY)):
+                        continue
+                    future = executor.submit(check_product, queue.popleft(), writer, worker_id)
+                    future_to_store[future] = key
+                    in_flight[key] += 1
+                    progress = True
 
-        print(f"\nChecking: {name} [{store}]")
-        print(f"URL: {url}")
+        dispatch()
+        while future_to_store:
+            done, _ = concurrent.futures.wait(
+                future_to_store, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                key = future_to_store.pop(future)
+                in_flight[key] -= 1
+                result = future.result()
+                results.append(result)
+                if on_result:
+                    on_result(result)
+            dispatch()
 
+    failed = sum(1 for r in results if r["error"])
+    unchanged = sum(1 for r in results if r["unchanged"])
+    elapsed = time.time() - started
+    print(f"\nPrice check finished: {len(results)} products, {unchanged} unchanged, "
+          f"{failed} failed, {elapsed:.1f}s")
+    print(f"  {writer.rows_written} prices written in {writer.flushes} transactions")
+    for key, stats in get_session_stats().items():
+        print(f"  {key}: {stats['http_requests']} requests over {stats['connections']} connections "
+              f"(reuse rate {stats['reuse_rate']:.0%})")
+    for engine, stats in get_parser_stats().items():
+        print(f"  parser {engine}: {stats['parses']} pages, avg {stats['avg_ms']} ms")
+    return {"checked": len(results), "failed": failed, "unchanged": unchanged, "results": results}
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_due_checks(limit=None, worker_id=None):
+    """
+    Check products whose scheduled check is due, through the shared work
+    queue: due products are queued, then up to `limit` (default
+    SCHEDULER_BATCH_SIZE) jobs are leased to this worker, checked, and
+    removed from the queue in the same transactions as their prices.
+    Leases are renewed in the background while the batch runs.
+    """
+    worker_id = worker_id or default_worker_id()
+    schedule_new_products(SCHEDULE_SPREAD)
+    enqueue_due_checks(MAX_JOB_ATTEMPTS, ERROR_RETRY_INTERVAL)
+    products = claim_check_jobs(worker_id, limit or SCHEDULER_BATCH_SIZE,
+                                JOB_LEASE_SECONDS, MAX_JOB_ATTEMPTS)
+    if not products:
+        return {"checked": 0, "failed": 0, "unchanged": 0, "results": []}
+    return _run_leased(products, worker_id)
+
+
+def run_leased_check(products=None, worker_id=None, on_result=None):
+    """
+    Check all active products (or the given list) on demand, through the
+    same leases as the work queue: each product is leased to this worker
+    first, and products another worker is checking right now are skipped,
+    so a product is never checked twice at once. The summary also has
+    'skipped', the number of products left to the other workers.
+    """
+    worker_id = worker_id or f"{default_worker_id()}:check"
+    if products is None:
+        products = get_all_products()
+    leased = [p for p in products if lease_product_check(worker_id, p["id"], JOB_LEASE_SECONDS)]
+    skipped = len(products) - len(leased)
+    if skipped:
+        print(f"Skipping {skipped} products another worker is checking.")
+    if not leased:
+        return {"checked": 0, "failed": 0, "unchanged": 0, "skipped": skipped, "results": []}
+    summary = _run_leased(leased, worker_id, on_result)
+    summary["skipped"] = skipped
+    return summary
+
+
+def _run_leased(products, worker_id, on_result=None):
+    """Check products leased to `worker_id`, renewing the leases in the background."""
+    product_ids = [p["id"] for p in products]
+    finished = threading.Event()
+
+    def heartbeat():
+        while not finished.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                heartbeat_check_jobs(worker_id, product_ids, JOB_LEASE_SECONDS)
+            except Exception as e:
+                print(f"Lease heartbeat failed: {e}")
+
+    # Leases are renewed until the run's writer is closed: a job is only
+    # removed with a flush, and a lease lapsing before that would let
+    # another worker claim a product that has already been checked. Jobs
+    # already removed just make their renewals no-ops.
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    try:
+        return run_price_check(products, on_result=on_result, worker_id=worker_id)
+    finally:
+        finished.set()
+        heartbeat_thread.join()
+
+
+def refresh_product_async(product_id):
+    """
+    Check a product in the background, unless a check of it is already
+    running - here or, through the work queue lease, in any other worker.
+    Concurrent calls share one check. Returns its Future (result as
+    check_product's, or None if another worker has the product).
+    """
+    with _refreshing_lock:
+        future = _refreshing.get(product_id)
+        if future is None:
+            future = _refreshing[product_id] = _refresh_executor.submit(_refresh_product, product_id)
+        return future
+
+
+def is_refreshing(product_id):
+    """True while a check of the product runs, in this process or another worker."""
+    with _refreshing_lock:
+        if product_id in _refreshing:
+            return True
+    return is_check_leased(product_id)
+
+
+def _refresh_product(product_id):
+    worker_id = f"{default_worker_id()}:refresh"
+    try:
+        if not lease_product_check(worker_id, product_id, JOB_LEASE_SECONDS):
+            return None
+        product = get_product(product_id)
+        if product is None:
+            complete_check_job(worker_id, product_id)
+            return None
+        return check_product(product, worker_id=worker_id)
+    except Exception as e:
+        print(f"Error refreshing product {product_id}: {e}")
+        return None
+    finally:
+        with _refreshing_lock:
+            _refreshing.pop(product_id, None)
+
+
+def run_maintenance():
+    """
+    Apply the history retention policy if no worker has done so in the
+    last RETENTION_INTERVAL seconds. Each run is bounded (see
+    db.apply_retention); whatever is left waits for the next one.
+    """
+    if not claim_maintenance("retention", RETENTION_INTERVAL):
+        return None
+    summary = apply_retention()
+    trimmed = {table: rows for table, rows in summary.items() if table != "done" and rows}
+    if trimmed:
+        print(f"Retention: {trimmed}{'' if summary['done'] else ' (more left)'}")
+    return summary
+
+
+def run_worker(worker_id=None, batch_size=None, once=False):
+    """
+    Keep leasing and checking due products until interrupted (or until the
+    queue is empty, with once=True).
+    """
+    worker_id = worker_id or default_worker_id()
+    print(f"Tracker worker {worker_id} started.")
+    while True:
+        try:
+            summary = run_due_checks(batch_size, worker_id)
+        except Exception as e:
+            print(f"Error in worker round: {e}")
+            summary = {"checked": 0}
+        if summary["checked"]:
+            print(f"Queue: {get_queue_stats()}")
+            continue
+        if once:
+            return
         try:
-            current_price = get_price(url, store)   # <--- REAL PRICE HERE
-            print(f"Current price: {current_price}")
-            add_price(product_id, current_price)
-
-            # Convert target_price to float for comparison
-            if target_price is not None and str(target_price).strip():
-                try:
-                    target_price_float = float(target_price)
-                    if current_price <= target_price_float:
-                        print("⚠ ALERT: Price dropped below target price!")
-                        print(f"   Target Price : {target_price_float}")
-                        print(f"   Current Price: {current_price}")
-                except (ValueError, TypeError):
-                    print(f"Warning: Invalid target price '{target_price}' for {name}")
-
-        except ScraperError as e:
-            print(f"Error for {name}: {e}")
+            run_maintenance()
         except Exception as e:
-            print(f"Unexpected error for {name}: {e}")
-        
-        # Add delay between requests to avoid overwhelming servers
-        import time
-        time.sleep(2)
+            print(f"Error in maintenance: {e}")
+        time.sleep(SCHEDULER_POLL_SECONDS)
 
 
 if __name__ == "__main__":
-    run_price_check()
+    parser = argparse.ArgumentParser(description="Check product prices.")
+    parser.add_argument("--worker", action="store_true",
+                        help="run as a queue worker checking due products until interrupted")
+    parser.add_argument("--once", action="store_true", help="with --worker, stop once no product is due")
+    parser.add_argument("--batch", type=int, help="products leased per batch")
+    args = parser.parse_args()
+
+    if args.worker:
+        try:
+            run_worker(batch_size=args.batch, once=args.once)
+        except KeyboardInterrupt:
+            print("Worker stopped.")
+    else:
+        run_leased_check()